@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark of the location of the variants left after the join with the
+structures, done in mapper.mapper.map_positions.
+
+Compares the cross join of the variants with the alignment ranges of
+every structure of the protein (the previous approach) with
+mapper.mapper.covered_positions (binary search in the sorted union of
+the ranges), on a synthetic protein of the size of TTN with hundreds of
+templates.
+
+Usage:
+    python benchmarks/bench_covered_positions.py --variants 50000 --structures 300
+'''
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from mapper.mapper import covered_positions  # noqa: E402
+
+prot_id = 'ENSP00000467141'
+length = 34350
+
+
+def synthetic(n_variants, n_structures, seed=0):
+    rng = np.random.default_rng(seed)
+    annovars = pd.DataFrame({
+        'Uploaded_variation': np.char.add('2_', np.arange(n_variants).astype(str)),
+        'Protein_position': rng.integers(1, length, n_variants).astype(str),
+        'Protein_accession': prot_id})
+    start = rng.integers(1, length - 300, n_structures)
+    psdf = pd.DataFrame({
+        'Protein_accession': prot_id,
+        'PDB_code': np.char.add('t', np.arange(n_structures).astype(str)),
+        'Protein_alignment_start': start,
+        'Protein_alignment_end': start + rng.integers(30, 300, n_structures)})
+    return annovars, psdf
+
+
+def cross_join(annovars, psdf):
+    ranges = psdf[['Protein_accession', 'Protein_alignment_start',
+                   'Protein_alignment_end']].drop_duplicates()
+    df = annovars.reset_index().join(ranges.set_index('Protein_accession'),
+                                     on='Protein_accession', how='inner')
+    pos = pd.to_numeric(df['Protein_position'], errors='coerce')
+    inside = (pos >= df['Protein_alignment_start']) & \
+        (pos <= df['Protein_alignment_end'])
+    covered = np.zeros(len(annovars), dtype=bool)
+    covered[df.loc[inside.values, 'index'].unique()] = True
+    return covered, df.memory_usage(deep=True).sum()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--variants', type=int, default=50000)
+    parser.add_argument('--structures', type=int, default=300)
+    args = parser.parse_args()
+
+    annovars, psdf = synthetic(args.variants, args.structures)
+    start = time.perf_counter()
+    old, size = cross_join(annovars, psdf)
+    t_old = time.perf_counter() - start
+    start = time.perf_counter()
+    new = covered_positions(annovars, psdf)
+    t_new = time.perf_counter() - start
+    print('{:,} variants, {:,} structures'.format(args.variants, args.structures))
+    print('  cross join:       {:.3f} s, {:,.0f} MB joined'.format(t_old, size / 1e6))
+    print('  sorted intervals: {:.3f} s, {:.0f}x faster, same result: {}'.format(
+        t_new, t_old / t_new, (old == new).all()))
+
+
+if __name__ == '__main__':
+    main()
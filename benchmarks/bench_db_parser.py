@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark of the parsing of the split database files done in
+mapper.db_parser.
+
+Compares the previous parsing (regex separator, python engine) with
+mapper.db_parser.read_file (fixed delimiter, C engine, declared dtypes)
+on a synthetic transcript file of the size of a large gene (TTN has
+more than 100,000 annotated variants in gnomAD) and on a protein
+structures file.
+
+Usage:
+    python benchmarks/bench_db_parser.py --variants 200000 --structures 5000
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from mapper.db_parser import read_file  # noqa: E402
+
+vep_cols = ['Uploaded_variation', 'Location', 'Allele', 'Gene', 'Feature',
+            'Feature_type', 'Consequence', 'cDNA_position', 'CDS_position',
+            'Protein_position', 'Amino_acids', 'Codons', 'Existing_variation']
+
+
+def synthetic_vep(fn, n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    pos = rng.integers(1, 35000, n_rows)
+    df = pd.DataFrame({
+        'Uploaded_variation': np.char.add('2_', np.arange(n_rows).astype(str)),
+        'Location': np.char.add('2:', (178525989 + pos * 3).astype(str)),
+        'Allele': rng.choice(list('ACGT'), n_rows),
+        'Gene': 'ENSG00000155657',
+        'Feature': 'ENST00000589042',
+        'Feature_type': 'Transcript',
+        'Consequence': rng.choice(['missense_variant', 'synonymous_variant',
+                                   'stop_gained', 'intron_variant'], n_rows),
+        'cDNA_position': (pos * 3).astype(str),
+        'CDS_position': (pos * 3).astype(str),
+        'Protein_position': pos.astype(str),
+        'Amino_acids': rng.choice(['A/V', 'R/H', 'L', '-'], n_rows),
+        'Codons': 'gCa/gTa',
+        'Existing_variation': np.where(rng.random(n_rows) < 0.5,
+                                       np.char.add('rs', pos.astype(str)), '-')})
+    df.to_csv(fn, sep='\t', index=False)
+
+
+def synthetic_psdb(fn, n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+
+    def packed(n):
+        return ['-'.join(map(str, rng.integers(1, 1000, 20))) for _ in range(n)]
+    df = pd.DataFrame({
+        'Protein_accession': 'ENSP00000467141', 'Protein_length': 34350,
+        'Protein_position': packed(n_rows), 'Protein_aa': packed(n_rows),
+        'PDB_code': rng.choice(['1tit', '2nzi', '3b43'], n_rows),
+        'PDB_chain': 'A', 'PDB_chain_length': 100,
+        'PDB_3D_position': packed(n_rows), 'PDB_seq_position': packed(n_rows),
+        'PDB_aa': packed(n_rows), 'Evalue': rng.random(n_rows),
+        'Pident': rng.integers(20, 100, n_rows), 'Protein_coverage': 0.9,
+        'Length_alignment': 100, 'Interaction_type': 'protein',
+        'PDB_interacting_chain': 'B',
+        'PDB_interacting_3D_position': packed(n_rows),
+        'PDB_interacting_aa': packed(n_rows),
+        'Interface_min_distance': packed(n_rows),
+        'PDB_B_factor': packed(n_rows), 'PDB_interacting_B_factor': packed(n_rows),
+        'Structure_feature_id': '1tit_ENSP00000467141_A_B_protein'})
+    df.to_csv(fn, sep='\t', index=False)
+
+
+def legacy_read(f):
+    try:
+        df = pd.read_csv(f, sep="\t| ", engine='python')
+    except:
+        df = pd.read_csv(f, sep=" ", engine='python')
+    return df
+
+
+def best_of(func, f, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = func(f)
+        times.append(time.perf_counter() - start)
+    return min(times), res
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--variants', type=int, default=200000)
+    parser.add_argument('--structures', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        files = [('VEP transcript file', os.path.join(d, 'ENST00000589042.vep'),
+                  synthetic_vep, args.variants),
+                 ('psdb protein file', os.path.join(d, 'ENSP00000467141.txt'),
+                  synthetic_psdb, args.structures)]
+        for name, fn, make, n in files:
+            make(fn, n)
+            size = os.path.getsize(fn) / 1e6
+            t_old, old = best_of(legacy_read, fn, args.repeat)
+            t_new, new = best_of(read_file, fn, args.repeat)
+            same = (old.astype(str).values == new.astype(str).values).all()
+            print('{} ({:,} rows, {:.1f} MB)'.format(name, n, size))
+            print('  python engine, regex sep: {:.3f} s'.format(t_old))
+            print('  C engine, dtypes:         {:.3f} s, {:.1f}x faster, same values: {}'.format(
+                t_new, t_old / t_new, same))
+
+
+if __name__ == '__main__':
+    main()
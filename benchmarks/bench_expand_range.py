@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark of the expansion of Protein_position ranges (e.g. '120-125')
+done in mapper.mapper.
+
+Compares the previous row-wise implementation (DataFrame.apply + explode2)
+with mapper.expand_range on a synthetic frame of variants.
+
+Usage:
+    python benchmarks/bench_expand_range.py --rows 1000000
+'''
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from mapper.expand_range import expand_range  # noqa: E402
+
+
+def synthetic_variants(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    start = rng.integers(1, 30000, n_rows)
+    length = rng.integers(1, 6, n_rows)
+    pos = np.char.add(np.char.add(start.astype(str), '-'),
+                      (start + length).astype(str))
+    # a few ranges with an unknown end
+    unknown = rng.random(n_rows) < 0.05
+    pos[unknown] = np.char.add(start[unknown].astype(str), '-?')
+    return pd.DataFrame({'Uploaded_variation': np.arange(n_rows).astype(str),
+                         'Consequence': 'frameshift_variant',
+                         'Protein_position': pos})
+
+
+def explode2(df, columns):
+    idx = np.repeat(df.index, df[columns[0]].str.len())
+    a = df.T.reindex(columns).values
+    concat = np.concatenate([np.concatenate(a[i]) for i in range(a.shape[0])])
+    p = pd.DataFrame(concat.reshape(a.shape[0], -1).T, idx, columns)
+    res = pd.concat([df.drop(columns, axis=1), p],
+                    axis=1).reset_index(drop=True)
+    return res
+
+
+def rowwise(sub_df):
+    sub_df = sub_df.copy()
+    sub_df[['start', 'end']] = sub_df['Protein_position'].str.split(
+        '-', expand=True)
+    sub_df['start'] = np.where(sub_df['start'] == '?', sub_df['end'],
+                               sub_df['start'])
+    sub_df['end'] = np.where(sub_df['end'] == '?', sub_df['start'],
+                             sub_df['end'])
+    sub_df['Protein_position'] = sub_df.apply(lambda x: list(
+        range(int(x['start']), int(x['end'])+1)), 1)
+    sub_df = explode2(sub_df, ['Protein_position'])
+    sub_df.drop(['start', 'end'], inplace=True, axis=1)
+    return sub_df
+
+
+def timeit(func, df):
+    start = time.perf_counter()
+    res = func(df)
+    return time.perf_counter() - start, res
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--skip-rowwise', action='store_true',
+                        help='only time the vectorized implementation')
+    args = parser.parse_args()
+
+    df = synthetic_variants(args.rows)
+    t_new, res_new = timeit(lambda d: expand_range(d, 'Protein_position'), df)
+    print('vectorized: {:.2f} s, {:,.0f} rows/s, {:,} output rows'.format(
+        t_new, args.rows / t_new, len(res_new)))
+    if not args.skip_rowwise:
+        t_old, res_old = timeit(rowwise, df)
+        print('row-wise:   {:.2f} s, {:,.0f} rows/s, {:,} output rows'.format(
+            t_old, args.rows / t_old, len(res_old)))
+        same = (res_old['Protein_position'].astype(int).to_numpy() ==
+                res_new['Protein_position'].to_numpy()).all()
+        print('speedup: {:.1f}x, same positions: {}'.format(t_old / t_new, same))
+
+
+if __name__ == '__main__':
+    main()
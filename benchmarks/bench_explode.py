@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark of the explode of dash-compacted protein structures files
+(mapper.explode.explode) against the previous implementations, explode
+and explode2.
+
+The synthetic psdb file has one row per interface, each with a list of
+interface residues packed in several dash-delimited columns.
+
+Usage:
+    python benchmarks/bench_explode.py --interfaces 5000 --residues 40
+'''
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from mapper.explode import explode  # noqa: E402
+
+packed_cols = ['Protein_position', 'PDB_3D_position', 'PDB_seq_position',
+               'PDB_aa', 'PDB_interacting_3D_position', 'PDB_interacting_aa',
+               'Interface_min_distance', 'PDB_B_factor']
+
+
+def synthetic_psdb(n_interfaces, n_residues, seed=0):
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(1, 2 * n_residues, n_interfaces)
+    df = pd.DataFrame({'Protein_accession': 'ENSP00000000001',
+                       'PDB_code': ['{}abc'.format(i % 10) for i in range(n_interfaces)],
+                       'PDB_chain': 'A',
+                       'Pident': rng.integers(20, 100, n_interfaces),
+                       'Interaction_type': 'protein'})
+    for col in packed_cols:
+        df[col] = ['-'.join(map(str, rng.integers(1, 1000, n))) for n in lengths]
+    df['Structure_feature_id'] = df['PDB_code'] + '_A_B_protein'
+    return df
+
+
+def legacy_explode(df, cols, split_on):
+    cols_sep = [x for x in list(df.columns) if x not in cols]
+    df_cols = df[cols_sep]
+    explode_len = df[cols[0]].str.split(split_on).map(len)
+    repeat_list = []
+    for r, e in zip(df_cols.values, explode_len):
+        repeat_list.extend([list(r)]*e)
+    df_repeat = pd.DataFrame(repeat_list, columns=cols_sep)
+    df_explode = pd.concat([df[col].str.split(split_on, expand=True).stack().str.strip().reset_index(drop=True)
+                            for col in cols], axis=1)
+    df_explode.columns = cols
+    return pd.concat((df_repeat, df_explode), axis=1)
+
+
+def legacy_explode2(df, cols, split_on):
+    # explode2 expects the columns to be lists already
+    df = df.copy()
+    for col in cols:
+        df[col] = df[col].str.split(split_on)
+    idx = np.repeat(df.index, df[cols[0]].str.len())
+    a = df.T.reindex(cols).values
+    concat = np.concatenate([np.concatenate(a[i]) for i in range(a.shape[0])])
+    p = pd.DataFrame(concat.reshape(a.shape[0], -1).T, idx, cols)
+    return pd.concat([df.drop(cols, axis=1), p], axis=1).reset_index(drop=True)
+
+
+def best_of(func, df, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = func(df, packed_cols, '-')
+        times.append(time.perf_counter() - start)
+    return min(times), res
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--interfaces', type=int, default=5000)
+    parser.add_argument('--residues', type=int, default=40,
+                        help='mean number of residues per interface')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    df = synthetic_psdb(args.interfaces, args.residues)
+    t_new, res_new = best_of(explode, df, args.repeat)
+    print('{:,} interfaces, {:,} residues'.format(len(df), len(res_new)))
+    print('explode (vectorized): {:.3f} s'.format(t_new))
+    for name, func in [('explode (legacy)', legacy_explode),
+                       ('explode2 (legacy)', legacy_explode2)]:
+        t, res = best_of(func, df, args.repeat)
+        same = (res['Protein_position'].astype(int).to_numpy() ==
+                res_new['Protein_position'].to_numpy()).all()
+        print('{}: {:.3f} s, {:.1f}x slower, same positions: {}'.format(
+            name, t, t / t_new, same))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark of the join of variants and structural features done in
+mapper.mapper.map_positions.
+
+Compares the previous join (positions converted to str on both sides,
+DataFrame.join on protein and position) with
+mapper.mapper.join_positions (integer keys, binary search in the sorted
+keys of the structures) on a synthetic protein of the size of TTN.
+
+The conversion of the text positions of the variants to integers
+(mapper.mapper.integer_positions) is also compared with a python test of
+every position and with pd.to_numeric.
+
+Usage:
+    python benchmarks/bench_join_positions.py --variants 200000 --structures 300
+'''
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from mapper.mapper import integer_positions, join_positions  # noqa: E402
+
+prot_id = 'ENSP00000467141'
+length = 34350
+
+
+def synthetic(n_variants, n_structures, seed=0):
+    rng = np.random.default_rng(seed)
+    pos = rng.integers(1, length, n_variants).astype(str)
+    # a few variants with positions that are not a single residue
+    pos[rng.random(n_variants) < 0.01] = '-'
+    annovars = pd.DataFrame({
+        'Uploaded_variation': np.char.add('2_', np.arange(n_variants).astype(str)),
+        'Consequence': 'missense_variant',
+        'Protein_position': pos,
+        'APPRIS_isoform': '',
+        'Protein_accession': prot_id})
+    frames = []
+    for i in range(n_structures):
+        start = rng.integers(1, length - 300)
+        frames.append(pd.DataFrame({
+            'Protein_accession': prot_id,
+            'Protein_position': np.arange(start, start + 200),
+            'PDB_code': 't' + str(i), 'PDB_chain': 'A',
+            'PDB_3D_position': np.arange(1, 201).astype(str),
+            'Pident': 90.0}))
+    return annovars, pd.concat(frames, ignore_index=True)
+
+
+def str_join(annovars, psdf):
+    psdf['Protein_position'] = psdf['Protein_position'].astype(str)
+    annovars['Protein_position'] = annovars['Protein_position'].astype(str)
+    df = annovars.join(psdf.set_index(['Protein_accession', 'Protein_position']),
+                       on=['Protein_accession', 'Protein_position'], how='inner')
+    return df[list(annovars.columns[:-1]) +
+              [c for c in psdf.columns if c != 'Protein_position']]
+
+
+def isdigit_positions(positions):
+    # python call per position
+    values = positions.values
+    valid = np.array([str(v).isdigit() for v in values], dtype=bool)
+    out = np.zeros(len(positions), dtype=np.int64)
+    out[valid] = values[valid].astype(np.int64)
+    return out, valid
+
+
+def numeric_positions(positions):
+    values = pd.to_numeric(positions, errors='coerce').values
+    valid = ~np.isnan(values)
+    valid[valid] = values[valid] == np.floor(values[valid])
+    out = np.zeros(len(positions), dtype=np.int64)
+    out[valid] = values[valid]
+    return out, valid
+
+
+def best_time(func, positions, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = func(positions)
+        times.append(time.perf_counter() - start)
+    return min(times), res
+
+
+def measure(func, annovars, psdf, repeat=3):
+    # time without tracing, which slows down allocations
+    times = []
+    for _ in range(repeat):
+        a, p = annovars.copy(), psdf.copy()
+        start = time.perf_counter()
+        res = func(a, p)
+        times.append(time.perf_counter() - start)
+    a, p = annovars.copy(), psdf.copy()
+    tracemalloc.start()
+    func(a, p)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak, res
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--variants', type=int, default=200000)
+    parser.add_argument('--structures', type=int, default=300)
+    args = parser.parse_args()
+
+    annovars, psdf = synthetic(args.variants, args.structures)
+    t_old, m_old, old = measure(str_join, annovars, psdf)
+    t_new, m_new, new = measure(join_positions, annovars, psdf)
+    same = old.astype(str).values.tolist() == new.astype(str).values.tolist()
+    print('{:,} variants, {:,} structure positions, {:,} joined rows'.format(
+        args.variants, len(psdf), len(new)))
+    print('  str keys, DataFrame.join: {:.3f} s, peak {:.0f} MB'.format(t_old, m_old / 1e6))
+    print('  integer keys:             {:.3f} s, peak {:.0f} MB, {:.1f}x faster, same rows: {}'.format(
+        t_new, m_new / 1e6, t_old / t_new, same))
+    positions = annovars['Protein_position']
+    t_arrow, ref = best_time(integer_positions, positions)
+    print('{:,} text positions to integers:'.format(len(positions)))
+    for name, func in [('python str.isdigit', isdigit_positions),
+                       ('pd.to_numeric', numeric_positions)]:
+        t, res = best_time(func, positions)
+        print('  {:19s} {:.1f} ms'.format(name + ':', t * 1e3) +
+              ', same: {}'.format((res[0] == ref[0]).all() and (res[1] == ref[1]).all()))
+    print('  {:19s} {:.1f} ms'.format('arrow:', t_arrow * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark of the conversion of a MAF file to the variants database done in
+makevariantsdb.maf2vep.
+
+Compares the previous conversion (the MAF read line by line and written
+to an intermediate variants.vep file with csv, then split by transcript)
+with makevariantsdb.maf2vep.request (column-pruned chunks, vectorized
+columns, rows routed straight to the split files), on a synthetic MAF.
+
+Usage:
+    python benchmarks/bench_maf2vep.py --variants 500000 --transcripts 20000
+'''
+import argparse
+import csv
+import filecmp
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from makevariantsdb.maf2vep import request, upvar_cols, rest_of_cols, vep_header  # noqa: E402
+from makevariantsdb.split import split_file  # noqa: E402
+
+
+def synthetic(fn, n_variants, n_transcripts, seed=0):
+    rng = np.random.default_rng(seed)
+    pos = rng.integers(1, 250000000, n_variants).astype(str)
+    t = rng.integers(1, n_transcripts, n_variants)
+    maf = pd.DataFrame({
+        'Hugo_Symbol': np.char.add('G', t.astype(str)),
+        'Chromosome': rng.integers(1, 23, n_variants).astype(str),
+        'Start_Position': pos, 'End_Position': pos,
+        'Reference_Allele': 'C', 'Tumor_Seq_Allele1': 'C',
+        'Tumor_Seq_Allele2': 'T', 'Tumor_Sample_Barcode': 'TCGA-01',
+        'Allele': 'T',
+        'Gene': np.char.add('ENSG', np.char.zfill(t.astype(str), 11)),
+        'Feature': np.char.add('ENST', np.char.zfill(t.astype(str), 11)),
+        'Feature_type': 'Transcript', 'One_Consequence': 'missense_variant',
+        'Consequence': 'missense_variant', 'cDNA_position': '10',
+        'CDS_position': '10', 'Protein_position': '4', 'Amino_acids': 'A/V',
+        'Codons': 'gCa/gTa', 'Existing_variation': np.char.add('rs', pos),
+        'SIFT': 'tolerated(0.1)', 'PolyPhen': 'benign(0.01)'})
+    with open(fn, 'w') as f:
+        f.write('#version 2.4\n')
+        maf.to_csv(f, sep='\t', index=False)
+
+
+def line_by_line(input_file, out_dir, logger):
+    out_file = os.path.join(out_dir, 'variants.vep')
+    with open(input_file) as f:
+        f.readline()
+        cols = f.readline().rstrip('\n').split('\t')
+        uploaded_variation_cols = np.where(np.isin(cols, upvar_cols))
+        location_cols = np.where(np.isin(cols, upvar_cols[:2]))
+        rest_cols = np.where(np.isin(cols, rest_of_cols))
+        with open(out_file, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile, delimiter='\t', lineterminator='\n')
+            writer.writerow(vep_header)
+            for line in f:
+                row_splitted = np.asarray(line.rstrip('\n').split('\t'))
+                Uploaded_variation = row_splitted[uploaded_variation_cols]
+                writer.writerow(['_'.join(Uploaded_variation[:-1]) + '/' +
+                                 Uploaded_variation[-1]] +
+                                [':'.join(row_splitted[location_cols])] +
+                                row_splitted[rest_cols].tolist())
+    split_file(out_file, 'Feature', out_dir, 'vep', logger)
+    os.remove(out_file)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--variants', type=int, default=500000)
+    parser.add_argument('--transcripts', type=int, default=20000)
+    args = parser.parse_args()
+
+    logger = logging.getLogger('bench_maf2vep')
+    tmp = tempfile.mkdtemp()
+    maf = os.path.join(tmp, 'synthetic.maf')
+    synthetic(maf, args.variants, args.transcripts)
+    old, new = os.path.join(tmp, 'old'), os.path.join(tmp, 'new')
+    os.makedirs(old)
+    os.makedirs(new)
+    start = time.perf_counter()
+    line_by_line(maf, old, logger)
+    t_old = time.perf_counter() - start
+    start = time.perf_counter()
+    request(maf, new, tmp)
+    t_new = time.perf_counter() - start
+    files = os.listdir(old)
+    match = filecmp.cmpfiles(old, new, files, shallow=False)[0]
+    same = sorted(files) == sorted(os.listdir(new)) and len(match) == len(files)
+    print('{:,} variants, {:,} transcripts, {:.0f} MB'.format(
+        args.variants, len(files) - 1, os.path.getsize(maf) / 1e6))
+    print('  line by line, variants.vep, split: {:.2f} s'.format(t_old))
+    print('  chunked, straight to split files:  {:.2f} s, {:.1f}x faster, same files: {}'.format(
+        t_new, t_old / t_new, same))
+
+
+if __name__ == '__main__':
+    main()
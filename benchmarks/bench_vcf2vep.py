@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark of the conversion of a vcf file annotated with VEP to vep format
+done in makevariantsdb.vcf2vep, serial and with the contigs converted in
+parallel bcftools processes.
+
+A synthetic vcf with several contigs and a CSQ annotation per record is
+written, bgzipped and indexed with bcftools, and converted with 1, 2, 4...
+processes. The speedup is reported against the serial conversion, and the
+outputs are checked to be identical. bcftools with the split-vep plugin
+must be installed.
+
+Usage:
+    python benchmarks/bench_vcf2vep.py --records 400000 --contigs 24
+'''
+import argparse
+import filecmp
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from makevariantsdb.vcf2vep import bcftools, request_parallel  # noqa: E402
+
+csq_fields = ['Allele', 'Consequence', 'IMPACT', 'SYMBOL', 'Gene',
+              'Feature_type', 'Feature', 'BIOTYPE', 'cDNA_position',
+              'CDS_position', 'Protein_position', 'Amino_acids', 'Codons',
+              'Existing_variation']
+consequences = ['missense_variant', 'synonymous_variant', 'stop_gained',
+                'missense_variant,splice_region_variant', 'intron_variant']
+
+
+def synthetic(fn, n_records, n_contigs, seed=0):
+    rng = np.random.default_rng(seed)
+    contigs = [str(i) for i in range(1, n_contigs + 1)]
+    # larger contigs first, as in the human genome
+    sizes = np.sort(rng.integers(1, 10, n_contigs))[::-1]
+    per_contig = np.round(n_records * sizes / sizes.sum()).astype(int)
+    with open(fn, 'w') as f:
+        f.write('##fileformat=VCFv4.2\n')
+        for c in contigs:
+            f.write('##contig=<ID=' + c + ',length=250000000>\n')
+        f.write('##INFO=<ID=CSQ,Number=.,Type=String,Description="Consequence '
+                'annotations from Ensembl VEP. Format: ' + '|'.join(csq_fields) + '">\n')
+        f.write('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n')
+        for c, n in zip(contigs, per_contig):
+            for pos in np.sort(rng.choice(np.arange(1, 250000000), n, replace=False)):
+                t = rng.integers(1, 20000)
+                csq = ','.join('|'.join([
+                    'T', consequences[(pos + k) % len(consequences)], 'MODERATE',
+                    'G' + str(t), 'ENSG%011d' % t, 'Transcript',
+                    'ENST%011d' % (t + k), 'protein_coding', str(pos % 3000),
+                    str(pos % 3000), str(pos % 1000), 'A/V', 'gCa/gTa', '-'])
+                    for k in range(2))
+                f.write('\t'.join([c, str(pos), '.', 'C', 'T', '.', 'PASS',
+                                   'CSQ=' + csq]) + '\n')
+
+
+def serial(input_file, out_file):
+    subprocess.run(bcftools.format(input_file, out_file), shell=True,
+                   check=True, stdout=subprocess.DEVNULL)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=400000)
+    parser.add_argument('--contigs', type=int, default=24)
+    args = parser.parse_args()
+
+    logger = logging.getLogger('bench_vcf2vep')
+    tmp = tempfile.mkdtemp()
+    vcf = os.path.join(tmp, 'synthetic.vcf')
+    synthetic(vcf, args.records, args.contigs)
+    subprocess.run('bcftools view -Oz -o ' + vcf + '.gz ' + vcf, shell=True, check=True)
+    subprocess.run('bcftools index -t ' + vcf + '.gz', shell=True, check=True)
+
+    ref = os.path.join(tmp, 'serial.vep')
+    start = time.perf_counter()
+    serial(vcf + '.gz', ref)
+    t_serial = time.perf_counter() - start
+    print('{:,} records, {} contigs, {} cpus'.format(
+        args.records, args.contigs, os.cpu_count()))
+    print('  serial:      {:.2f} s'.format(t_serial))
+    jobs = 1
+    while jobs <= os.cpu_count():
+        out = os.path.join(tmp, 'parallel_{}.vep'.format(jobs))
+        start = time.perf_counter()
+        request_parallel(vcf + '.gz', tmp, out, logger, jobs)
+        t = time.perf_counter() - start
+        print('  {:2d} processes: {:.2f} s, {:.1f}x speedup, same output: {}'.format(
+            jobs, t, t_serial / t, filecmp.cmp(ref, out, shallow=False)))
+        jobs *= 2
+
+
+if __name__ == '__main__':
+    main()
@@ -25,6 +25,7 @@ from subprocess import call
 # import functions from scripts
 from .parse_argv import parse_commandline
 from .split import split
+from .txt2parquet import txt2parquet
 from .decorator import tags
 from .logger import get_logger
 from .input_isfile import isfile
@@ -142,20 +143,25 @@ def main():
                         'Error: Not such file: \'' + f + '\'')
                     print('Error: Not such file: \'' + f + '\'')
                     exit(-1)
-                # finish report
-                end = time.time()
+            # explode the split files once and store them in parquet format
+            if args.db_format == 'parquet':
+                txt2parquet(psdb_outdir, 'txt', log_dir)
                 report.write(
-                    time_format + 'Reading and splitting input file...done. \n')
-                report.write(
-                    time_format + 'Generation of protein structures DB in ' + psdb_outdir + ' done. Total time: ' +
-                    str(datetime.timedelta(seconds=round(end-start))) + '\n')
-                # report.write(stats_message)
-                report.close()
-                # print in console result
-                spinner.stop_and_persist(symbol='\U0001F4CD',
-                                         text=' makepsdb process finished. Total time: ' +
-                                         str(datetime.timedelta(
-                                             seconds=round(end-start))))
+                    time_format + 'Conversion to parquet format...done. \n')
+            # finish report
+            end = time.time()
+            report.write(
+                time_format + 'Reading and splitting input file...done. \n')
+            report.write(
+                time_format + 'Generation of protein structures DB in ' + psdb_outdir + ' done. Total time: ' +
+                str(datetime.timedelta(seconds=round(end-start))) + '\n')
+            # report.write(stats_message)
+            report.close()
+            # print in console result
+            spinner.stop_and_persist(symbol='\U0001F4CD',
+                                     text=' makepsdb process finished. Total time: ' +
+                                     str(datetime.timedelta(
+                                         seconds=round(end-start))))
         else:
             makedb.log(
                 'A protein structures DB already exists. Not overwritting files.', report, logger)
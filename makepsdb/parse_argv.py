@@ -45,6 +45,11 @@ def parse_commandline():
                         help="force to owerwrite? Default is False", default=False)
     parser.add_argument("-s", "--sort", dest="sort", action='store_true',
                         help="sort input file to split ", default=False)
+    parser.add_argument("-fmt", "--format", dest="db_format", metavar="<String>",
+                        choices=['txt', 'parquet'], default='txt',
+                        help="format of the protein structures DB: one text file per \
+                        protein ('txt', default) or one exploded parquet file per \
+                        protein ('parquet').")
     # parser.add_argument("-p", "--parallel", dest="parallel", action='store_true',
     #                     default=False,
     #                     help="Speed up running time. Depends on GNU Parallel. \
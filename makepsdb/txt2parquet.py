@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import os
+import os.path
+import glob
+import pandas as pd
+
+# the same parser and explode as the mapper, so the stored files are
+# exactly those the mapper would build
+from mapper.db_parser import read_file
+from mapper.explode import explode_psdb
+
+from .decorator import tags
+from .logger import get_logger
+
+
+def request(out_dir, out_extension, log_dir):
+    '''
+    Explode the split protein structures files and store them in parquet
+    format, so the mapper does not have to do it for every run.
+
+    Parameters
+    ----------
+    out_dir : str
+        Path to the directory containing the split files.
+    out_extension : str
+        Filename extension of the split files.
+
+    Returns
+    -------
+    ./dir
+        One <Protein_accession>.parquet file per split file, with one
+        residue per row and an integer Protein_position column.
+    '''
+    # log file
+    logger = get_logger('txt2parquet', log_dir)
+    logger.info('Converting protein structures files to parquet format.')
+    files = glob.glob(os.path.join(out_dir, '*.' + out_extension))
+    for f in files:
+        # text columns (e.g. PDB_code '1e10') are read with their declared
+        # types, not inferred
+        try:
+            psdf = read_file(f)
+        except IOError:
+            logger.error(f + ' could not be parsed. Not converted.')
+            continue
+        psdf = explode_psdb(psdf)
+        # positions are joined with the variants as integers
+        protein_position = pd.to_numeric(
+            psdf['Protein_position'], errors='coerce')
+        if protein_position.isna().any():
+            logger.error(
+                f + ' contains non numeric protein positions. Not converted.')
+            continue
+        psdf['Protein_position'] = protein_position.astype('int64')
+        psdf.to_parquet(os.path.splitext(f)[0] + '.parquet', index=False)
+        os.remove(f)
+    logger.info(str(len(files)) + ' files converted to parquet format.')
+
+
+# add decorator to main function
+@tags(text_start="Converting protein structures DB to parquet...This might take up some time...",
+      text_succeed="Converting protein structures DB to parquet...done.",
+      text_fail="Converting protein structures DB to parquet...failed!",
+      emoji="\U00002702")
+def txt2parquet(out_dir, out_extension, log_dir):
+    '''
+    Explode the split protein structures files and store them in parquet
+    format.
+
+    Parameters
+    ----------
+    out_dir : str
+        Path to the directory containing the split files.
+    out_extension : str
+        Filename extension of the split files.
+
+    Returns
+    -------
+    ./dir
+        Directory containing the parquet files.
+    '''
+    request(out_dir, out_extension, log_dir)
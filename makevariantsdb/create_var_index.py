@@ -1,40 +1,205 @@
 # -*- coding: utf-8 -*-
-import subprocess
 import os
 import os.path
-import re
-import time
-import glob
-from halo import Halo
+import shutil
+import tempfile
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from mapper.consequence import term_separator
+
 from .decorator import tags
 from .logger import get_logger
-from .parse_argv import parse_commandline
+
+# number of lines of variants.index read at once
+chunksize = 1000000
+# rows per row group of the sorted index. A lookup only reads the row
+# groups whose range of ids may contain one of the requested ids
+row_group_size = 100000
+# rows read at once from every sorted run while they are merged
+merge_batch_size = 100000
+schema = pa.schema([('id', pa.string()), ('Feature', pa.string())])
+# missing ids: empty, '-' in VEP files and '.' in VCF files
+missing_ids = ['', '-', '.']
+
+
+def read_index(input_file):
+    '''
+    Read the variants index file created along with the variants database
+    and list every variant id with the transcript it belongs to.
+
+    Parameters
+    ----------
+    input_file : str
+        Path to variants.index.
+
+    Returns
+    -------
+    iterator
+        Data frames with columns 'id' and 'Feature'.
+    '''
+    # the header line may start with '#' (split.py) or not (vep2parquet.py)
+    for chunk in pd.read_csv(input_file, sep=' ', header=None, dtype=str,
+                             na_filter=False, usecols=[0, 2, 3],
+                             names=['Uploaded_variation', 'Gene', 'Feature',
+                                    'Existing_variation'],
+                             chunksize=chunksize):
+        chunk = chunk[~chunk['Uploaded_variation'].isin(
+            ['#Uploaded_variation', 'Uploaded_variation'])]
+        # a variant can have several existing ids, e.g. 'rs1,COSV2' or,
+        # in databases converted from VCF files, 'rs1&COSV2'
+        existing = chunk[['Existing_variation', 'Feature']]
+        existing = existing.assign(
+            Existing_variation=existing['Existing_variation'].str.split(
+                term_separator.pattern))
+        existing = existing.explode('Existing_variation')
+        ids = pd.concat([chunk[['Uploaded_variation', 'Feature']].rename(
+                         columns={'Uploaded_variation': 'id'}),
+                         existing.rename(columns={'Existing_variation': 'id'})])
+        ids = ids[~ids['id'].isin(missing_ids)]
+        yield ids.drop_duplicates()
+
+
+def write_runs(input_file, tmp_dir):
+    '''
+    Sort every chunk of the variants index and write it to disk.
+
+    Returns
+    -------
+    list
+        Paths of the sorted runs, parquet files without duplicated rows.
+    '''
+    runs = []
+    for ids in read_index(input_file):
+        ids = ids.sort_values(['id', 'Feature'])
+        fn = os.path.join(tmp_dir, 'run-{:05d}.parquet'.format(len(runs)))
+        pq.write_table(pa.Table.from_pandas(ids, schema=schema,
+                                            preserve_index=False), fn)
+        runs.append(fn)
+    return runs
+
+
+class Run:
+    '''
+    Rows of a sorted run read in batches while it is merged.
+    '''
+
+    def __init__(self, fn):
+        self.batches = pq.ParquetFile(fn).iter_batches(
+            batch_size=merge_batch_size)
+        self.rows = pd.DataFrame({'id': [], 'Feature': []}, dtype=object)
+        self.exhausted = False
+        self.read()
+
+    def read(self):
+        # append the next batch to the rows not merged yet
+        batch = next(self.batches, None)
+        if batch is None:
+            self.exhausted = True
+        else:
+            self.rows = pd.concat([self.rows, batch.to_pandas()],
+                                  ignore_index=True)
+
+    def last(self):
+        return self.rows['id'].iat[-1]
+
+    def take(self, bound):
+        # rows with ids before the bound, which are complete in every run
+        n = self.rows['id'].searchsorted(bound) if bound is not None \
+            else len(self.rows)
+        rows, self.rows = self.rows.iloc[:n], self.rows.iloc[n:]
+        return rows
+
+
+def merge_runs(runs, out_file):
+    '''
+    K-way merge of sorted runs into one parquet file sorted by id, without
+    duplicated rows. Only a batch of every run is kept in memory.
+
+    Returns
+    -------
+    int
+        Number of rows written.
+    '''
+    runs = [Run(fn) for fn in runs]
+    n_rows = 0
+    pending = []
+    with pq.ParquetWriter(out_file, schema) as writer:
+        while True:
+            runs = [r for r in runs if not r.exhausted or len(r.rows)]
+            if not runs:
+                break
+            # every run holds all its ids lower than the last id of the
+            # runs that are not exhausted
+            open_runs = [r for r in runs if not r.exhausted and len(r.rows)]
+            bound = min(r.last() for r in open_runs) if open_runs else None
+            block = pd.concat([r.take(bound) for r in runs], ignore_index=True)
+            if len(block) == 0:
+                # a batch with a single id: read further in the runs
+                # ending at the bound
+                for r in runs:
+                    if not r.exhausted and (not len(r.rows) or r.last() == bound):
+                        r.read()
+                continue
+            for r in runs:
+                if not r.exhausted and not len(r.rows):
+                    r.read()
+            # the same id and transcript can be in several runs
+            block = block.drop_duplicates().sort_values(['id', 'Feature'])
+            pending.append(block)
+            if sum(map(len, pending)) >= row_group_size:
+                rows = pd.concat(pending, ignore_index=True)
+                n = len(rows) - len(rows) % row_group_size
+                writer.write_table(pa.Table.from_pandas(
+                    rows.iloc[:n], schema=schema, preserve_index=False),
+                    row_group_size=row_group_size)
+                pending = [rows.iloc[n:]]
+                n_rows += n
+        rows = pd.concat(pending, ignore_index=True) if pending else \
+            pd.DataFrame({'id': [], 'Feature': []}, dtype=object)
+        writer.write_table(pa.Table.from_pandas(
+            rows, schema=schema, preserve_index=False),
+            row_group_size=row_group_size)
+        n_rows += len(rows)
+    return n_rows
+
 
 # add decorator to main function
-@tags(text_start="Split file by selected ensembl id...This might take up some time...",
-      text_succeed="Split file by selected ensembl id...done.",
-      text_fail="Split file by selected ensembl id...failed!",
-      emoji="\U00002702")
+@tags(text_start="Indexing variants ids...",
+      text_succeed="Indexing variants ids...done.",
+      text_fail="Indexing variants ids...failed!",
+      emoji="\U0001F50D")
 def index(input_file, out_dir, log_dir):
     '''
     Index variants file.
 
     Parameters
     ----------
-    prefix : str
-        Ensembl ID prefix. Either ESNG or ENSP.
     input_file : str
-        Path to infile.
+        Path to the variants.index file.
     out_dir : str
         Path to output.
-    out_extension : str
-        Output filename extension
 
     Returns
     -------
-    indexed_file
-        1st column is variants ids and the 2nd the corresponding gene ids
+    variants.index.parquet
+        Variant ids ('Uploaded_variation' and every id of
+        'Existing_variation') and their transcript ids, sorted by variant
+        id.
     '''
     # log file
     logger = get_logger('create index', log_dir)
-    logger.info('Creating index file.')
\ No newline at end of file
+    logger.info('Creating index file.')
+    if not os.path.isfile(input_file):
+        logger.error('File ' + input_file + ' not found.')
+        raise IOError()
+    # external sort: the chunks are sorted and written as runs, which are
+    # then merged, so the whole index is never in memory
+    tmp_dir = tempfile.mkdtemp(dir=out_dir)
+    try:
+        runs = write_runs(input_file, tmp_dir)
+        n_rows = merge_runs(runs, os.path.join(out_dir, 'variants.index.parquet'))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    logger.info(str(n_rows) + ' variant ids indexed from ' +
+                str(len(runs)) + ' sorted runs.')
@@ -2,73 +2,225 @@
 # import necessary modules
 import os
 import os.path
-import time
-import subprocess
-import sys
 import csv
-import glob
-import re
+import time
 import pandas as pd
-import numpy as np
+import pyarrow as pa
 
 from .decorator import tags
 from .logger import get_logger
+from .split import Partitions, progress
+from .vep2parquet import write_buckets, index_cols, clear_vardb, cleared
 
+# number of rows read from the input file at once
+chunksize = 500000
+# set the name of 'uploaded_variants'
+upvar_cols = ["Chromosome", "Start_Position", "Reference_Allele", "Allele"]
+# set the name of  the rest of columns included in a VEP file
+rest_of_cols = ["Allele",
+                "Gene",
+                "Feature",
+                "Feature_type",
+                "Consequence",
+                "cDNA_position",
+                "CDS_position",
+                "Protein_position",
+                "Amino_acids",
+                "Codons",
+                "Existing_variation"]
+# set header
+vep_header = ['Uploaded_variation', 'Location'] + rest_of_cols
 
-@tags(text_start="Converting MAF to VEP...This might take up some time...\n",
-      text_succeed="Converting MAF to VEP...done.\n",
-      text_fail="Converting MAF to VEP...failed!\n",
-      emoji="\U0001F504 ")
-def maf2vep(input_file, out_dir, out_file, overwrite, log_dir):
+
+def read_header(f):
+    '''
+    Skip the comment lines of a MAF file (e.g. '#version 2.4') and return
+    its column names.
+
+    Parameters
+    ----------
+    f : file object
+        MAF file opened in text mode. After the call the file is positioned
+        at the first data line.
+
+    Returns
+    -------
+    list
+        Column names.
+    '''
+    # readline keeps the position of the file available to tell()
+    line = f.readline()
+    while line.startswith('#'):
+        line = f.readline()
+    if not line:
+        raise IOError()
+    return line.rstrip('\r\n').split('\t')
+
+
+def read_maf(f, cols):
+    '''
+    Read the columns of a MAF file needed in a VEP file, in chunks.
+
+    Parameters
+    ----------
+    f : file object
+        MAF file positioned at the first data line.
+    cols : list
+        Column names of the file.
+
+    Returns
+    -------
+    iterator
+        Data frames of text columns, empty values kept as ''.
+    '''
+    usecols = [c for c in cols if c in set(upvar_cols + rest_of_cols)]
+    return pd.read_csv(f, sep='\t', header=None, names=cols, usecols=usecols,
+                       dtype=str, na_filter=False, quoting=csv.QUOTE_NONE,
+                       chunksize=chunksize)
+
+
+def vep_table(chunk):
+    '''
+    Convert a chunk of a MAF file to the columns of a VEP file.
+
+    Returns
+    -------
+    df
+        Columns of vep_header. Missing optional columns are '-'.
+    '''
+    # merge the columns conveniently according to VEP file standards,
+    # e.g. 1_12345_A/G and 1:12345
+    df = pd.DataFrame({
+        'Uploaded_variation': chunk['Chromosome'] + '_' + chunk['Start_Position'] +
+        '_' + chunk['Reference_Allele'] + '/' + chunk['Allele'],
+        'Location': chunk['Chromosome'] + ':' + chunk['Start_Position']},
+        index=chunk.index)
+    for c in rest_of_cols:
+        df[c] = chunk[c] if c in chunk else '-'
+    return df
+
+
+def join_rows(df, cols, sep):
+    '''
+    Lines of text of the given columns of a data frame.
+    '''
+    # str.join of every row is much faster than concatenating the columns
+    # of object arrays one after the other
+    return pd.Series([sep.join(row) for row in zip(*(df[c].values for c in cols))],
+                     index=df.index, dtype=object)
+
+
+def request(input_file, out_dir, log_dir, db_format='vep'):
+    '''
+    Convert a MAF file to VEP format and store it in the variants database,
+    split by transcript or as a parquet dataset, with no intermediate VEP
+    file.
+
+    Parameters
+    ----------
+    input_file : str
+        Path to infile.
+    out_dir : str
+        Path to output.
+    db_format : str
+        'vep' to write one file per transcript, 'parquet' to write a
+        parquet dataset partitioned by transcript.
+
+    Returns
+    -------
+    ./dir
+        Directory containing the variants database and variants.index.
+    '''
     # log file
     logger = get_logger('maf2vep', log_dir)
     logger.info('Converting maf file to vep format.')
-    # set the name of 'uploaded_variants'
-    upvar_cols = ["Chromosome", "Start_Position", "Reference_Allele", "Allele"]
-    # set the name of 'location'
-    loc_cols = ["Chromosome", "Start_Position"]
-    # set the name of  the rest of columns included in a VEP file
-    rest_of_cols = ["Allele",
-                    "Gene",
-                    "Feature",
-                    "Feature_type",
-                    "Consequence",
-                    "cDNA_position",
-                    "CDS_position",
-                    "Protein_position",
-                    "Amino_acids",
-                    "Codons",
-                    "Existing_variation"]
-    # set header
-    vep_header = ['Uploaded_variation', 'Location'] + rest_of_cols
-    # read the MAF file line by line to modify each of them in situ
+    start = time.time()
     with open(input_file) as f:
-        # get col names
-        cols = f.readline().split('\t')
-        # take the index position of upvar_cols in the file
-        uploaded_variation_cols = np.where(np.isin(cols, upvar_cols))
-        # take the index position of loc_cols in the file
-        location_cols = np.where(np.isin(cols, loc_cols))
-        # and the rest of columns
-        rest_cols = np.where(np.isin(cols, rest_of_cols))
-        # open new file to write results
-        with open(os.path.join(out_file), 'w', newline='', encoding='utf8') as csvfile:
-            # use csv module
-            writer = csv.writer(csvfile, delimiter='\t')
-            # first row is vep header.
-            writer.writerow(vep_header)
-            # parse file
-            for line in f:
-                # split row into list and select the elements of the corresponding
-                # indexes, previously defined
-                row_splitted = np.asarray(line.split('\t'))
-                Uploaded_variation = row_splitted[uploaded_variation_cols]
-                Location = row_splitted[location_cols]
-                rest = row_splitted[rest_cols]
-                # merge previous list objects conveniently according to VEP file standards
-                to_save = ['_'.join(Uploaded_variation[:-1]) + '/' +
-                           Uploaded_variation[-1]] + [':'.join(Location)] + rest.tolist()
-                # save results
-                writer.writerow(to_save)
+        cols = read_header(f)
+        missing = [c for c in upvar_cols + ['Feature'] if c not in cols]
+        if missing:
+            logger.error('This file could not be converted. Columns ' +
+                         ', '.join(missing) + ' not found.')
+            raise IOError()
+        for c in rest_of_cols:
+            if c not in cols:
+                logger.warning('Column ' + c + ' not found. It is set to \'-\'.')
+        index_file = os.path.join(out_dir, 'variants.index')
+        write_index_header = not os.path.isfile(index_file)
+        if db_format == 'parquet':
+            schema = pa.schema([(c, pa.string()) for c in vep_header])
+            writers = {}
+        else:
+            # header only in the new files, the rows of the next inputs are
+            # appended to the same files
+            parts = Partitions(out_dir, 'vep', '\t'.join(vep_header).encode(),
+                               append_header=False)
+        n_rows = 0
+        try:
+            for chunk in read_maf(f, cols):
+                df = vep_table(chunk)
+                if db_format == 'parquet':
+                    write_buckets(df, schema, writers, out_dir)
+                else:
+                    # tab separated rows, one write per transcript
+                    lines = join_rows(df, vep_header, '\t')
+                    for key, rows in lines.groupby(df['Feature'].values, sort=False):
+                        parts.add(key.encode(), '\n'.join(rows.values).encode())
+                    if parts.full():
+                        parts.flush()
+                # update index file
+                with open(index_file, 'a') as idx:
+                    if write_index_header:
+                        idx.write(' '.join(index_cols) + '\n')
+                        write_index_header = False
+                    idx.write('\n'.join(join_rows(df, index_cols, ' ')) + '\n')
+                n_rows += len(df)
+                logger.info(progress(n_rows, f.tell(), time.time() - start))
+        finally:
+            if db_format == 'parquet':
+                for w in writers.values():
+                    w.close()
+            else:
+                parts.close()
 
     logger.info('Conversion done successfully.')
+
+
+@tags(text_start="Converting MAF to VEP...This might take up some time...\n",
+      text_succeed="Converting MAF to VEP...done.\n",
+      text_fail="Converting MAF to VEP...failed!\n",
+      emoji="\U0001F504 ")
+def maf2vep(input_file, out_dir, overwrite, log_dir, db_format='vep'):
+    '''
+    Convert a MAF file to VEP format, split by transcript id.
+
+    Parameters
+    ----------
+    input_file : str
+        Path to infile.
+    out_dir : str
+        Path to the variants database.
+    overwrite : str
+        Force to overwrite. Default is yes.
+    db_format : str
+        'vep' or 'parquet'.
+
+    Returns
+    -------
+    ./dir
+        Directory containing the variants database.
+    '''
+    # create dir if it doesn't exist
+    os.makedirs(out_dir, exist_ok=True)
+    if db_format == 'parquet':
+        exists = any(f.startswith('vardb_') for f in os.listdir(out_dir))
+    else:
+        exists = any(f.endswith('.vep') for f in os.listdir(out_dir))
+    # execute request function. Rows are appended to the database, so it
+    # is cleared first when it is overwritten
+    if exists and overwrite is True:
+        clear_vardb(out_dir)
+    elif not exists:
+        cleared.add(os.path.abspath(out_dir))
+    if not exists or overwrite is True:
+        request(input_file, out_dir, log_dir, db_format)
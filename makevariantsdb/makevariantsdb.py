@@ -29,6 +29,8 @@ from memory_profiler import memory_usage
 from .parse_argv import parse_commandline
 from .run_vep import run_vep
 from .split import split
+from .vep2parquet import vep2parquet
+from .create_var_index import index
 from .detect_vcf_format import detect_format
 from .vcf2vep import vcf2vep
 from .maf2vep import maf2vep
@@ -49,34 +51,44 @@ class generateVarDB:
         logger.info(message)
         report.write(self.time + message + '\n')
 
-    def vcf(self, var_infile, out_dir, out_file, overwrite, log_dir, parallel=False):
+    def vcf(self, var_infile, out_dir, out_file, overwrite, log_dir, parallel=False, jobs=None,
+            engine='python'):
         # from vcf to vep
         vcf2vep(var_infile, out_dir,
-                out_file, overwrite, log_dir, parallel)
-        # add header to resulting vep file
-        add_header(out_file)
+                out_file, overwrite, log_dir, parallel, jobs, engine)
+        # add header to resulting vep file. The python engine writes it
+        # along with the records
+        if engine == 'bcftools':
+            add_header(out_file)
 
-    def vep(self, var_infile, vardb_outdir, overwrite, log_dir, parallel=False):
-        # split vep file by protein id to speed up the
-        # mapping process
-        split('Feature', var_infile, vardb_outdir,
-              'vep', overwrite, log_dir, parallel)
+    def vep(self, var_infile, vardb_outdir, overwrite, log_dir, parallel=False, db_format='vep'):
+        if db_format == 'parquet':
+            # store vep file as a parquet dataset partitioned by transcript id
+            vep2parquet(var_infile, vardb_outdir, overwrite, log_dir)
+        else:
+            # split vep file by protein id to speed up the
+            # mapping process
+            split('Feature', var_infile, vardb_outdir,
+                  'vep', overwrite, log_dir, parallel)
+        # sorted index of variant ids to find their transcripts
+        index(os.path.join(vardb_outdir, 'variants.index'),
+              vardb_outdir, log_dir)
 
-    def maf(self, var_infile, out_dir, out_file, vardb_outdir, overwrite, log_dir, report, logger, parallel=False):
-        # from vcf to vep
-        maf2vep(var_infile, out_dir,
-                out_file, overwrite, log_dir)
-        # split vep file by protein id to speed up the
-        # mapping process
-        var_infile = out_file
-        self.vep(
-            var_infile, vardb_outdir, overwrite, log_dir, parallel)
+    def maf(self, var_infile, out_dir, out_file, vardb_outdir, overwrite, log_dir, report, logger, parallel=False, db_format='vep'):
+        # from maf to vep, split by protein id to speed up the
+        # mapping process. The rows go straight to the variants database,
+        # no intermediate vep file is written
+        maf2vep(var_infile, vardb_outdir, overwrite, log_dir, db_format)
+        # sorted index of variant ids to find their transcripts
+        index(os.path.join(vardb_outdir, 'variants.index'),
+              vardb_outdir, log_dir)
         # logging
         self.log('Splitting process is done.',
                  report, logger)
 
     def wrapper(self, input_format, var_infile, out, log_dir,
-                report, logger, spinner, overwrite=False, parallel=False):
+                report, logger, spinner, overwrite=False, parallel=False, db_format='vep',
+                jobs=None, engine='python'):
         # created by default
         out_dir = os.path.join(out, 'DBs')
         out_file = os.path.join(
@@ -90,13 +102,13 @@ class generateVarDB:
                 # split vcf file
                 self.vcf(var_infile, out_dir,
                          out_file, overwrite,
-                         log_dir, parallel)
+                         log_dir, parallel, jobs, engine)
                 # logging
                 self.log('Input vcf file converted to vep format. Splitting vep file...',
                          report, logger)
                 var_infile = out_file
             self.vep(
-                var_infile, vardb_outdir, overwrite, log_dir, parallel)
+                var_infile, vardb_outdir, overwrite, log_dir, parallel, db_format)
             # logging
             self.log('Splitting process is done.',
                      report, logger)
@@ -209,7 +221,8 @@ def main():
                             try:
                                 makedb.wrapper(
                                     input_format, f, args.out, log_dir, report,
-                                    logger, spinner, args.force, args.parallel)
+                                    logger, spinner, args.force, args.parallel,
+                                    args.db_format, args.jobs, args.engine)
                             except IOError:
                                 continue
 
@@ -223,7 +236,8 @@ def main():
                     try:
                         makedb.wrapper(
                             input_format, f, args.out, log_dir, report,
-                            logger, spinner, args.force, args.parallel)
+                            logger, spinner, args.force, args.parallel,
+                            args.db_format, args.jobs, args.engine)
                     except IOError:
                         continue
 
@@ -253,7 +267,8 @@ def main():
                             try:
                                 makedb.maf(var_infile, out_dir,
                                                            out_file, vardb_outdir,
-                                                           args.force, log_dir, report, logger, args.parallel)
+                                                           args.force, log_dir, report, logger, args.parallel,
+                                                           args.db_format)
                             except IOError:
                                 continue
 
@@ -264,7 +279,8 @@ def main():
                     try:
                         makedb.maf(f, out_dir,
                                                    out_file, vardb_outdir,
-                                                   args.force, log_dir,  report, logger, args.parallel)
+                                                   args.force, log_dir,  report, logger, args.parallel,
+                                                   args.db_format)
                     except IOError:
                         continue
 
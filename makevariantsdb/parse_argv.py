@@ -54,9 +54,24 @@ def parse_commandline():
     # create default output directory
     parser.add_argument('-p', "--parallel", dest="parallel", action='store_true',
                         default=False,
-                        help="Speed up running time. Depends on GNU Parallel. \
-                        O. Tange(2011): GNU Parallel - The Command-Line Power Tool, \
-                        login: The USENIX Magazine, February 2011: 42-47.")
+                        help="Speed up running time. VCF files are converted to vep format \
+                        by contig (bgzipped and indexed files) or by blocks of records \
+                        in parallel processes.")
+    # number of processes
+    parser.add_argument('-j', "--jobs", dest="jobs", metavar="<int>",
+                        help="number of processes used with --parallel. Default is the number of cpus.",
+                        default=None)
+    # tool used to convert vcf files to vep format
+    parser.add_argument('-engine', dest="engine", metavar="<String>",
+                        choices=['python', 'bcftools'], default='python',
+                        help="how to extract the VEP annotation (CSQ) of vcf files: in \
+                        python ('python', default) or with bcftools +split-vep ('bcftools').")
+    # on-disk format of the variants database
+    parser.add_argument('-fmt', "--format", dest="db_format", metavar="<String>",
+                        choices=['vep', 'parquet'], default='vep',
+                        help="format of the variants database: one text file per \
+                        transcript ('vep', default) or a parquet dataset partitioned \
+                        by transcript ('parquet').")
     # store arguments into variable
     args = parser.parse_args()
     # clean up (recommended)
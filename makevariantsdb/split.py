@@ -1,169 +1,317 @@
 # -*- coding: utf-8 -*-
-import subprocess
 import os
 import os.path
 import re
 import time
-import glob
-from halo import Halo
+from collections import OrderedDict
+from operator import itemgetter
 from .decorator import tags
 from .logger import get_logger
-from .parse_argv import parse_commandline
-from .run_subprocess import call_subprocess
-
-
-# for all the columns, find the one that matches with the pattern ENSG
-detect_column = "grep -v '##' {} | awk -F ' ' '{{for(i=1;i<=NF;i++) \
-{{if ($i ~ /{}/){{print i; exit}}}}}}' "
-
-split_cmd = "grep -v '##' {0} | \
-sed -e '1s/^#//' | \
-awk -v ci=\"{1}\" \
--v od=\"{2}/\" \
--F ' ' 'NR==1 {{h=$0; next}}; \
-!seen[$ci]++{{f=od$ci\".{3}\"; print h >> f}}; \
-{{f=od$ci\".{3}\"; print >> f; close(f)}}'"
-
-split_cmd_parallel = "grep -v '##' {0} | \
-sed -e '1s/^#//' | parallel --pipe --header '(U.*\n)*' -q \
-awk -v ci=\"{1}\" \
--v od=\"{2}/\" \
--F ' ' 'NR==1 {{h=$0; next}}; \
-!seen[$ci]++{{f=od$ci\".{3}\"; print h >> f}}; \
-{{f=od$ci\".{3}\"; print >> f; close(f)}}'"
-
-
-index_file = "grep -v '##' {} | awk -F ' ' '{{print ${}, ${}, ${} , ${}}}' > {} "
-#index_file = "awk -F ' ' 'NR>2{{print ${}, ${}, ${} {}}}' {} | uniq >> {}  "
-
-# - grep -v '##': remove lines starting with ##
-# - sed -e '1s/^#// : remove # from header line
-# - awk
-#       -v ci=\"{}\": set variable ci
-#       -v od=\"{}/\" : set variable od
-#       -F ' ' : file separated by ' '
-#       - 'NR==1 {{h=$0; next}} : first line is header (h)
-#       - {{f=od$ci\".{}\"}} : set variable f as output filename
-#       - !($ci in p) {{p[$ci]}} : if  number of column index in file, select it
-#       - system(\"stat \" f \" >/dev/null 2>/dev/null\") != 0 {{print h > f }} : add header to outfile only if out file doesn't exist
-#       - {{print >> f; close(f)}}'" print line to file
 
 
-def request(prefix, input_file, out_dir, out_extension, log_dir, parallel=False):
+# bytes read from the input file at once
+block_size = 16 * 1024 * 1024
+# bytes of rows kept in memory before they are written
+buffer_size = 64 * 1024 * 1024
+# output files kept open at the same time
+max_open_files = 256
+# seconds between two progress messages
+progress_time = 30
+
+
+class OpenFiles:
     '''
-    VCF to VEP format using the plugin "split-vep" from bcftools.
+    Bounded pool of output files open for appending. When the pool is full,
+    the least recently used file is closed to open a new one.
+
+    Parameters
+    ----------
+    max_open : int
+        Maximum number of files open at the same time.
+    '''
+
+    def __init__(self, max_open=None):
+        self.max_open = max_open or max_open_files
+        self.files = OrderedDict()
+
+    def get(self, fn):
+        if fn in self.files:
+            self.files.move_to_end(fn)
+            return self.files[fn]
+        if len(self.files) >= self.max_open:
+            self.files.popitem(last=False)[1].close()
+        f = self.files[fn] = open(fn, 'ab')
+        return f
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files.clear()
+
+
+def read_blocks(f):
+    '''
+    Lines of a binary file, without the line end, read in large blocks.
+
+    Returns
+    -------
+    generator
+        list of the complete lines of every block.
+    '''
+    rest = b''
+    while True:
+        block = f.read(block_size)
+        if not block:
+            break
+        lines = (rest + block).split(b'\n')
+        rest = lines.pop()
+        yield lines
+    if rest:
+        yield [rest]
+
+
+class Partitions:
+    '''
+    Rows of a VEP table split into one file per value of a column. Rows
+    are kept in memory per output file and written in large blocks, with
+    a bounded number of open files.
 
     Parameters
     ----------
-    prefix : str
-        Ensembl ID prefix. Either ESNG or ENSP.
-    input_file : str
-        Path to infile.
     out_dir : str
         Path to output.
     out_extension : str
         Output filename extension
+    header : bytes
+        Header line, written before the first rows of every file in a run.
+    append_header : bool
+        Write the header also before the rows appended to a file that
+        already exists, as the awk split did. Otherwise only new files
+        get the header.
+    '''
 
-    Returns
-    -------
-    ./dir
-        Directory containing splitted files.
+    def __init__(self, out_dir, out_extension, header, append_header=True):
+        self.out_dir = os.fsencode(out_dir)
+        self.out_extension = os.fsencode(out_extension)
+        self.header = header
+        self.append_header = append_header
+        self.files = OpenFiles()
+        self.buffers = {}
+        self.seen = set()
+        self.buffered = 0
+
+    def path(self, key):
+        return os.path.join(self.out_dir, key + b'.' + self.out_extension)
+
+    def lines(self, key):
+        # rows of a file waiting to be written
+        lines = self.buffers.get(key)
+        if lines is None:
+            lines = self.buffers[key] = []
+            if key not in self.seen:
+                self.seen.add(key)
+                if self.append_header or not os.path.exists(self.path(key)):
+                    lines.append(self.header)
+        return lines
+
+    def add(self, key, line):
+        self.lines(key).append(line)
+        self.buffered += len(line)
+
+    def extend(self, key, lines):
+        self.lines(key).extend(lines)
+        self.buffered += sum(map(len, lines))
+
+    def full(self):
+        return self.buffered >= buffer_size
+
+    def flush(self):
+        # one write per output file
+        for key, lines in self.buffers.items():
+            self.files.get(self.path(key)).write(b'\n'.join(lines) + b'\n')
+        self.buffers.clear()
+        self.buffered = 0
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.files.close()
+
+
+def find_column(header, name):
     '''
-    # log file
-    logger = get_logger('split', log_dir)
-    logger.info('Splitting input file.')
+    Position (starting at 0) of the first column of the header whose name
+    matches a pattern, None if there is none.
+    '''
+    for i, col in enumerate(header.split()):
+        if re.search(name.encode(), col):
+            return i
+    return None
 
-    # command
-    cmd1 = detect_column.format(input_file, prefix)
-    # execute subprocess
-    out1, err1 = call_subprocess(cmd1)
-    # error handling
-    if err1 is None and out1 != b'':
-        col_index_transcriptid = re.findall('\d+', out1.decode('utf8'))[0]
-        logger.info('This file contains gene ids')
-    else:
-        logger.error('This file could not be splitted')
-        raise IOError()
 
-    # command
-    cmd1_b = detect_column.format(input_file,'Gene')
-    # execute subprocess
-    out1_b, err1_b = call_subprocess(cmd1_b)
-    # error handling
-    if err1_b is None and out1_b != b'':
-        col_index_geneid = re.findall('\d+', out1_b.decode('utf8'))[0]
-        logger.info('This file contains gene ids')
-    else:
+def header_columns(header, prefix, logger):
+    '''
+    Positions of the column to split on and of the columns of the index,
+    read from the header line.
+
+    Returns
+    -------
+    int
+        column to split on.
+    list
+        columns of variants.index. Existing_variation is None if the
+        file does not have it.
+    '''
+    key = find_column(header, prefix)
+    gene = find_column(header, 'Gene')
+    if key is None or gene is None:
         logger.error('This file could not be splitted')
         raise IOError()
-
-    # command
-    cmd2 = detect_column.format(input_file, 'Uploaded_variation')
-    # execute subprocess
-    out2, err2 = call_subprocess(cmd2)
-    # error handling
-    if err2 is None and out2 != b'':
-        col_index_varid = re.findall('\d+', out2.decode('utf8'))[0]
-        logger.info('\'Uploaded_variation\' column found.')
-    else:
+    logger.info('This file contains gene ids')
+    varid = find_column(header, 'Uploaded_variation')
+    if varid is None:
         logger.error('This file cannot be indexed. \
             Does not contain \'Uploaded_variation\' column with variants ids.')
         raise IOError()
-    
-
-    # command
-    cmd3 = detect_column.format( input_file,'Existing_variation')
-    # execute subprocess
-    out3, err3 = call_subprocess(cmd3)
-    # error handling
-    if err3 is None and out3 != b'':
-        col_index_namevarid = str(re.findall('\d+', out3.decode('utf8'))[0]) #', $' + \
-            
-        logger.info('\'Existing_variation\' columnd found.')
-    else:
-        # if 'Existing_variation' column does not exist
-        col_index_namevarid = ' '
+    logger.info('\'Uploaded_variation\' column found.')
+    existing = find_column(header, 'Existing_variation')
+    if existing is None:
         logger.error(
             'This file will be indexed without the column \'Existing_variation\' wich contains variants ids.')
-
-    # detect if there is output
-    # stop if no ENSG id detected
-    if col_index_geneid != '':
-        # command to split files
-        if parallel is True:
-            cmd4 = split_cmd_parallel.format(
-                input_file, col_index_transcriptid, out_dir, out_extension)
-
-        else:
-            cmd4 = split_cmd.format(
-                input_file, col_index_transcriptid, out_dir, out_extension)
-        # register process
-        out4, err4 = call_subprocess(cmd4)
-        # error handling
-        if err4 is None:
-            logger.info('This file was splitted successfully')
-        else:
-            logger.error('This file could not be splitted')
-            raise IOError()
-
-        # create index file
-        cmd5 = index_file.format(input_file,
-                                 col_index_varid,
-                                 col_index_geneid,
-                                 col_index_transcriptid,
-                                 col_index_namevarid,
-                                 os.path.join(out_dir, 'variants.index'))
-        # register process
-        out5, err5 = call_subprocess(cmd5)
-        # error handling
-        if err5 is None:
-            logger.info('This file was indexed correctly.')
-        else:
-            logger.error('This file could not be indexed')
-            raise IOError()
     else:
-        logger.error('The input file has zero gene entries.')
+        logger.info('\'Existing_variation\' columnd found.')
+    return key, [varid, gene, key, existing]
+
+
+def split_file(input_file, prefix, out_dir, out_extension, logger):
+    '''
+    Split a VEP file into one file per value of a column and write the
+    variants index, in a single pass over the file. The columns are found
+    in the header line. Rows are kept in memory per output file and
+    written in large blocks, with a bounded number of open files.
+
+    The output is the same as with the previous awk pipeline: '##' lines
+    are skipped, the header (without its leading '#') is written once per
+    run at the beginning of every file, rows are appended to existing
+    files and fields are separated by any whitespace.
+
+    Parameters
+    ----------
+    input_file : str
+        Path to infile.
+    prefix : str
+        Name of the column to split on, e.g. 'Feature'.
+    out_dir : str
+        Path to output.
+    out_extension : str
+        Output filename extension
+
+    Returns
+    -------
+    int
+        number of rows split.
+    int
+        number of bytes read.
+    '''
+    index_fn = os.path.join(out_dir, 'variants.index')
+    parts = None
+    rows = 0
+    start = last = time.time()
+    with open(input_file, 'rb') as f, open(index_fn, 'wb') as index:
+        try:
+            for lines in read_blocks(f):
+                index_lines = []
+                for line in lines:
+                    # same lines as grep -v '##'
+                    if b'##' in line:
+                        continue
+                    if parts is None:
+                        i, cols = header_columns(line, prefix, logger)
+                        # the index has an empty last column if there is
+                        # no Existing_variation column
+                        missing = b' ' if cols[-1] is None else b''
+                        cols = [c for c in cols if c is not None]
+                        n_split = max(cols) + 1
+                        get_index = itemgetter(*cols)
+                        parts = Partitions(out_dir, out_extension,
+                                           line[1:] if line.startswith(b'#') else line)
+                        index_lines.append(b' '.join(get_index(line.split())) + missing)
+                        continue
+                    fields = line.split(None, n_split)
+                    if len(fields) >= n_split:
+                        key = fields[i]
+                        index_lines.append(b' '.join(get_index(fields)) + missing)
+                    else:
+                        # short rows, missing fields are empty
+                        key = fields[i] if len(fields) > i else b''
+                        index_lines.append(b' '.join(
+                            fields[c] if len(fields) > c else b''
+                            for c in cols) + missing)
+                    parts.add(key, line)
+                    rows += 1
+                if index_lines:
+                    index.write(b'\n'.join(index_lines) + b'\n')
+                if parts is not None and parts.full():
+                    parts.flush()
+                if time.time() - last >= progress_time:
+                    last = time.time()
+                    logger.info(progress(rows, f.tell(), last - start))
+        finally:
+            if parts is not None:
+                parts.close()
+        n_bytes = f.tell()
+    if parts is None:
+        logger.error('This file could not be splitted')
+        raise IOError()
+    logger.info(progress(rows, n_bytes, time.time() - start) + ' ' +
+                str(len(parts.seen)) + ' files written.')
+    return rows, n_bytes
+
+
+def progress(rows, n_bytes, elapsed):
+    elapsed = max(elapsed, 1e-6)
+    return '{:,} rows split ({:,.0f} rows/s, {:.1f} MB/s).'.format(
+        rows, rows / elapsed, n_bytes / 1e6 / elapsed)
+
+
+def request(prefix, input_file, out_dir, out_extension, log_dir, parallel=False):
+    '''
+    Split a VEP file by transcript and index its variant ids.
+
+    Parameters
+    ----------
+    prefix : str
+        Name of the column to split on, e.g. 'Feature'.
+    input_file : str
+        Path to infile.
+    out_dir : str
+        Path to output.
+    out_extension : str
+        Output filename extension
+
+    Returns
+    -------
+    ./dir
+        Directory containing splitted files and variants.index.
+    '''
+    # log file
+    logger = get_logger('split', log_dir)
+    logger.info('Splitting input file.')
+    # the file is read once: the columns are found in the header, and
+    # the split and the index are written at the same time. The split is
+    # bound by the writes, so it is not run in parallel
+    try:
+        rows, n_bytes = split_file(input_file, prefix, out_dir,
+                                   out_extension, logger)
+    except IOError as e:
+        if str(e):
+            logger.error('This file could not be splitted: ' + str(e))
         raise IOError()
+    logger.info('This file was splitted successfully')
+    logger.info('This file was indexed correctly.')
+    logger.info('{:,} bytes of {} read in one pass (file size {:,} bytes).'.format(
+        n_bytes, input_file, os.path.getsize(input_file)))
 
 
 # add decorator to main function
@@ -1,17 +1,258 @@
 # -*- coding: utf-8 -*-
 # import necessary modules
+import gzip
 import os
 import os.path
+import shlex
+import shutil
+import tempfile
 import time
 import subprocess
 import sys
+from itertools import islice
+from multiprocessing import Pool
+import pandas as pd
 from .decorator import tags
 from timeit import default_timer as timer
 from .logger import get_logger
 
 
+# shell command to execute bcftools (bash)
+bcftools = "bcftools \
++split-vep {} \
+-o {} \
+-f '%CHROM\_%POS\_%REF\/%ALT \
+%CHROM:%POS %Allele %Gene %Feature %Feature_type %Consequence %cDNA_position \
+%CDS_position %Protein_position %Amino_acids %Codons %Existing_variation\\n' \
+-A tab -d"
+
+# records of every shard of a vcf file that is not indexed
+shard_records = 200000
+
+# columns of the vep file. The first two are built from the vcf record,
+# the rest are taken from the fields of the CSQ annotation
+vep_columns = ['Uploaded_variation', 'Location', 'Allele', 'Gene',
+               'Feature', 'Feature_type', 'Consequence', 'cDNA_position',
+               'CDS_position', 'Protein_position', 'Amino_acids', 'Codons',
+               'Existing_variation']
+# records converted at once by the python engine
+chunk_records = 100000
+
+
+def contigs(input_file):
+    '''
+    Contigs with records of a bgzipped vcf file, in the order of its index.
+
+    Returns
+    -------
+    list
+        contig names. None if the file is not bgzipped and indexed.
+    '''
+    if not input_file.endswith('.gz') or not any(
+            os.path.isfile(input_file + ext) for ext in ['.tbi', '.csi']):
+        return None
+    p = subprocess.run('bcftools index -s ' + shlex.quote(input_file),
+                       shell=True, stdout=subprocess.PIPE,
+                       stderr=subprocess.DEVNULL)
+    if p.returncode != 0:
+        return None
+    return [line.split('\t')[0] for line in p.stdout.decode().splitlines()
+            if line]
+
+
+def write_shards(input_file, shard_dir):
+    '''
+    Split a vcf file that is not indexed into files of shard_records
+    records, each with the header of the file.
+
+    Returns
+    -------
+    list
+        paths of the shards, in the order of the records.
+    '''
+    opener = gzip.open if input_file.endswith('.gz') else open
+    shards = []
+    header = []
+    out = None
+    with opener(input_file, 'rb') as f:
+        for line in f:
+            if line.startswith(b'#'):
+                header.append(line)
+                continue
+            if out is None or n == shard_records:
+                if out is not None:
+                    out.close()
+                shards.append(os.path.join(
+                    shard_dir, 'shard_{:05d}.vcf'.format(len(shards))))
+                out = open(shards[-1], 'wb')
+                out.writelines(header)
+                n = 0
+            out.write(line)
+            n += 1
+    if out is not None:
+        out.close()
+    return shards
+
+
+def convert_shard(task):
+    # run bcftools on one contig or file of the input
+    input_file, region, out_file = task
+    cmd = bcftools.format(input_file, out_file)
+    if region is not None:
+        cmd += ' -r ' + shlex.quote(region)
+    p = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE,
+                       stderr=subprocess.STDOUT)
+    return p.returncode, p.stdout.decode(errors='replace')
+
+
+def request_parallel(input_file, out_dir, out_file, logger, jobs=None):
+    '''
+    Convert a vcf file to vep format with several bcftools processes, one
+    per contig if the file is bgzipped and indexed, or one per block of
+    records otherwise. The outputs are concatenated in the order of the
+    input.
+    '''
+    jobs = int(jobs) if jobs else os.cpu_count()
+    shard_dir = tempfile.mkdtemp(prefix='vcf2vep_', dir=out_dir)
+    try:
+        regions = contigs(input_file)
+        if regions is not None:
+            tasks = [(input_file, r, os.path.join(shard_dir, '{:05d}.vep'.format(i)))
+                     for i, r in enumerate(regions)]
+            logger.info('Converting ' + str(len(tasks)) + ' contigs with ' +
+                        str(jobs) + ' processes.')
+        else:
+            shards = write_shards(input_file, shard_dir)
+            tasks = [(f, None, f[:-len('.vcf')] + '.vep') for f in shards]
+            logger.info('Converting ' + str(len(tasks)) + ' blocks of ' +
+                        str(shard_records) + ' records with ' + str(jobs) +
+                        ' processes.')
+        with open(out_file, 'wb') as out, Pool(jobs) as pool:
+            # results come in the order of the tasks, so every shard is
+            # appended once the previous ones are
+            for task, (code, msg) in zip(tasks, pool.imap(convert_shard, tasks)):
+                if code != 0:
+                    logger.error(msg)
+                    raise IOError()
+                if os.path.isfile(task[2]):
+                    with open(task[2], 'rb') as f:
+                        shutil.copyfileobj(f, out, 16 * 1024 * 1024)
+                    os.remove(task[2])
+    finally:
+        shutil.rmtree(shard_dir, ignore_errors=True)
+
+
+def csq_format(f):
+    '''
+    Read the header of a vcf file annotated with VEP.
+
+    Parameters
+    ----------
+    f : file object
+        vcf file opened in text mode. After the call the file is positioned
+        at the first record.
+
+    Returns
+    -------
+    list
+        names of the fields of the CSQ annotation. IOError is raised if
+        the header does not describe it.
+    '''
+    fields = None
+    for line in f:
+        if line.startswith('##INFO=<ID=CSQ,'):
+            fields = line.split('Format: ', 1)[-1].split('"')[0].split('|')
+        elif line.startswith('#CHROM'):
+            break
+    if fields is None:
+        raise IOError('The header has no CSQ annotation.')
+    return fields
+
+
+def csq_records(task):
+    '''
+    Convert vcf records to vep format: one line per CSQ entry, with the
+    columns in vep_columns. Empty values are written as '.', as
+    bcftools +split-vep does. Records without CSQ annotation are skipped.
+
+    Parameters
+    ----------
+    task : tuple
+        list of record lines and names of the CSQ fields.
+
+    Returns
+    -------
+    str
+        lines in vep format.
+    '''
+    lines, fields = task
+    records = pd.Series(lines).str.rstrip('\n').str.split('\t', n=8, expand=True)
+    if records.shape[1] < 8:
+        return ''
+    csq = records[7].str.extract(r'(?:^|;)CSQ=([^;]*)', expand=False)
+    annotated = csq.notna().values
+    records = records[annotated]
+    # one row per transcript and allele
+    entries = csq[annotated].str.split(',').explode()
+    if entries.empty:
+        return ''
+    values = entries.str.split('|', expand=True)
+    values = values.reindex(columns=range(len(fields)))
+    values.columns = fields
+    values = values.reset_index(drop=True)
+    records = records.loc[entries.index].reset_index(drop=True)
+    out = [records[0] + '_' + records[1] + '_' + records[3] + '/' + records[4],
+           records[0] + ':' + records[1]]
+    for c in vep_columns[2:]:
+        if c in values.columns:
+            out.append(values[c].fillna('').replace('', '.'))
+        else:
+            out.append(pd.Series('.', index=values.index))
+    return '\n'.join(out[0].str.cat(out[1:], sep=' ')) + '\n'
+
+
+def read_chunks(f):
+    # record lines of the vcf file, chunk_records at a time
+    while True:
+        chunk = list(islice(f, chunk_records))
+        if not chunk:
+            return
+        yield chunk
+
+
+def request_python(input_file, out_file, logger, parallel=False, jobs=None):
+    '''
+    Convert a vcf file annotated with VEP to vep format without bcftools.
+    The CSQ fields are read from the header and the records are converted
+    in chunks, in parallel processes if requested. The header of the vep
+    file is written first, so the file is not rewritten to add it.
+    '''
+    opener = gzip.open if input_file.endswith('.gz') else open
+    n = 0
+    with opener(input_file, 'rt') as f, open(out_file, 'w') as out:
+        fields = csq_format(f)
+        out.write(' '.join(vep_columns) + '\n')
+        if parallel is True:
+            jobs = int(jobs) if jobs else os.cpu_count()
+            chunks = read_chunks(f)
+            with Pool(jobs) as pool:
+                # a few chunks per process are read at a time
+                while True:
+                    window = list(islice(chunks, 2 * jobs))
+                    if not window:
+                        break
+                    for text in pool.map(csq_records, [(c, fields) for c in window]):
+                        out.write(text)
+                    n += sum(len(c) for c in window)
+        else:
+            for chunk in read_chunks(f):
+                out.write(csq_records((chunk, fields)))
+                n += len(chunk)
+    logger.info(str(n) + ' records converted.')
+
+
 # define request function to avoid repeating code
-def request(input_file, out_dir, out_file, log_dir, parallel=False):
+def request(input_file, out_dir, out_file, log_dir, parallel=False, jobs=None, engine='python'):
     '''
     VCF to VEP format using the plugin "split-vep" from bcftools.
 
@@ -23,40 +264,51 @@ def request(input_file, out_dir, out_file, log_dir, parallel=False):
         Path to output.
     out_file : str        
         Name of the output file. 
+    parallel : bool
+        Convert the contigs, or blocks of records, of the file in parallel
+        processes.
+    jobs : int
+        Number of processes. Default is the number of cpus.
+    engine : str
+        'python' to extract the CSQ annotation in this process, or
+        'bcftools' to use bcftools +split-vep.
 
     Returns
     -------
     converted_vcf.vep 
-        Converted file.
+        Converted file. With the python engine, the header is already
+        written.
     '''
+    # log file
+    logger = get_logger('vcf2vep', log_dir)
+    if engine == 'python':
+        logger.info('Extracting the CSQ annotation to convert vcf file to vep format.')
+        start = timer()
+        try:
+            request_python(input_file, out_file, logger, parallel, jobs)
+        except (IOError, UnicodeDecodeError) as e:
+            logger.error(
+                'Something went wrong converting the vcf file into vep format: ' + str(e))
+            raise IOError()
+        logger.info('File in vcf format converted successfully to vep format in ' +
+                    '{:.1f} s.'.format(timer() - start))
+        return
+
     # export enviroment
     os.environ["BCFTOOLS_PLUGINS"] = "%s/bin/" % os.environ.get(
         'VIRTUAL_ENV', '/usr/local/')
 
-    # shell command to execute bcftools (bash)
-    bcftools = "bcftools \
-+split-vep {} \
--o {} \
--f '%CHROM\_%POS\_%REF\/%ALT \
-%CHROM:%POS %Allele %Gene %Feature %Feature_type %Consequence %cDNA_position \
-%CDS_position %Protein_position %Amino_acids %Codons %Existing_variation\\n' \
--A tab -d"
+    logger.info('Using bcftools to convert vcf file to vep format.')
 
-    bcftools_parallel = "parallel --pipe -q bcftools \
-+split-vep {} \
--o {} \
--f '%CHROM\_%POS\_%REF\/%ALT \
-%CHROM:%POS %Allele %Gene %Feature %Feature_type %Consequence %cDNA_position \
-%CDS_position %Protein_position %Amino_acids %Codons %Existing_variation\\n' \
--A tab -d"
-    # add input variables to command line
     if parallel is True:
-        cmd = bcftools.format(input_file, out_file)
-    else:
-        cmd = bcftools.format(input_file, out_file)
-    # log file
-    logger = get_logger('vcf2vep', log_dir)
-    logger.info('Using bcftools to convert vcf file to vep format.')
+        start = timer()
+        request_parallel(input_file, out_dir, out_file, logger, jobs)
+        logger.info('File in vcf format converted successfully to vep format in ' +
+                    '{:.1f} s.'.format(timer() - start))
+        return
+
+    # add input variables to command line
+    cmd = bcftools.format(input_file, out_file)
 
     # execute subprocess
     p = subprocess.Popen(cmd, stdout=subprocess.PIPE,
@@ -78,9 +330,10 @@ def request(input_file, out_dir, out_file, log_dir, parallel=False):
       text_succeed="Converting vcf to vep...done.\n",
       text_fail="Converting vcf to vep...failed!\n",
       emoji="\U0001F504 ")
-def vcf2vep(input_file, out_dir, out_file, overwrite, log_dir, parallel=False):
+def vcf2vep(input_file, out_dir, out_file, overwrite, log_dir, parallel=False, jobs=None, engine='python'):
     '''
-    VCF to VEP format using the plugin "split-vep" from bcftools.
+    VCF to VEP format, extracting the CSQ annotation in python or using
+    the plugin "split-vep" from bcftools.
 
     Parameters
     ----------
@@ -92,6 +345,12 @@ def vcf2vep(input_file, out_dir, out_file, overwrite, log_dir, parallel=False):
         Name of the output file.
     overwrite : str
         Force to overwrite. Default is yes.
+    parallel : bool
+        Convert the file in several processes.
+    jobs : int
+        Number of processes. Default is the number of cpus.
+    engine : str
+        'python' or 'bcftools'.
 
     Returns
     -------
@@ -104,6 +363,6 @@ def vcf2vep(input_file, out_dir, out_file, overwrite, log_dir, parallel=False):
     # execute function
     if os.path.isfile(out_file):
         if overwrite is True:
-            request(input_file, out_dir, out_file, log_dir, parallel=False)
+            request(input_file, out_dir, out_file, log_dir, parallel, jobs, engine)
     else:
-        request(input_file, out_dir, out_file, log_dir, parallel=False)
+        request(input_file, out_dir, out_file, log_dir, parallel, jobs, engine)
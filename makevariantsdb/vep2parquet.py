@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+# import necessary modules
+import os
+import os.path
+import shutil
+import zlib
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .decorator import tags
+from .logger import get_logger
+
+# variants are distributed by transcript id into a fixed number of hash
+# buckets. mapper.db_parser uses the same values to find the bucket of a
+# transcript, so they must not be changed once a database has been created.
+n_buckets = 256
+bucket_dir = 'vardb_{:03d}'
+# number of rows read from the input file at once
+chunksize = 500000
+# columns stored in variants.index
+index_cols = ['Uploaded_variation', 'Gene', 'Feature', 'Existing_variation']
+# variants databases cleared by this process. A database is overwritten
+# once per run, the next input files of the run are added to it
+cleared = set()
+
+
+def bucket(feature_id):
+    '''
+    Hash bucket of an Ensembl transcript id.
+
+    Parameters
+    ----------
+    feature_id : str
+        Ensembl transcript id (column 'Feature' of the VEP file).
+
+    Returns
+    -------
+    int
+        Bucket number between 0 and n_buckets - 1.
+    '''
+    return zlib.crc32(str(feature_id).encode('utf-8')) % n_buckets
+
+
+def read_header(f):
+    '''
+    Skip the '##' meta lines of a VEP file and return its column names.
+
+    Parameters
+    ----------
+    f : file object
+        VEP file opened in text mode. After the call the file is positioned
+        at the first data line.
+
+    Returns
+    -------
+    list
+        Column names, without the leading '#'.
+    '''
+    for line in f:
+        if not line.startswith('##'):
+            return line.lstrip('#').split()
+    raise IOError()
+
+
+def write_buckets(chunk, schema, writers, out_dir):
+    '''
+    Append a chunk of variants to the parquet files of their buckets.
+
+    Parameters
+    ----------
+    chunk : DataFrame
+        Variants with the columns of the schema, as text.
+    schema : pyarrow.Schema
+        Columns of the dataset.
+    writers : dict
+        Open parquet writers by bucket. Writers of new buckets are added
+        to it and must be closed by the caller.
+    out_dir : str
+        Path to output.
+    '''
+    cols = schema.names
+    # assign bucket once per transcript instead of once per row
+    transcripts = chunk['Feature'].unique()
+    buckets = dict(zip(transcripts, map(bucket, transcripts)))
+    chunk = chunk.assign(_bucket=chunk['Feature'].map(buckets))
+    # sorting by transcript keeps row group statistics tight,
+    # so a transcript lookup only reads its row groups
+    chunk.sort_values(['_bucket', 'Feature'], kind='mergesort', inplace=True)
+    for b, sub in chunk.groupby('_bucket', sort=False):
+        if b not in writers:
+            dest = os.path.join(out_dir, bucket_dir.format(b))
+            os.makedirs(dest, exist_ok=True)
+            fn = os.path.join(
+                dest, 'part-{:05d}.parquet'.format(len(os.listdir(dest))))
+            writers[b] = pq.ParquetWriter(fn, schema)
+        table = pa.Table.from_pandas(sub[cols], schema=schema,
+                                     preserve_index=False)
+        writers[b].write_table(table)
+
+
+def clear_vardb(out_dir):
+    '''
+    Remove the variants of a database before it is overwritten: parquet
+    buckets, split files and variants index. Only the first call of a run
+    for a directory removes them.
+
+    Parameters
+    ----------
+    out_dir : str
+        Path to the variants database.
+    '''
+    out_dir = os.path.abspath(out_dir)
+    if out_dir in cleared:
+        return
+    cleared.add(out_dir)
+    for f in os.listdir(out_dir):
+        path = os.path.join(out_dir, f)
+        if f.startswith('vardb_') and os.path.isdir(path):
+            shutil.rmtree(path)
+        elif f.endswith('.vep') or f in ['variants.index', 'variants.index.parquet']:
+            os.remove(path)
+
+
+def request(input_file, out_dir, log_dir):
+    '''
+    Store a VEP file as a parquet dataset partitioned by transcript.
+
+    Parameters
+    ----------
+    input_file : str
+        Path to infile.
+    out_dir : str
+        Path to output.
+
+    Returns
+    -------
+    ./dir
+        One directory per hash bucket containing parquet files sorted by
+        transcript id, plus the variants.index file.
+    '''
+    # log file
+    logger = get_logger('vep2parquet', log_dir)
+    logger.info('Storing input file in parquet format.')
+
+    with open(input_file) as f:
+        cols = read_header(f)
+        if 'Feature' not in cols:
+            logger.error('This file could not be splitted. '
+                         'Column \'Feature\' not found.')
+            raise IOError()
+        # every column is kept as text: positions in VEP files are ranges
+        # (e.g. '120-125') and missing values are '-'. Parquet dictionary
+        # encodes the repeated values on disk.
+        schema = pa.schema([(c, pa.string()) for c in cols])
+        # variants index, same layout as the one created by split.py
+        idx_cols = [c for c in index_cols if c in cols]
+        index_file = os.path.join(out_dir, 'variants.index')
+        write_index_header = not os.path.isfile(index_file)
+        writers = {}
+        n_rows = 0
+        try:
+            for chunk in pd.read_csv(f, sep=r'\s+', header=None, names=cols,
+                                     dtype=str, na_filter=False,
+                                     chunksize=chunksize):
+                write_buckets(chunk, schema, writers, out_dir)
+                # update index file
+                with open(index_file, 'a') as idx:
+                    chunk[idx_cols].to_csv(idx, sep=' ', index=False,
+                                           header=write_index_header)
+                write_index_header = False
+                n_rows += len(chunk)
+        finally:
+            for w in writers.values():
+                w.close()
+
+    logger.info(str(n_rows) + ' variants stored in ' +
+                str(len(writers)) + ' buckets.')
+
+
+# add decorator to main function
+@tags(text_start="Storing variants in parquet format...This might take up some time...",
+      text_succeed="Storing variants in parquet format...done.",
+      text_fail="Storing variants in parquet format...failed!",
+      emoji="\U00002702")
+def vep2parquet(input_file, out_dir, overwrite, log_dir):
+    '''
+    Store a VEP file as a parquet dataset partitioned by transcript.
+
+    Parameters
+    ----------
+    input_file : str
+        Path to infile.
+    out_dir : str
+        Path to output.
+    overwrite : str
+        Force to overwrite. Default is yes.
+
+    Returns
+    -------
+    ./dir
+        Directory containing the parquet dataset.
+    '''
+    # create dir if it doesn't exist
+    os.makedirs(out_dir, exist_ok=True)
+    # execute request function. New part files are added to the buckets,
+    # so the database is cleared first when it is overwritten
+    if any(f.startswith('vardb_') for f in os.listdir(out_dir)):
+
+        if overwrite is True:
+            clear_vardb(out_dir)
+            request(input_file, out_dir, log_dir)
+    else:
+        cleared.add(os.path.abspath(out_dir))
+        request(input_file, out_dir, log_dir)
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# import necessary modules
+import itertools
+import numpy as np
+import pandas as pd
+
+from .db_parser import multi_parser, categorize, concat_categorical
+from .explode import explode_psdb
+from .logger import get_logger
+from .mapper import filter_variants, filter_structures, map_positions, write_results
+from .mapper_wrapper import wrapper
+from .translate import translate
+
+
+def batch_mapper(ids, psdb, vardb, out_dir, pident, evalue, isoform, consequence, loc, index_file, dict_geneprot, csv=False, hdf=False, parquet=False):
+    '''
+    Map a list of Ensembl ids at once. The variants and structural features
+    of all the proteins are loaded together and joined in a single merge on
+    protein and position, instead of running mapper once per protein.
+
+    Parameters
+    ----------
+    ids : list
+        Ensembl protein/gene ids
+    psdb : str
+        Directory where to find interface database
+    vardb : str
+        Directory where to find positions database
+    out_dir : str
+        Output directory
+    pident : int
+        Thershold of sequence identity (percertage).
+    index_file : str
+        Variants index file, used for the ids that cannot be translated.
+
+    Returns
+    -------
+    setID.File
+        txt file containing a data frame two columns corresponding to the
+        analyzed interface id and the corresponding annotated genomic positions.
+    InterfacePositions
+        Same as setID.File but with additional information describing the
+        interfaces and the positions.
+    '''
+    # log files
+    logger = get_logger(' 3dmapper', out_dir)
+    wrapper_logger = get_logger('wrapper', out_dir)
+
+    # translate ensembl ids. Repeated ids are mapped once
+    rows = []
+    untranslated = []
+    for id in dict.fromkeys(ids):
+        try:
+            if id == '-':
+                raise IOError()
+            t = translate(id, out_dir, dict_geneprot, isoform)
+        except IOError:
+            untranslated.append(id)
+            continue
+        if 'APPRIS' in t.keys():
+            APPRIS = t['APPRIS']
+        else:
+            APPRIS = list(itertools.repeat(None, len(t['protID'])))
+        rows.extend(zip(itertools.repeat(id), t['protID'],
+                        t['transcriptID'], APPRIS))
+    proteins = pd.DataFrame(rows, columns=['id', 'Protein_accession',
+                                           'Feature', 'APPRIS'])
+    # a protein reached from several input ids is mapped once
+    proteins = proteins.drop_duplicates('Protein_accession')
+    proteins = proteins.reset_index(drop=True)
+
+    # parse the variants of all the transcripts
+    variants = multi_parser(list(proteins['Feature'].unique()), vardb,
+                            consequence=consequence)
+    frames = [variants[t] for t in proteins['Feature'] if t in variants]
+    annovars = None
+    if frames:
+        annovars = concat_categorical(frames)
+        annovars['Protein_accession'] = np.repeat(
+            [p for p, t in zip(proteins['Protein_accession'], proteins['Feature'])
+             if t in variants], [len(f) for f in frames])
+        cols = list(annovars.columns)
+        try:
+            annovars = filter_variants(annovars, consequence, None, logger)
+        except IOError:
+            annovars = None
+    if annovars is not None:
+        # filter_variants moves the expanded ranges to the end, so the
+        # variants are sorted back by protein
+        rank = pd.Series(proteins.index, index=proteins['Protein_accession'])
+        annovars = annovars.iloc[np.argsort(
+            annovars['Protein_accession'].map(rank).values, kind='mergesort')]
+        with_variants = set(annovars['Protein_accession'])
+    else:
+        with_variants = set()
+
+    # parse the structural features of all the proteins
+    structures = multi_parser(list(proteins['Protein_accession']), psdb)
+    psdfs = []
+    for prot_id in proteins['Protein_accession']:
+        if prot_id not in structures:
+            continue
+        psdf = structures[prot_id]
+        logger.info('Protein features file of ' + prot_id + ' parsed.')
+        # databases created with makepsdb --format parquet are already
+        # exploded, with one integer Protein_position per row
+        if psdf['Protein_position'].dtype.kind not in 'iu':
+            psdf = categorize(explode_psdb(psdf))
+        try:
+            psdfs.append(filter_structures(psdf, pident, evalue, logger))
+        except IOError:
+            continue
+    if psdfs:
+        psdf = concat_categorical(psdfs)
+        with_structure = set(psdf['Protein_accession'])
+    else:
+        psdf = None
+        with_structure = set()
+
+    # report proteins without variants
+    for id, prot_id in zip(proteins['id'], proteins['Protein_accession']):
+        if prot_id in with_variants:
+            continue
+        if prot_id in with_structure:
+            logger.error('Protein ' +
+                         prot_id + 'has no mapping positions.')
+        else:
+            logger.error('Protein ' +
+                         prot_id + 'could not be parsed.')
+        wrapper_logger.error(
+            ('Warning: {} has no mapping positions.'.format(id)))
+
+    # ids that cannot be translated are located by the per-id wrapper
+    for id in untranslated:
+        wrapper(id, psdb, vardb, out_dir, pident, evalue, isoform, consequence,
+                loc, index_file, dict_geneprot, None, csv, hdf, parquet)
+
+    if consequence is None:
+        consequence = ['all']
+    if isoform is None:
+        isoform = ['all']
+
+    if annovars is not None:
+        present = annovars['Protein_accession'].isin(with_structure)
+        # variants of proteins without structures are only reported
+        # when locating all the positions
+        if not loc:
+            annovars = annovars[present]
+            present = present[present]
+    if annovars is not None and annovars.empty is False:
+        appris = pd.Series(proteins['APPRIS'].values,
+                           index=proteins['Protein_accession'])
+        annovars['APPRIS_isoform'] = pd.Categorical(np.where(
+            present, annovars['Protein_accession'].map(appris), ''))
+        # same columns as in mapper, with the protein as last column
+        annovars = annovars[cols[:-1] + ['APPRIS_isoform', 'Protein_accession']]
+        annovars = annovars.reset_index(drop=True)
+
+        results, mapped = map_positions(annovars, psdf, loc)
+        write_results(results, out_dir, pident, isoform,
+                      consequence, csv, hdf, parquet)
+        # report proteins with structures and no results
+        for prot_id in proteins['Protein_accession']:
+            if prot_id in with_structure and prot_id in with_variants and \
+                    prot_id not in mapped:
+                logger.warning('Warning: ' + prot_id +
+                               ' does not map with any annotated position.\n')
+
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+# import necessary modules
+import os
+import re
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Sequence Ontology terms of the VEP consequences and their parents
+so_table = os.path.join(os.path.dirname(__file__), 'data', 'so_terms.tsv')
+# separators of the terms of a Consequence value: ',' in VEP files and '&'
+# in the CSQ annotation of VCF files (bcftools +split-vep, vcf2vep.py)
+term_separator = re.compile('[,&]')
+
+
+def read_so_table(fn=so_table):
+    '''
+    Read the is_a relations of the Sequence Ontology table.
+
+    Returns
+    -------
+    dict
+        children of every term.
+    '''
+    children = {}
+    with open(fn) as f:
+        for line in f:
+            if line.startswith('#') or line.startswith('term\t'):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) != 3:
+                continue
+            term, accession, parents = fields
+            children.setdefault(term, [])
+            for parent in parents.split(','):
+                if parent != '-':
+                    children.setdefault(parent, []).append(term)
+    return children
+
+
+def descendants(terms, children):
+    '''
+    Terms and all their descendants in the ontology. Terms that are not in
+    the table are kept as they are.
+    '''
+    res = []
+    stack = list(reversed(terms))
+    while stack:
+        term = stack.pop()
+        if term in res:
+            continue
+        res.append(term)
+        stack.extend(reversed(children.get(term, [])))
+    return res
+
+
+class ConsequenceFilter:
+    '''
+    Filter of variants by consequence type, compiled once per run. The
+    values of the VEP 'Consequence' column are lists of Sequence Ontology
+    terms separated by ',' or '&'; a variant is kept if any of its terms is one
+    of the requested ones. Every distinct value is split and looked up
+    once, and the result is remembered for the next proteins.
+
+    Iterating over the filter gives the requested terms, as given in the
+    command line, so that it can be used wherever the list of
+    consequences is expected (e.g. in the output file names).
+
+    Parameters
+    ----------
+    consequence : list
+        Consequence types to keep.
+    expand : bool
+        Keep also the terms that descend from the requested ones in the
+        Sequence Ontology, e.g. missense_variant for
+        protein_altering_variant.
+    '''
+
+    def __init__(self, consequence, expand=False):
+        self.requested = list(consequence)
+        if expand:
+            self.terms = frozenset(descendants(self.requested, read_so_table()))
+        else:
+            self.terms = frozenset(self.requested)
+        # distinct values of the column already looked up
+        self.known = {}
+
+    def __iter__(self):
+        return iter(self.requested)
+
+    def __str__(self):
+        return str(self.requested)
+
+    def match(self, values):
+        '''
+        Whether every given value of the column has any of the requested
+        terms.
+        '''
+        res = np.empty(len(values), dtype=bool)
+        for i, value in enumerate(values):
+            if value not in self.known:
+                self.known[value] = not self.terms.isdisjoint(
+                    term_separator.split(str(value)))
+            res[i] = self.known[value]
+        return res
+
+    def mask(self, consequences):
+        '''
+        Variants of a data frame column with any of the requested terms.
+
+        Returns
+        -------
+        array
+            True for the selected variants.
+        '''
+        if not isinstance(consequences.dtype, pd.CategoricalDtype):
+            consequences = consequences.astype('category')
+        match = self.match(consequences.cat.categories)
+        # missing values have code -1, which selects the last (False) item
+        return np.append(match, False)[consequences.cat.codes.values]
+
+    def filter_table(self, table):
+        '''
+        Keep the rows of an arrow table with any of the requested terms,
+        before it is converted to a data frame. Every distinct value is
+        looked up with match, so its terms are split in the same way.
+        '''
+        if 'Consequence' not in table.column_names:
+            return table
+        column = table['Consequence']
+        values = pc.unique(column)
+        selected = values.filter(pa.array(self.match(values.to_pylist())))
+        return table.filter(pc.is_in(column, value_set=selected))
+
+
+def compile_consequences(consequence):
+    '''
+    Consequence filter for a list of consequence types, or the filter
+    itself if it is already compiled. None if no filter is requested.
+    '''
+    if consequence is None or isinstance(consequence, ConsequenceFilter):
+        return consequence
+    return ConsequenceFilter(consequence)
@@ -1,34 +1,221 @@
 # coding: utf-8
 import glob
+import zlib
+import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
 import os
+
+from .consequence import compile_consequences
 #import dask.dataframe as dd
 
+# layout of the parquet variants database created with
+# makevariantsdb --format parquet (see makevariantsdb/vep2parquet.py)
+n_buckets = 256
+bucket_dir = 'vardb_{:03d}'
+
+# types of the known columns of the protein structures (psdb) and
+# variants (VEP) files. Ids, packed positions ('49-52-61') and VEP fields
+# are read as text. Integer columns are left to the parser, so that
+# columns with missing values are still read (as float). Low-cardinality
+# columns, repeated in most rows, are read as categoricals
+psdb_dtypes = {'Protein_accession': str, 'Protein_position': str,
+               'Protein_aa': str, 'PDB_code': str, 'PDB_chain': 'category',
+               'PDB_3D_position': str, 'PDB_seq_position': str,
+               'PDB_aa': str, 'Evalue': 'float64',
+               'Protein_coverage': 'float64', 'Interaction_type': 'category',
+               'PDB_interacting_chain': str,
+               'PDB_interacting_3D_position': str,
+               'PDB_interacting_aa': str, 'Interface_min_distance': str,
+               'PDB_B_factor': str, 'PDB_interacting_B_factor': str,
+               'Chimera_3D_position': str,
+               'Chimera_interacting_position': str,
+               'Structure_feature_id': str}
+vep_dtypes = {'Uploaded_variation': str, 'Location': str, 'Allele': str,
+              'Gene': str, 'Feature': str, 'Feature_type': 'category',
+              'Consequence': 'category', 'cDNA_position': str,
+              'CDS_position': str, 'Protein_position': str,
+              'Amino_acids': str, 'Codons': str,
+              'Existing_variation': str}
+dtypes = dict(psdb_dtypes, **vep_dtypes)
+# columns carried as categoricals, including those added by the mapper
+category_columns = [c for c, t in dtypes.items() if t == 'category'] + \
+    ['APPRIS_isoform', 'Mapping_position']
+
+
+def categorize(df):
+    '''
+    Convert the low-cardinality columns of a data frame read from a parquet
+    file, or built by concatenating frames with different categories, to
+    categoricals.
+    '''
+    for c in category_columns:
+        if c in df.columns and not isinstance(df[c].dtype, pd.CategoricalDtype):
+            df[c] = df[c].astype('category')
+    return df
+
+
+def concat_categorical(frames):
+    '''
+    Concatenate data frames keeping their categorical columns. pd.concat
+    turns categoricals with different categories into object columns, so
+    the categories are unified first.
+    '''
+    frames = list(frames)
+    for c in category_columns:
+        columns = [f[c] for f in frames if c in f.columns]
+        if not columns or not all(isinstance(col.dtype, pd.CategoricalDtype)
+                                  for col in columns):
+            continue
+        categories = pd.Index(pd.unique(np.concatenate(
+            [col.cat.categories.values for col in columns])))
+        frames = [f.assign(**{c: f[c].cat.set_categories(categories)})
+                  if c in f.columns else f for f in frames]
+    return pd.concat(frames, ignore_index=True, sort=False)
+
+
+def bucket_parser(transcript_id, db_dir, consequence=None):
+    '''
+    Read the variants of one transcript from a parquet variants database.
+    Only the row groups of the transcript's hash bucket that may contain
+    the transcript are read, and the variants are filtered by consequence
+    before they are converted to a data frame.
+
+    Parameters
+    ----------
+    transcript_id : str
+        Ensembl transcript id
+    db_dir : str
+        directory where to find the database to parse
+    consequence : list or ConsequenceFilter
+        consequence types to keep. None to keep all.
+
+    Returns
+    -------
+    df
+        parsed variants
+    '''
+    b = zlib.crc32(str(transcript_id).encode('utf-8')) % n_buckets
+    d = os.path.join(db_dir, bucket_dir.format(b))
+    if not os.path.isdir(d):
+        raise IOError()
+    table = pq.read_table(d, filters=[('Feature', '=', transcript_id)])
+    if table.num_rows == 0:
+        raise IOError()
+    if consequence is not None:
+        table = compile_consequences(consequence).filter_table(table)
+    return table.to_pandas(categories=[c for c in category_columns
+                                       if c in table.column_names])
+
 
-def parser(prot_id, db_dir):
+def read_file(f):
+    '''
+    Read one file of a split database with the C parser. The header is
+    split on any whitespace, since it can be separated by spaces while
+    the rows are separated by tabs (see makevariantsdb/add_header.py).
+    Every column is read: all the variant and structure columns are
+    written to the output tables.
+
+    Parameters
+    ----------
+    f : str
+        path to a split text file or to a parquet file
+
+    Returns
+    -------
+    df
+        parsed file
+    '''
+    if f.endswith('.parquet'):
+        # protein structures file created with makepsdb --format parquet
+        return categorize(pd.read_parquet(f))
+    with open(f) as fh:
+        cols = fh.readline().lstrip('#').split()
+        line = fh.readline()
+    # a single fixed delimiter, detected on the first row
+    sep = '\t' if '\t' in line else ' '
+    try:
+        df = pd.read_csv(f, sep=sep, header=None, skiprows=1, names=cols,
+                         dtype={c: t for c, t in dtypes.items() if c in cols},
+                         engine='c')
+    except (ValueError, pd.errors.ParserError):
+        # rows with a different number of fields than the header or
+        # values that do not match the declared types
+        raise IOError()
+    return df
+
+
+def parser(prot_id, db_dir, consequence=None):
     '''
     Parse input and detect whether is a VCF or VEP file. Any other format
-    is invalid. 
+    is invalid.
 
     Parameters
     ----------
-    prot_id : str        
-        protein id 
+    prot_id : str
+        protein id
     db_dir : str
         directory where to find the database to parse
+    consequence : list or ConsequenceFilter
+        consequence types to keep when reading a parquet database, which
+        are filtered before building the data frame. Split text files are
+        read whole.
 
     Returns
     -------
-    df 
+    df
         parsed file
     '''
 
     f = glob.glob(os.path.join(db_dir, (prot_id + '.*')))
     if not f:
-        raise IOError()
+        # not a split text file, look for it in a parquet database
+        return bucket_parser(prot_id, db_dir, consequence)
     else:
-        try:
-            df = pd.read_csv(f[0], sep="\t| ", engine='python')
-        except:
-            df = pd.read_csv(f[0], sep=" ", engine='python')
-        return df
+        return read_file(f[0])
+
+
+def multi_parser(ids, db_dir, consequence=None):
+    '''
+    Parse the files of several ids at once. The directory is listed only
+    once and, in a parquet variants database, every bucket is read once
+    for all the requested transcripts it contains.
+
+    Parameters
+    ----------
+    ids : list
+        protein or transcript ids
+    db_dir : str
+        directory where to find the database to parse
+    consequence : list or ConsequenceFilter
+        consequence types to keep when reading a parquet database.
+
+    Returns
+    -------
+    dict
+        parsed data frame of every id found in the database
+    '''
+    files = {}
+    for f in os.listdir(db_dir):
+        files.setdefault(f.split('.')[0], os.path.join(db_dir, f))
+    res = {}
+    buckets = {}
+    for i in ids:
+        if i in files:
+            res[i] = read_file(files[i])
+        else:
+            b = zlib.crc32(str(i).encode('utf-8')) % n_buckets
+            buckets.setdefault(bucket_dir.format(b), []).append(i)
+    # ids not found as split files are looked for in the parquet buckets
+    for d, bucket_ids in buckets.items():
+        if d not in files:
+            continue
+        table = pq.read_table(files[d], filters=[
+                              ('Feature', 'in', set(bucket_ids))])
+        if consequence is not None:
+            table = compile_consequences(consequence).filter_table(table)
+        df = table.to_pandas(categories=[c for c in category_columns
+                                         if c in table.column_names])
+        for i, sub_df in df.groupby('Feature', sort=False):
+            res[i] = sub_df.reset_index(drop=True)
+    return res
@@ -8,7 +8,16 @@ from .input_isfile import isfile
 from .logger import get_logger
 from .decorator import tags
 from .mapper import mapper
+from .batch_mapper import batch_mapper
 from .translate import translate
+from .translate_index import translate_index
+from .varid_index import lookup_varids, group_by_transcript
+from .output_sink import OutputSink
+from .worker_pool import run_pool
+from .id_stream import MAPPED, StatusTable, read_ids, unique, blocks
+from .journal import Journal
+from .consequence import ConsequenceFilter
+from .writefile import close_parquet
 from .parse_argv import parse_commandline
 import sys
 import os
@@ -22,6 +31,7 @@ import time
 import os.path
 import datetime
 import shutil
+import tracemalloc
 
 
 import pandas as pd
@@ -34,8 +44,8 @@ from subprocess import call
 from tabulate import tabulate
 from joblib import Parallel, delayed, parallel_backend
 
-
-pd.options.mode.chained_assignment = None
+# ids sent to the parallel jobs at a time, per job
+block_size = 64
 
 class MapTools:
 
@@ -106,7 +116,11 @@ def out_file(out_dir, spinner):
 
 def dest_results(spinner, logger):
     args = parse_commandline()
-    if args.force is True:
+    if args.resume is True:
+        spinner.info(
+                text=' Resuming the run in directory ' + args.out + '. ')
+
+    elif args.force is True:
         fileList = glob.glob(os.path.join(args.out, 'setID*.txt'))
         # Iterate over the list of filepaths & remove each file.
         for filePath in fileList:
@@ -115,7 +129,7 @@ def dest_results(spinner, logger):
             except:
                 pass
         for item in os.listdir(args.out):
-            if item in ['hdf5', 'csv']:
+            if item in ['hdf5', 'csv', 'parquet']:
                 shutil.rmtree(os.path.join(args.out, item))
 
     elif args.append is True:
@@ -124,7 +138,7 @@ def dest_results(spinner, logger):
         
     else:
         for item in os.listdir(args.out):
-            if item in ['hdf5', 'csv']:
+            if item in ['hdf5', 'csv', 'parquet']:
                 logger.warning(
                     'Directory ' + args.out + ' is not empty. Not overwritting files. ' +
                     'Please select option --force or --append or specify a different output dir.')
@@ -171,6 +185,58 @@ def parallel(parallel, njobs):
         num_cores = njobs
     return(num_cores)
 
+def log_cache(hits, misses, logger):
+    # report the use of the cache of protein structures files
+    logger.info('Protein structures cache: ' + str(hits) + ' hits, ' +
+                str(misses) + ' misses.')
+
+
+def map_ids(items, num_cores, pool, common, outputs, psdb_cache_mb, sink):
+    '''
+    Map ids one by one, in parallel jobs or with a pool of workers. Ids
+    are read from items as they are mapped, so that at most a block of
+    ids per worker is held in memory.
+
+    Parameters
+    ----------
+    items : iterable
+        (id, varid) pairs to give to wrapper.
+    common : tuple
+        psdb, vardb, out_dir, pident, evalue, isoform, consequence, loc,
+        index_file and dict_geneprot arguments of wrapper.
+    outputs : tuple
+        csv, hdf and parquet arguments of wrapper.
+
+    Returns
+    -------
+    generator
+        (id, status, cache hits, cache misses) of every id, in input order.
+    '''
+    if sink is None:
+        for id, varid in items:
+            yield (id,) + wrapper(id, *common, varid, *outputs, psdb_cache_mb)
+    elif pool:
+        yield from run_pool(items, num_cores, common, outputs, psdb_cache_mb, sink)
+    else:
+        for block in blocks(items, block_size * num_cores):
+            # jobs run in parallel send their results to the writer process
+            tasks = [sink.task() for _ in block]
+            results = Parallel(n_jobs=num_cores)(
+                delayed(task.run)(wrapper, id, *common, varid, *outputs, psdb_cache_mb)
+                for task, (id, varid) in zip(tasks, block))
+            for (id, varid), result in zip(block, results):
+                yield (id,) + result
+
+
+def record(journal, sink, id, status):
+    # ids mapped by this process are journaled here, the writer process
+    # journals the ids of the parallel jobs
+    if sink is None:
+        journal.add(id, status)
+        if journal.due():
+            journal.checkpoint()
+
+
 def start_spinner(verbose, logger, time_format):
     start = time.time()
     logger.info('Running 3Dmapper...')
@@ -204,6 +270,7 @@ def main():
 
     result_format(args.hdf, args.out, 'hdf5', spinner, logger)
     result_format(args.csv, args.out, 'csv', spinner, logger)
+    result_format(args.parquet, args.out, 'parquet', spinner, logger)
 
     # set up the results report
     report = open(os.path.join(args.out, '3dmapper.report'), 'w')
@@ -224,147 +291,167 @@ def main():
     num_cores  = parallel(args.parallel, args.njobs)
 
     index_file = glob.glob(os.path.join(args.vardb, '*.index'))[0]
+    # build the ids translation index before starting the parallel jobs,
+    # so that every worker loads the same pickled index
+    translate_index(args.dict_geneprot)
+    if args.memory:
+        # trace allocations here and in the parallel workers to log the
+        # peak memory of every protein
+        os.environ['PYTHONTRACEMALLOC'] = '1'
+        tracemalloc.start()
     start= start_spinner(args.verbose, logger, time_format)
+    if args.prot_id and args.batch:
+        if args.resume:
+            logger.error('Batch mode runs can not be resumed.')
+            spinner.fail(' Batch mode runs can not be resumed.')
+            exit(-1)
+        journal = None
+    else:
+        # journal of the mapped ids, so that an interrupted run can be
+        # resumed, and status of every input id
+        journal = Journal(args.out)
+        if args.resume:
+            try:
+                done = journal.restore()
+            except IOError as e:
+                logger.error(str(e))
+                spinner.fail(' ' + str(e))
+                exit(-1)
+            logger.info('Resuming the run: ' + str(len(done)) +
+                        ' ids already mapped.')
+        else:
+            journal.start()
+            done = {}
+        status = StatusTable(args.out)
+        for id, id_status in done.items():
+            status.add(id, id_status)
+    # parallel jobs write their results through a single writer process,
+    # which keeps the journal. Batch mode maps all the ids in this process
+    # and writes its results itself
+    if num_cores is not None and num_cores != 1 and not (args.batch and args.prot_id):
+        sink = OutputSink(args.out, args.pident, args.isoform, args.consequence,
+                          journal)
+    else:
+        sink = None
+    # the consequence filter is compiled once for the whole run
+    if args.consequence is not None:
+        consequence = ConsequenceFilter(args.consequence, args.so_descendants)
+    else:
+        consequence = None
+    # arguments shared by all the ids, sent once to every worker of the pool
+    common = (args.psdb, args.vardb, args.out, args.pident, args.evalue,
+              args.isoform, consequence, args.loc, index_file,
+              args.dict_geneprot)
+    outputs = (args.csv, args.hdf, args.parquet)
     if args.varid:
-
-        # find positions index file
+        # collect the variant ids given in the command line or in files
+        var_ids = []
         for ids in args.varid:
-            # run PDBmapper
             if isfile(ids) == 'yes':
-                input = 'file'
                 with open(ids) as list_varids:
-                    for id in list_varids:
-                        # remove \n from the end
-                        id = id.replace('\n', '')
-                        # grep position in index file created with makepositionsdb
-                        cmd = ('grep \'\\b{}\\b\' {}').format(id, index_file)
-                        out, err = call_subprocess(cmd)
-                        if err is None and out != b'':
-                            toprocess = out.decode('utf-8')
-                            transcriptid = [s for s in toprocess.split(
-                                " ") if 'ENST' in s]
-
-                            Parallel(n_jobs=num_cores)(delayed(wrapper)(t,
-                                                                        args.psdb,
-                                                                        args.vardb,
-                                                                        args.out,
-                                                                        args.pident,
-                                                                        args.evalue,
-                                                                        args.isoform,
-                                                                        args.consequence,
-                                                                        args.loc,
-                                                                        index_file,
-                                                                        args.dict_geneprot,
-                                                                        #args.uniprot,
-                                                                        id,
-                                                                        args.csv,
-                                                                        args.hdf)
-                                                       for t in transcriptid)
-                        else:
-                            logger.error(
-                                'Wrong input: {} is not a recognizable position id'.format(id))
-                            continue
-
+                    # remove \n from the end
+                    var_ids.extend(id.replace('\n', '') for id in list_varids)
             elif isfile(ids) == "no":
-                cmd = ('grep \'\\b{}\\b\' {}').format(ids, index_file)
-                # call subprocess
-                out, err = call_subprocess(cmd)
-                if err is None and out != b'':
-                    toprocess = out.decode('utf-8').split(" ")
-                    # geneid correspond to the 2nd column in the line
-                    transcriptid = [
-                        s for s in toprocess if ('ENST' or '-') in s]
-                    if any(transcriptid) is False and len(toprocess) > 0:
-                        transcriptid = ['-']
-                    Parallel(n_jobs=num_cores)(delayed(wrapper)(t,
-                                                                args.psdb,
-                                                                args.vardb,
-                                                                args.out,
-                                                                args.pident,
-                                                                args.evalue,
-                                                                args.isoform,
-                                                                args.consequence,
-                                                                args.loc,
-                                                                index_file,
-                                                                args.dict_geneprot,
-                                                               # args.uniprot,
-                                                                ids,
-                                                                args.csv,
-                                                                args.hdf)
-                                               for t in transcriptid)
-                else:
-                    logger.error(
-                        'Wrong input: {} is not a recognizable position id'.format(id))
-                    continue
-
+                var_ids.append(ids)
             else:
                 logger.error(
                     'The input positions ids provided are not in a valid format.')
                 spinner.fail(" Running 3Dmapper...failed!")
                 report.write(time_format + " Running 3Dmapper...failed!")
                 raise IOError
-            finish_message(logger, report, time_format, start, spinner)
+        # find the transcripts of all the variant ids in one pass over the
+        # variants index created with makevariantsdb
+        transcripts = lookup_varids(var_ids, args.vardb)
+        for id in var_ids:
+            if id not in transcripts:
+                logger.error(
+                    'Wrong input: {} is not a recognizable position id'.format(id))
+        # map every transcript once with all its requested variants
+        groups = group_by_transcript(var_ids, transcripts)
+        # run PDBmapper, recording the status of every transcript
+        groups = ((t, ids) for t, ids in groups.items() if t not in done)
+        for t, t_status, hits, misses in map_ids(groups, num_cores, args.pool,
+                                                 common, outputs, args.psdb_cache, sink):
+            status.add(t, t_status, hits, misses)
+            record(journal, sink, t, t_status)
+        if sink is None:
+            journal.checkpoint()
+        status.close()
+        if sink is not None:
+            sink.close()
+        close_parquet()
+        log_cache(status.hits, status.misses, logger)
+        logger.info(status.summary())
+        report.write(time_format + status.summary() + '\n')
+        finish_message(logger, report, time_format, start, spinner)
 
-    if args.prot_id:
-        # PDBmapper accepts single or multiple protein ids
-        # as input as well as prot ids stored in a file
+    if args.prot_id and args.batch:
+        # collect the ids given in the command line or in files and
+        # map them all at once
+        batch_ids = []
         for ids in args.prot_id:
-            # check if input is a file
             if isfile(ids) == "yes":
-                input = 'file'
                 with open(ids) as list_prot_ids:
-                    logger.info(
-                        'Input positions file contains a list of ensembl ids to process.')
-                    # for every ensembl id
-                    Parallel(n_jobs=num_cores)(delayed(wrapper)(prot_id.replace('\n', ''),
-                                                                args.psdb,
-                                                                args.vardb,
-                                                                args.out,
-                                                                args.pident,
-                                                                args.evalue,
-                                                                args.isoform,
-                                                                args.consequence,
-                                                                args.loc,
-                                                                index_file,
-                                                                args.dict_geneprot,
-                                                               # args.uniprot,
-                                                                None,
-                                                                args.csv,
-                                                                args.hdf)
-                                               for prot_id in list_prot_ids)
-
-            # given in command line
+                    batch_ids.extend(prot_id.replace('\n', '')
+                                     for prot_id in list_prot_ids)
             elif isfile(ids) == "no":
-                input = 'not_file'
-                break
-            elif isfile(ids) == "not_recognized":
+                batch_ids.append(ids)
+            else:
                 maptools.log('The input is neither an id(s) or a file containing a list of ids.',
                              report, logger)
                 spinner.fail(
                     'The input is neither an id(s) or a file containing a list of ids.')
                 exit(-1)
+        logger.info(str(len(batch_ids)) + ' input ensembl ids mapped in batch mode.')
+        batch_mapper(batch_ids,
+                     args.psdb,
+                     args.vardb,
+                     args.out,
+                     args.pident,
+                     args.evalue,
+                     args.isoform,
+                     consequence,
+                     args.loc,
+                     index_file,
+                     args.dict_geneprot,
+                     args.csv,
+                     args.hdf,
+                     args.parquet)
+
+    elif args.prot_id:
+        # PDBmapper accepts single or multiple protein ids as input as
+        # well as files of prot ids. Ids are read lazily and deduplicated,
+        # and the status of every id is recorded as it is mapped
+        prot_ids = unique(read_ids(args.prot_id), logger)
+        try:
+            for id, id_status, hits, misses in map_ids(((id, None) for id in prot_ids
+                                                        if id not in done),
+                                                       num_cores, args.pool, common, outputs,
+                                                       args.psdb_cache, sink):
+                status.add(id, id_status, hits, misses)
+                record(journal, sink, id, id_status)
+        except IOError:
+            maptools.log('The input is neither an id(s) or a file containing a list of ids.',
+                         report, logger)
+            spinner.fail(
+                'The input is neither an id(s) or a file containing a list of ids.')
+            exit(-1)
+        if sink is None:
+            journal.checkpoint()
+        status.close()
 
-        # for prot id get the gene id
-        if input == 'not_file':
-            # print(args.prot_id)
-            Parallel(n_jobs=num_cores)(delayed(wrapper)(ids,
-                                                        args.psdb,
-                                                        args.vardb,
-                                                        args.out,
-                                                        args.pident,
-                                                        args.evalue,
-                                                        args.isoform,
-                                                        args.consequence,
-                                                        args.loc,
-                                                        index_file,
-                                                        args.dict_geneprot,
-                                                       # args.uniprot,
-                                                        None,
-                                                        args.csv,
-                                                        args.hdf)
-                                       for ids in args.prot_id)
-
-        if not any(fname.endswith('.txt') for fname in os.listdir(args.out)):
+    if args.prot_id:
+        if sink is not None:
+            sink.close()
+        close_parquet()
+        if args.batch:
+            no_mapping = not any(fname.endswith('.txt') for fname in os.listdir(args.out))
+        else:
+            log_cache(status.hits, status.misses, logger)
+            logger.info(status.summary())
+            report.write(time_format + status.summary() + '\n')
+            no_mapping = status.counts[MAPPED] == 0
+        if no_mapping:
             logger.warning(
                 'Error: Input ensembl ids has no mapping positions.')
             spinner.warn(
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+def to_int(values):
+    '''
+    Convert an arrow array of strings to a float numpy array, with NaN for
+    the values that are not a number (e.g. '?').
+    '''
+    values = pc.if_else(pc.utf8_is_digit(values), values,
+                        pa.scalar(None, pa.string()))
+    return pc.cast(values, pa.int64()).to_numpy(zero_copy_only=False).astype(float)
+
+
+def expand_range(df, col):
+    '''
+    Spread positions given as a range (e.g. '120-125') into one row per
+    position. If one of the ends of the range is a question mark, the
+    other end is used instead.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Rows whose column col is a range.
+    col : str
+        Name of the column containing the ranges.
+
+    Returns
+    -------
+    DataFrame
+        Same columns as df, with one integer position per row in col.
+    '''
+    if df.empty:
+        return df
+    # split the ranges with arrow string kernels, which are much faster
+    # than the pandas str accessor on object columns
+    parts = pc.split_pattern(pa.array(df[col].astype(str).to_numpy(),
+                                      type=pa.string()),
+                             pattern='-', max_splits=1)
+    first = parts.offsets.to_numpy()[:-1]
+    last = first + np.clip(pc.list_value_length(parts).to_numpy(), 1, 2) - 1
+    values = parts.flatten()
+    start = to_int(values.take(pa.array(first)))
+    end = to_int(values.take(pa.array(last)))
+    # sometimes the start or the end position of the interval is a
+    # question mark. In that case, we take into account the
+    # remaining value of the interval
+    start = np.where(np.isnan(start), end, start)
+    end = np.where(np.isnan(end), start, end)
+    # number of positions in every range. Ranges that cannot be read or
+    # are reversed produce no rows
+    lengths = np.nan_to_num(end - start + 1, nan=0).astype(np.int64)
+    lengths = np.clip(lengths, 0, None)
+    start = np.nan_to_num(start, nan=0).astype(np.int64)
+    # offset of every new row within its range
+    offsets = np.arange(lengths.sum()) - \
+        np.repeat(np.cumsum(lengths) - lengths, lengths)
+    # repeat the rows and fill in the individual positions
+    res = df.iloc[np.repeat(np.arange(len(df)), lengths)]
+    res = res.reset_index(drop=True)
+    res[col] = np.repeat(start, lengths) + offsets
+    return res
@@ -1,28 +1,121 @@
 # -*- coding: utf-8 -*-
-import sys
-import os
-import re
-import pandas as pd
 import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+def split_column(values, split_on):
+    '''
+    Split a column into an arrow list array. Missing values are kept as
+    null lists and cells that are already lists are not split again.
+    '''
+    arr = pa.array(values, from_pandas=True)
+    if pa.types.is_list(arr.type):
+        return arr.cast(pa.list_(pa.string()))
+    if not pa.types.is_string(arr.type):
+        arr = arr.cast(pa.string())
+    return pc.split_pattern(arr, pattern=split_on)
+
+
+def to_typed(values, nulls):
+    '''
+    Convert an exploded column to integers if all its values are integers.
+    Any other column is returned as strings.
+    '''
+    if len(values) > 0 and pc.all(pc.utf8_is_digit(values)).as_py():
+        ints = pc.cast(values, pa.int64()).to_numpy()
+        if not nulls.any():
+            return ints
+        res = pd.array(np.zeros(len(nulls), dtype=np.int64), dtype='Int64')
+        res[~nulls] = ints
+        res[nulls] = pd.NA
+        return res
+    res = np.empty(len(nulls), dtype=object)
+    res[~nulls] = values.to_numpy(zero_copy_only=False)
+    res[nulls] = np.nan
+    return res
 
-def explode(df,cols,split_on):
+
+def explode(df, cols, split_on):
     """
-    Explode dataframe on the given column, split on given delimeter
+    Explode dataframe on the given columns, split on given delimeter.
+    The columns are split in lockstep: every row must have the same number
+    of elements in all of them. Missing values are repeated for every
+    element of the row.
     """
     cols_sep = [x for x in list(df.columns) if x not in cols]
+    # split all the columns at once
+    splitted = [split_column(df[col].to_numpy(dtype=object), split_on)
+                for col in cols]
+    # number of elements of each row in each column (NaN if missing)
+    lengths = np.vstack([pc.list_value_length(s).to_numpy(zero_copy_only=False)
+                         .astype(float) for s in splitted])
+    available = ~np.isnan(lengths)
+    # the length of a row is the one of its first non missing column
+    first = np.argmax(available, axis=0)
+    explode_len = lengths[first, np.arange(len(df))]
+    explode_len = np.nan_to_num(explode_len, nan=1).astype(np.int64)
+    # every non missing value must have the same number of elements
+    mismatch = available & (lengths != explode_len)
+    if mismatch.any():
+        wrong = [cols[i] for i in np.where(mismatch.any(axis=1))[0]]
+        raise IOError('Columns ' + ', '.join(wrong) + ' have a different ' +
+                      'number of elements than ' + cols[0] + '.')
+    # repeat the rest of columns
+    df_repeat = df[cols_sep].iloc[np.repeat(np.arange(len(df)), explode_len)]
+    df_repeat = df_repeat.reset_index(drop=True)
+    # and fill in the splitted values
+    df_explode = pd.DataFrame(index=df_repeat.index)
+    for col, s, av in zip(cols, splitted, available):
+        nulls = np.repeat(~av, explode_len)
+        values = pc.utf8_trim_whitespace(s.flatten())
+        df_explode[col] = to_typed(values, nulls)
 
-    df_cols = df[cols_sep]
-    explode_len = df[cols[0]].str.split(split_on).map(len)
+    return pd.concat((df_repeat, df_explode), axis=1)
 
-    repeat_list = []
-    for r, e in zip(df_cols.values, explode_len):
-        repeat_list.extend([list(r)]*e)
-    
-    df_repeat = pd.DataFrame(repeat_list, columns=cols_sep)
 
-    
-    df_explode = pd.concat([df[col].str.split(split_on, expand=True).stack().str.strip().reset_index(drop=True)
-                            for col in cols], axis=1)
-    df_explode.columns = cols
-    
-    return pd.concat((df_repeat, df_explode), axis=1)
+def explode_psdb(psdf):
+    '''
+    Spread the dash-compacted columns of a protein structures file so that
+    each row corresponds to one residue.
+
+    Parameters
+    ----------
+    psdf : DataFrame
+        Parsed protein structures file.
+
+    Returns
+    -------
+    DataFrame
+        One row per Protein_position. The compacted PDB positions are kept
+        in the columns 'Chimera_3D_position' and 'Chimera_interacting_position'.
+    '''
+    # Get col PDB_position
+    # if database is compacted and explode is needed
+    columns_type = psdf.applymap(lambda x: isinstance(x, list)).all()
+    columns_list = columns_type.index[columns_type].tolist()
+
+    # cols_stack
+    cols_stack = psdf.apply(lambda x: x.astype(
+        str).str.match(r'[a-zA-Z0.-9]+-[a-zA-Z0.-9]+'))
+    colsnames_stack = psdf.columns[cols_stack.any()].tolist()
+    # add column for chimera script
+    if 'PDB_interacting_3D_position' in colsnames_stack:
+        psdf['Chimera_interacting_position'] = psdf['PDB_interacting_3D_position']
+    if 'Evalue' in colsnames_stack:
+        colsnames_stack.remove('Evalue')
+    if 'PDB_code' in colsnames_stack:
+        colsnames_stack.remove('PDB_code')
+    if 'PDB_3D_position' in colsnames_stack:
+        psdf['Chimera_3D_position'] = psdf['PDB_3D_position']
+    if 'Structure_feature_id' in colsnames_stack:
+        colsnames_stack.remove('Structure_feature_id')
+    if any(colsnames_stack):
+        psdf = explode(psdf, colsnames_stack, '-')
+    elif any(columns_list):
+        psdf = explode(psdf, columns_list, '-')
+    else:
+        psdf[colsnames_stack] = \
+            psdf[colsnames_stack].astype(str)
+    return psdf
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+# import necessary modules
+import os
+from itertools import islice
+
+from .input_isfile import isfile
+
+# status of an input id, from worst to best. An id mapped through several
+# isoforms gets the best status of all of them
+ERROR = 'error'
+NO_VARIANTS = 'no-variants'
+NO_STRUCTURE = 'no-structure'
+MAPPED = 'mapped'
+status_rank = [ERROR, NO_VARIANTS, NO_STRUCTURE, MAPPED]
+
+
+def best_status(a, b):
+    return a if status_rank.index(a) >= status_rank.index(b) else b
+
+
+def read_ids(values):
+    '''
+    Read lazily the ids given in the command line or in files of one id
+    per line.
+
+    Parameters
+    ----------
+    values : list
+        ids or files of ids
+
+    Returns
+    -------
+    generator
+        ids, without blank lines. IOError is raised if a value is neither
+        an id nor a file.
+    '''
+    for value in values:
+        if isfile(value) == 'yes':
+            with open(value) as f:
+                for line in f:
+                    id = line.strip()
+                    if id:
+                        yield id
+        elif isfile(value) == 'no':
+            yield value
+        else:
+            raise IOError()
+
+
+def unique(ids, logger=None):
+    '''
+    Drop the ids already seen, keeping the first occurrence.
+
+    The ids are streamed, but the ids already seen are kept in a set, so
+    memory grows with the number of distinct ids: about 100 bytes per id,
+    100 MB for a million Ensembl protein ids. It does not grow with the
+    number of duplicates or with the results.
+    '''
+    seen = set()
+    duplicated = 0
+    for id in ids:
+        if id in seen:
+            duplicated += 1
+            continue
+        seen.add(id)
+        yield id
+    if duplicated and logger is not None:
+        logger.warning(str(duplicated) + ' duplicated input ids skipped.')
+
+
+def blocks(iterable, size):
+    '''
+    Consecutive lists of at most size items of an iterable.
+    '''
+    iterator = iter(iterable)
+    while True:
+        block = list(islice(iterator, size))
+        if not block:
+            return
+        yield block
+
+
+class StatusTable:
+    '''
+    Status of every input id of a run, written as it is known to a tab
+    separated file in the output directory, with the counts of every
+    status kept in memory.
+
+    Parameters
+    ----------
+    out_dir : str
+        Output directory
+    '''
+
+    def __init__(self, out_dir):
+        self.fn = os.path.join(out_dir, '3dmapper.status')
+        self.f = open(self.fn, 'w')
+        self.f.write('id\tstatus\n')
+        self.counts = dict.fromkeys(status_rank, 0)
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, id, status, hits=0, misses=0):
+        self.f.write(id + '\t' + status + '\n')
+        self.counts[status] += 1
+        self.hits += hits
+        self.misses += misses
+
+    def total(self):
+        return sum(self.counts.values())
+
+    def summary(self):
+        '''
+        Coverage of the run, as text.
+        '''
+        total = self.total()
+        text = str(total) + ' input ids: '
+        text += ', '.join('{} {} ({:.1f}%)'.format(
+            self.counts[s], s, 100 * self.counts[s] / total if total else 0)
+            for s in reversed(status_rank))
+        return text + '.'
+
+    def close(self):
+        self.f.close()
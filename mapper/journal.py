@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# import necessary modules
+import glob
+import json
+import os
+import time
+
+from .writefile import close_parquet
+
+# seconds between two checkpoints
+checkpoint_time = 60
+
+
+def output_files(out_dir):
+    '''
+    Files written by the mapper in an output directory: setID files and
+    csv, parquet and hdf5 results.
+
+    Returns
+    -------
+    dict
+        size of every file, by path relative to out_dir.
+    '''
+    files = glob.glob(os.path.join(out_dir, 'setID*.txt'))
+    for subdir in ['csv', 'parquet', 'hdf5']:
+        for root, dirs, names in os.walk(os.path.join(out_dir, subdir)):
+            files.extend(os.path.join(root, name) for name in names)
+    return {os.path.relpath(f, out_dir): os.path.getsize(f) for f in files}
+
+
+class Journal:
+    '''
+    Append-only journal of the ids mapped in a run. Ids are written in
+    blocks, each followed by a checkpoint with the size of every output
+    file once all the results of the block are on disk, so that an
+    interrupted run can be resumed from the last checkpoint. The journal
+    is kept by the process that writes the results.
+
+    Parameters
+    ----------
+    out_dir : str
+        Output directory
+    '''
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self.fn = os.path.join(out_dir, '3dmapper.journal')
+        self.pending = []
+        self.last = time.time()
+
+    def start(self):
+        '''
+        Start the journal of a new run. Files of previous runs (--append)
+        are kept as they are.
+        '''
+        open(self.fn, 'w').close()
+        self.checkpoint()
+
+    def restore(self):
+        '''
+        Restore the output directory to the last checkpoint of the
+        journal: results written after it are removed and the journal is
+        truncated.
+
+        Returns
+        -------
+        dict
+            status of the ids mapped before the last checkpoint. IOError
+            is raised if there is no journal or it has no checkpoint.
+        '''
+        if not os.path.isfile(self.fn):
+            raise IOError('No journal to resume in ' + self.out_dir + '.')
+        done = {}
+        block = []
+        sizes = None
+        offset = 0
+        with open(self.fn, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                fields = line.decode('utf-8').rstrip('\n').split('\t')
+                if fields[0] == 'id' and len(fields) == 3:
+                    block.append((fields[1], fields[2]))
+                elif fields[0] == 'checkpoint' and len(fields) == 2:
+                    try:
+                        sizes = json.loads(fields[1])
+                    except ValueError:
+                        break
+                    done.update(block)
+                    block = []
+                    offset = f.tell()
+                else:
+                    break
+        if sizes is None:
+            raise IOError('The journal in ' + self.out_dir + ' has no checkpoint.')
+        # ids written after the last checkpoint are mapped again
+        with open(self.fn, 'r+b') as f:
+            f.truncate(offset)
+        for name, size in output_files(self.out_dir).items():
+            path = os.path.join(self.out_dir, name)
+            if name not in sizes:
+                os.remove(path)
+            elif size != sizes[name]:
+                with open(path, 'r+b') as f:
+                    f.truncate(sizes[name])
+        return done
+
+    def add(self, id, status):
+        # id whose results have been written
+        self.pending.append((id, status))
+
+    def due(self):
+        return self.pending and time.time() - self.last >= checkpoint_time
+
+    def checkpoint(self):
+        '''
+        Close the parquet files, so that they are complete on disk, and
+        journal the pending ids with the size of the output files.
+        '''
+        close_parquet()
+        with open(self.fn, 'a') as f:
+            for id, status in self.pending:
+                f.write('id\t' + id + '\t' + status + '\n')
+            f.write('checkpoint\t' + json.dumps(output_files(self.out_dir)) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.pending = []
+        self.last = time.time()
@@ -7,16 +7,567 @@ import re
 import glob
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
 #import dask.dataframe as dd
 
+from .consequence import compile_consequences, term_separator
 from .db_parser import parser
 from .decorator import tags
-from .explode import explode
-from .explode2 import explode2
+from .expand_range import expand_range
+from .id_stream import MAPPED, NO_STRUCTURE
 from .logger import get_logger
+from .psdb_cache import psdb_cache
 from .writefile import writefile
 
-def mapper(prot_id,  gene_id, transcript_id, psdb, vardb, out_dir, pident, evalue, isoform, APPRIS, consequence, loc, var_id=None, csv=False, hdf=False):
+# location of a variant, as written in the column 'Mapping_position'
+mapping_types = pd.CategoricalDtype(['Interface', 'Structure', 'Covered',
+                                     'Unmapped', 'Noncoding'])
+
+
+def constant_category(value, n, dtype=None):
+    '''
+    Categorical column with the same value in all its n rows, missing if
+    value is None.
+    '''
+    if dtype is None:
+        dtype = pd.CategoricalDtype([] if pd.isna(value) else [value])
+    code = -1 if pd.isna(value) else dtype.categories.get_loc(value)
+    return pd.Categorical.from_codes(np.full(n, code, dtype=np.int8), dtype=dtype)
+
+
+def variant_mask(annovars, var_id):
+    '''
+    Variants whose 'Uploaded_variation' or any of the ids in
+    'Existing_variation' is one of the requested ids.
+
+    Returns
+    -------
+    array
+        True for the selected variants.
+    '''
+    selected = annovars['Uploaded_variation'].isin(var_id).values
+    if 'Existing_variation' in annovars.columns:
+        existing = annovars['Existing_variation']
+        # only ids with several existing ids, e.g. 'rs1,COSV2' or
+        # 'rs1&COSV2' in databases converted from VCF files, are split
+        several = existing.str.contains(
+            term_separator.pattern, regex=True, na=False).values
+        selected = selected | existing.isin(var_id).values
+        if several.any():
+            split = existing[several].str.split(term_separator.pattern).explode()
+            selected[several] |= split.isin(var_id).groupby(
+                level=0, sort=False).any().values
+    return selected
+
+
+def variant_groups(annovars, var_id):
+    '''
+    Requested ids of every variant, i.e. the variants that were mapped
+    together when every requested id was mapped on its own.
+
+    Returns
+    -------
+    Series
+        Requested ids, indexed by the label of their variants. A variant
+        matching several requested ids is repeated.
+    '''
+    ids = [annovars['Uploaded_variation']]
+    if 'Existing_variation' in annovars.columns:
+        ids.append(annovars['Existing_variation'].astype(object).str.split(
+            term_separator.pattern).explode())
+    ids = pd.concat(ids)
+    ids = ids[ids.isin(var_id).values]
+    # a variant can match the same id in both columns
+    pairs = pd.DataFrame({'label': ids.index, 'id': ids.values})
+    pairs = pairs.drop_duplicates()
+    return pd.Series(pairs['id'].values, index=pairs['label'].values)
+
+
+def select_variants(annovars, var_id, logger):
+    '''
+    Keep the variants whose 'Uploaded_variation' or any of the ids in
+    'Existing_variation' is one of the requested ids.
+
+    Parameters
+    ----------
+    annovars : DataFrame
+        Parsed variants.
+    var_id : str or list
+        Variant id(s) to keep.
+
+    Returns
+    -------
+    DataFrame
+        Selected variants. IOError is raised if no variant is selected.
+    '''
+    if isinstance(var_id, str):
+        var_id = [var_id]
+    var_id = [str(v) for v in var_id]
+    annovars = annovars.take(np.flatnonzero(variant_mask(annovars, var_id)))
+    logger.info('position \'' + ', '.join(var_id) + '\' has been selected.')
+    # if filter returns an empty df, raise error
+    if annovars.empty:
+        logger.error(
+            'positions could not be filtered by position id \'' + ', '.join(var_id) + '\'')
+        raise IOError()
+    return annovars
+
+
+def filter_variants(annovars, consequence, var_id, logger):
+    '''
+    Filter parsed variants by consequence and variant id and spread the
+    positions given as a range into one row per position.
+
+    Parameters
+    ----------
+    annovars : DataFrame
+        Parsed variants of one or several transcripts.
+    consequence : list or ConsequenceFilter
+        Consequence types to keep. None to keep all.
+    var_id : str or list
+        Variant id(s) to keep. None to keep all.
+
+    Returns
+    -------
+    DataFrame
+        Filtered variants. IOError is raised if no variant is left.
+    '''
+    # filters are combined in a single mask and the variants are copied
+    # once
+    keep = np.ones(len(annovars), dtype=bool)
+    if consequence is not None:
+        keep &= compile_consequences(consequence).mask(annovars['Consequence'])
+        logger.info('Filter of features = ' + str(consequence))
+
+        # if filter returns an empty df, raise error
+        if not keep.any():
+            logger.error(
+                'positions could not be filtered by feature type = ' + str(consequence))
+            raise IOError()
+
+    # filter by position type if one or more selected
+    if var_id is not None:
+        if isinstance(var_id, str):
+            var_id = [var_id]
+        var_id = [str(v) for v in var_id]
+        keep &= variant_mask(annovars, var_id)
+        logger.info('position \'' + ', '.join(var_id) + '\' has been selected.')
+        if not keep.any():
+            logger.error(
+                'positions could not be filtered by position id \'' + ', '.join(var_id) + '\'')
+            raise IOError()
+    # for positions with high impact affecting several aminoacidic positions,
+    # the protein position is a range. split the range to have each position
+    # individually
+    ranges = annovars['Protein_position'].str.contains(
+        r'[0-9]-[0-9]', na=False).values
+    if (keep & ranges).any():
+        # spread each individual position of the range into one row and
+        # concatenate them after the remaining positions
+        annovars = pd.concat([annovars.take(np.flatnonzero(keep & ~ranges)),
+                              expand_range(annovars.take(np.flatnonzero(keep & ranges)),
+                                           'Protein_position')],
+                             sort=False)
+        annovars = annovars.reset_index(drop=True)
+    elif not keep.all():
+        annovars = annovars.take(np.flatnonzero(keep))
+    return annovars
+
+
+def filter_structures(psdf, pident, evalue, logger):
+    '''
+    Filter the structural features by sequence identity and evalue.
+
+    Parameters
+    ----------
+    psdf : DataFrame
+        Exploded structural features of one or several proteins.
+    pident : int
+        Thershold of sequence identity (percertage).
+    evalue : float
+        Threshold of evalue.
+
+    Returns
+    -------
+    DataFrame
+        Filtered structural features. IOError is raised if no structure
+        is left.
+    '''
+    # filters are combined in a single mask and the structures are
+    # copied once
+    keep = np.ones(len(psdf), dtype=bool)
+    if pident is not None:
+        logger.info('Filtering interfaces by pident = ' +
+                    str(pident) + '%.')
+        # filter by pident
+        pident = int(pident)  # from str to int
+        keep &= (psdf['Pident'] >= pident).values
+        # if pident threshold is to high, the next maximum value of pident is
+        # notified in log file
+        if not keep.any():
+            alt_pident = psdf.loc[:, "Pident"].max()
+            logger.error('Warning: for prot_id ' + str(pident) +
+                         ', the variable "Pident" equal to ' +
+                         str(pident) + ' is too high.\n A threshold lower than or equal to ' +
+                         str(alt_pident) + ' would retrieve results.')
+
+            raise IOError()
+    if evalue is not None:
+        logger.info('Filtering interfaces by evalue = ' +
+                    str(evalue) + '%.')
+        # filter by pident
+        evalue = float(evalue)  # from str to int
+        keep &= (psdf['Evalue'] >= evalue).values
+        # if pident threshold is to high, the next maximum value of pident is
+        # notified in log file
+        if not keep.any():
+            alt_evalue = psdf.loc[:, "Evalue"].min()
+            logger.error('Warning: for prot_id ' + str(evalue) +
+                         ', the variable "Evalue" equal to ' +
+                         str(evalue) + ' is too low.\n A threshold higher than or equal to ' +
+                         str(alt_evalue) + ' would retrieve results.')
+
+            raise IOError()
+    if not keep.all():
+        psdf = psdf.take(np.flatnonzero(keep))
+    return psdf
+
+
+def position_bounds(positions):
+    '''
+    First and last residue of VEP protein positions: '12', '12-14', '?-14'
+    or '12-?'. An unknown bound takes the value of the other one.
+
+    Returns
+    -------
+    array, array
+        first and last residues, NaN if the position is not numeric.
+    '''
+    parts = positions.astype(str).str.split('-', n=1, expand=True)
+    start = pd.to_numeric(parts[0], errors='coerce')
+    if parts.shape[1] > 1:
+        end = pd.to_numeric(parts[1], errors='coerce')
+    else:
+        end = start
+    return start.fillna(end).values, end.fillna(start).values
+
+
+def alignment_intervals(psdf):
+    '''
+    Residues of every protein covered by the alignment of any of its
+    structures, as sorted and disjoint intervals.
+
+    Returns
+    -------
+    dict
+        starts and ends of the intervals, by protein.
+    '''
+    cols = ['Protein_accession', 'Protein_alignment_start',
+            'Protein_alignment_end']
+    if not set(cols).issubset(psdf.columns):
+        return {}
+    ranges = psdf[cols].drop_duplicates()
+    ranges[cols[1:]] = ranges[cols[1:]].apply(pd.to_numeric, errors='coerce')
+    ranges = ranges.dropna().sort_values(cols[:2])
+    intervals = {}
+    for prot_id, df in ranges.groupby('Protein_accession', sort=False):
+        starts = df['Protein_alignment_start'].values
+        # furthest residue covered up to every range
+        ends = np.maximum.accumulate(df['Protein_alignment_end'].values)
+        # a new interval starts after a residue not covered
+        first = np.flatnonzero(np.r_[True, starts[1:] > ends[:-1]])
+        last = np.r_[first[1:] - 1, len(starts) - 1]
+        intervals[prot_id] = (starts[first], ends[last])
+    return intervals
+
+
+def covered_positions(annovars, psdf):
+    '''
+    Variants within the alignment of a structure of their protein, found
+    by binary search in the sorted alignment intervals of the protein.
+
+    Returns
+    -------
+    array
+        True for the covered variants, in the order of annovars.
+    '''
+    intervals = alignment_intervals(psdf)
+    covered = np.zeros(len(annovars), dtype=bool)
+    if not intervals:
+        return covered
+    start, end = position_bounds(annovars['Protein_position'])
+    proteins = annovars['Protein_accession'].values
+    for prot_id, (starts, ends) in intervals.items():
+        rows = np.flatnonzero(proteins == prot_id)
+        if len(rows) == 0:
+            continue
+        # last interval starting before the end of the variant
+        i = np.searchsorted(starts, end[rows], side='right') - 1
+        covered[rows] = (i >= 0) & (ends[np.maximum(i, 0)] >= start[rows])
+    return covered
+
+
+def integer_positions(positions):
+    '''
+    Protein positions as integers. Positions that are not a single
+    residue ('-', '?-81', '12-14') are not valid.
+
+    Returns
+    -------
+    array, array
+        int64 positions, 0 if not valid, and mask of the valid ones.
+    '''
+    if positions.dtype.kind in 'iu':
+        return positions.values.astype(np.int64), np.ones(len(positions), dtype=bool)
+    if positions.dtype.kind == 'f':
+        values = positions.values
+        valid = ~np.isnan(values)
+        valid[valid] = values[valid] == np.floor(values[valid])
+        out = np.zeros(len(positions), dtype=np.int64)
+        out[valid] = values[valid].astype(np.int64)
+        return out, valid
+    # text positions are tested and converted by arrow, without a python
+    # call per row (see benchmarks/bench_join_positions.py)
+    try:
+        values = pa.array(positions.values, type=pa.string(), from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        values = pa.array(positions.astype(str).values, type=pa.string())
+    valid = pc.fill_null(pc.ascii_is_decimal(values), False)
+    out = np.zeros(len(positions), dtype=np.int64)
+    mask = valid.to_numpy(zero_copy_only=False)
+    out[mask] = pc.cast(values.filter(valid), pa.int64()).to_numpy()
+    return out, mask
+
+
+def join_positions(annovars, psdf):
+    '''
+    Inner join of variants and structural features on protein and
+    position. Both are encoded in a single integer key and the variants
+    are looked up by binary search in the sorted keys of the structures.
+    Variants with a non-numeric position ('-', '?-81', '12-14') do not
+    fall on a single residue and are left out of the join.
+
+    Parameters
+    ----------
+    annovars : DataFrame
+        Variants, with 'Protein_accession' as last column.
+    psdf : DataFrame
+        Exploded structural features, one position per row.
+
+    Returns
+    -------
+    DataFrame
+        Variant columns and then the structural features, in the order of
+        annovars and, for every variant, of psdf. The index is the one of
+        annovars.
+    '''
+    # proteins as integer codes, -1 for proteins without structures
+    p_code, proteins = pd.factorize(psdf['Protein_accession'])
+    a_code = proteins.get_indexer(annovars['Protein_accession']).astype(np.int64)
+    p_code = p_code.astype(np.int64)
+    a_pos, valid = integer_positions(annovars['Protein_position'])
+    p_pos, p_valid = integer_positions(psdf['Protein_position'])
+    rows = np.flatnonzero(valid & (a_code >= 0))
+    a_key = (a_code[rows] << 32) + a_pos[rows]
+    # variants of the same protein and position are kept together, in
+    # order of first appearance, as in the output of DataFrame.join
+    grouped = np.argsort(pd.factorize(a_key)[0], kind='stable')
+    rows = rows[grouped]
+    a_key = a_key[grouped]
+    p_valid = np.flatnonzero(p_valid)
+    p_key = (p_code[p_valid] << 32) + p_pos[p_valid]
+    # stable sort keeps the structures of a position in psdf order
+    order = np.argsort(p_key, kind='stable')
+    p_key = p_key[order]
+    lo = np.searchsorted(p_key, a_key, side='left')
+    counts = np.searchsorted(p_key, a_key, side='right') - lo
+    # every variant is repeated once per structure at its position
+    left = np.repeat(rows, counts)
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    right = p_valid[order[np.repeat(lo, counts) + offset]]
+    mapped_positions = annovars.iloc[left, :-1]
+    features = psdf.iloc[right].drop('Protein_position', axis=1)
+    features.index = mapped_positions.index
+    return pd.concat([mapped_positions, features], axis=1)
+
+
+def map_positions(annovars, psdf, loc, groups=None):
+    '''
+    Join variants and structural features on protein and position, and
+    locate the variants that do not fall on an interface.
+
+    Parameters
+    ----------
+    annovars : DataFrame
+        Variants of one or several proteins. Its last two columns are
+        'APPRIS_isoform' and 'Protein_accession', the protein the variant
+        belongs to.
+    psdf : DataFrame
+        Structural features of the proteins. None if none of them has
+        structural features.
+    loc : bool
+        Locate the variants that do not map to an interface.
+    groups : Series
+        Requested ids of the variants when mapping a list of variant ids
+        of a single protein, as returned by variant_groups. None when
+        every variant of the proteins is mapped.
+
+    Returns
+    -------
+    dict
+        Data frames to write, by type of output: 'InterfacePositions',
+        'StructurePositions', 'UnmappedPositions', 'NoncodingPositions'
+        and 'setID'. Every data frame but setID has a 'Protein_accession'
+        column.
+    set
+        Proteins with at least one variant on their structures.
+    '''
+    results = {}
+    # proteins with structural features
+    if psdf is not None:
+        structures = set(psdf['Protein_accession'])
+    else:
+        structures = set()
+    with_structure = annovars['Protein_accession'].isin(structures)
+
+    mapped_positions = None
+    if psdf is not None:
+        mapped_positions = join_positions(annovars, psdf)
+
+    ###########################################################################
+    # Locate rest of positions (mapping to a structure or not)
+    ###########################################################################
+    if loc:
+        # remove already mapped positions
+        if mapped_positions is not None:
+            left_positions = annovars.drop(list(set(mapped_positions.index)))
+        else:
+            left_positions = annovars
+        # the positions on the rest of the structure are reported for the
+        # proteins with positions left to locate or, when mapping a list of
+        # variant ids, for the requested ids with positions left, as if
+        # every id was mapped on its own
+        if groups is None:
+            left_units = set(left_positions['Protein_accession'])
+        else:
+            left_units = set(groups[groups.index.isin(left_positions.index)])
+        # duplicated variants are removed once, all the positions left
+        # are subsets of these
+        left_positions = left_positions.drop_duplicates()
+        # remove non protein coding positions
+        if 'Amino_acids' in left_positions.columns:
+            noncoding_positions_index = left_positions.Amino_acids.str.contains(
+                '\.|\-', regex=True, na=False).values
+        else:
+            noncoding_positions_index = np.zeros(len(left_positions), dtype=bool)
+        noncoding_positions = left_positions.take(
+            np.flatnonzero(noncoding_positions_index))
+        # non-protein coding mutations. Proteins without structures always
+        # report them, even if there are none
+        if noncoding_positions.empty is False or not with_structure.all():
+            noncoding_positions['Mapping_position'] = constant_category(
+                'Noncoding', len(noncoding_positions), mapping_types)
+            results['NoncodingPositions'] = noncoding_positions
+        left_positions = left_positions.take(
+            np.flatnonzero(~noncoding_positions_index))
+
+        # rest of positions. Those within the alignment of a structure of
+        # their protein (a gap or an unresolved residue) are covered
+        unmapped_positions = left_positions
+        if psdf is not None and unmapped_positions.empty is False:
+            covered = covered_positions(unmapped_positions, psdf)
+        else:
+            covered = np.zeros(len(unmapped_positions), dtype=bool)
+
+        # mapped position is on the rest of the structure
+        if mapped_positions is not None:
+            if groups is None:
+                with_left = mapped_positions['Protein_accession'].isin(
+                    left_units).values
+            else:
+                with_left = mapped_positions.index.isin(
+                    groups.index[groups.isin(left_units).values])
+            structure_positions = mapped_positions[
+                mapped_positions['Interaction_type'].isna().values & with_left]
+            structure_positions = structure_positions.drop(['Chimera_interacting_position', 'Chimera_3D_position',
+                                                            'PDB_interacting_3D_position', 'PDB_interacting_aa',
+                                                            'Interface_min_distance', 'PDB_interacting_B_factor'],
+                                                           axis=1, errors='ignore')
+            # do proper arragenments if no resulst are retrieved
+            if structure_positions.empty is False:
+                structure_positions = structure_positions.drop_duplicates()
+                structure_positions['Mapping_position'] = constant_category(
+                    'Structure', len(structure_positions), mapping_types)
+                results['StructurePositions'] = structure_positions
+
+        if unmapped_positions.empty is False:
+            unmapped_positions['Mapping_position'] = pd.Categorical.from_codes(
+                np.where(covered, mapping_types.categories.get_loc('Covered'),
+                         mapping_types.categories.get_loc('Unmapped')),
+                dtype=mapping_types)
+            results['UnmappedPositions'] = unmapped_positions
+
+    ###########################################################################
+    # if merging was successful, create setID file and
+    # save the merged dataframe as well
+    if mapped_positions is None or mapped_positions.empty:
+        return results, set()
+
+    mapped = set(mapped_positions['Protein_accession'])
+    mapped_positions['Mapping_position'] = constant_category(
+        'Interface', len(mapped_positions), mapping_types)
+    mapped_positions = mapped_positions[mapped_positions['Interaction_type'].notna()]
+    # duplicates are removed within each protein
+    setID_file = mapped_positions[['Protein_accession', 'Structure_feature_id',
+                                   'Uploaded_variation']].drop_duplicates()
+    results['setID'] = setID_file.drop('Protein_accession', axis=1)
+    results['InterfacePositions'] = mapped_positions.drop_duplicates()
+    return results, mapped
+
+
+def write_results(results, out_dir, pident, isoform, consequence, csv=False, hdf=False, parquet=False, sink=None):
+    '''
+    Write the output of map_positions, appending results and not
+    repeating headers.
+
+    Parameters
+    ----------
+    results : dict
+        Data frames to write, by type of output.
+    out_dir : str
+        Output directory
+    sink : SinkTask
+        Send the results to the writer process instead of writing them.
+    '''
+    for maptype in ['NoncodingPositions', 'StructurePositions',
+                    'UnmappedPositions', 'InterfacePositions']:
+        if maptype not in results:
+            continue
+        df = results[maptype]
+        # noncoding positions are not assigned to a protein in the output
+        if maptype == 'NoncodingPositions':
+            df = df.drop('Protein_accession', axis=1)
+        writefile(None, out_dir, pident, isoform, consequence,
+                  df, maptype, csv, False, False, sink)
+        # all the proteins go to the same parquet and hdf5 datasets, with
+        # the protein as a column
+        if parquet is True or hdf is True:
+            writefile(None, out_dir, pident, isoform, consequence,
+                      results[maptype], maptype, False, hdf, parquet, sink)
+
+    if 'setID' in results and sink is not None:
+        sink.write(None, 'setID', results['setID'])
+    elif 'setID' in results:
+        # Save the merged dataframe, appending results and not
+        #  reapeting headers
+        with open(os.path.join(out_dir, ('setID_pident' + str(pident) + '_isoform_' +
+                                         '_'.join(isoform) + '_consequence_' + '_'.join(consequence) + '.txt')), 'a') as f:
+            results['setID'].to_csv(f, sep=',', index=False,
+                                    header=f.tell() == 0)
+
+
+def mapper(prot_id,  gene_id, transcript_id, psdb, vardb, out_dir, pident, evalue, isoform, APPRIS, consequence, loc, var_id=None, csv=False, hdf=False, parquet=False, sink=None):
     '''
     Map interfaces and genomic anntoated positions and returns a
     setID.File, necessary input for SKAT. Additionaly, it creates
@@ -45,148 +596,36 @@ def mapper(prot_id,  gene_id, transcript_id, psdb, vardb, out_dir, pident, evalu
     InterfacePositions
         Same as setID.File but with additional information describing the
         interfaces and the positions.
+    str
+        'mapped' if any variant is located in a structure, 'no-structure'
+        otherwise. IOError is raised if the protein has no variants.
     '''
     # log file
     logger = get_logger(' 3dmapper', out_dir)
     # parse positions corresponding to the selected protein ID
+    # variants of several requested ids are mapped at once
+    groups = None
     try:
-        annovars = parser(transcript_id, vardb)     
-        if consequence is not None:
-            annovars = annovars[annovars['Consequence'].astype(
-                str).str.contains('|'.join(consequence))]
-            logger.info('Filter of features = ' + str(consequence))
-
-            # if filter returns an empty df, raise error
-            if annovars.empty is True:
-                logger.error(
-                    'positions could not be filtered by feature type = ' + consequence)
-                raise IOError()
-        else:
-            consequence = ['all']
-
-        if isoform is None:
-            isoform = ['all']
-
-        # filter by position type if one or more selected
-        if var_id is not None:
-            if 'Existing_variation' in annovars.columns:
-                annovars = annovars[
-                    (annovars.Uploaded_variation.astype(str) == str(var_id)) |
-                    (annovars.Existing_variation.astype(str) == str(var_id))]
-            else:
-                annovars = annovars[
-                    (annovars.Uploaded_variation.astype(str) == str(var_id))]
-            logger.info('position \'' + str(var_id) + '\' has been selected.')
-            # if filter returns an empty df, raise error
-            if annovars.empty:
-                logger.error(
-                    'positions could not be filtered by position id \'' + str(var_id) + '\'')
-                raise IOError()
-        # for positions with high impact affecting several aminoacidic positions,
-        # the protein position is a range. split the range to have each position
-        # individually
-        if any(annovars['Protein_position'].astype(str).str.contains(r'[0-9]-[0-9]')):
-            # subset hight impact positions
-            sub_df = annovars[annovars['Protein_position'].astype(str).str.contains(
-                r'[0-9]-[0-9]')]
-            # subset the remaining positions to concatenate afterwards
-            remaining_df = annovars.drop(sub_df.index)
-            # split the range or interval
-            sub_df[['start', 'end']] = sub_df['Protein_position'].str.split(
-                '-', expand=True)
-            # sometimes the start or the end position of the interval is a
-            # question mark. In that case, we take into account the
-            # remaining value of the interval
-            if any(sub_df['start'].str.contains('\?')):
-                sub_df['start'] = np.where(sub_df['start'] == '?', sub_df['end'],
-                                           sub_df['start'])
-            if any(sub_df['end'].str.contains('\?')):
-                sub_df['end'] = np.where(sub_df['end'] == '?', sub_df['start'],
-                                         sub_df['end'])
-            # create the range of numbers defined by the interval
-            sub_df['Protein_position'] = sub_df.apply(lambda x: list(
-                range(int(x['start']), int(x['end'])+1)), 1)
-            # spread each individual position into one row
-            sub_df = explode2(sub_df, ['Protein_position'])
-            # drop unnecesary columns
-            sub_df.drop(['start', 'end'], inplace=True, axis=1)
-            # concatenate final result
-            annovars = pd.concat([remaining_df, sub_df], sort=False)
-            annovars = annovars.reset_index(drop=True)
+        annovars = parser(transcript_id, vardb, consequence=consequence)
+        annovars = filter_variants(annovars, consequence, var_id, logger)
+        if var_id is not None and not isinstance(var_id, str):
+            groups = variant_groups(annovars, [str(v) for v in var_id])
     except IOError:
         annovars = False
+    if consequence is None:
+        consequence = ['all']
+    if isoform is None:
+        isoform = ['all']
      # parse interfaces corresponding to the selected protein ID
     try:
-        psdf = parser(prot_id, psdb)
+        # parsed and exploded frames are cached, the same protein is
+        # often mapped several times in a run
+        psdf = psdb_cache.load(prot_id, psdb)
         logger.info('Protein features file of ' + prot_id + ' parsed.')
-        # Get col PDB_position
-        # if database is compacted and explode is needed
-        columns_type = psdf.applymap(lambda x: isinstance(x, list)).all()
-        columns_list = columns_type.index[columns_type].tolist()
-
-        # cols_stack
-        cols_stack = psdf.apply(lambda x: x.astype(
-            str).str.match(r'[a-zA-Z0.-9]+-[a-zA-Z0.-9]+'))
-        colsnames_stack = psdf.columns[cols_stack.any()].tolist()
-        # add column for chimera script
-       
-        if 'PDB_interacting_3D_position' in colsnames_stack:
-            #psdf['Interface_interacting_positions'] = psdf['PDB_interacting_position']  
-            psdf['Chimera_interacting_position'] = psdf['PDB_interacting_3D_position']
-        if 'Evalue' in colsnames_stack:
-            colsnames_stack.remove('Evalue')
-        if 'PDB_code' in colsnames_stack:
-            colsnames_stack.remove('PDB_code')
-        if 'PDB_3D_position' in colsnames_stack:
-            #colsnames_stack.remove('PDB_3D_position')
-            psdf['Chimera_3D_position'] = psdf['PDB_3D_position']
-        if 'Structure_feature_id' in colsnames_stack:
-            colsnames_stack.remove('Structure_feature_id')
-        if any(colsnames_stack):
-            psdf = explode(psdf , colsnames_stack, '-')
-        elif any(columns_list):
-            psdf = explode(
-                psdf, columns_list, '-')
-        else:
-            psdf[colsnames_stack] = \
-                psdf[colsnames_stack].astype(str)
- 
-        # if default database is used minor modifications are needed
-        if pident is not None:
-            logger.info('Filtering interfaces by pident = ' +
-                        str(pident) + '%.')
-            # filter by pident
-            pident = int(pident)  # from str to int
-            psdf = psdf.loc[psdf.Pident >= pident]
-            # if pident threshold is to high, the next maximum value of pident is
-            # notified in log file
-            if psdf.empty:
-                alt_pident = psdf.loc[:, "Pident"].max()
-                logger.error('Warning: for prot_id ' + str(pident) +
-                             ', the variable "Pident" equal to ' +
-                             str(pident) + ' is too high.\n A threshold lower than or equal to ' +
-                             str(alt_pident) + ' would retrieve results.')
-
-                raise IOError()
-        if evalue is not None:
-            logger.info('Filtering interfaces by evalue = ' +
-                        str(evalue) + '%.')
-            # filter by pident
-            evalue = float(evalue)  # from str to int
-            psdf = psdf.loc[psdf.Evalue >= evalue]
-            # if pident threshold is to high, the next maximum value of pident is
-            # notified in log file
-            if psdf.empty:
-                alt_evalue = psdf.loc[:, "Evalue"].min()
-                logger.error('Warning: for prot_id ' + str(evalue) +
-                             ', the variable "Evalue" equal to ' +
-                             str(evalue) + ' is too low.\n A threshold higher than or equal to ' +
-                             str(alt_evalue) + ' would retrieve results.')
-
-                raise IOError()       
+        psdf = filter_structures(psdf, pident, evalue, logger)
     except IOError:
         psdf = False
-        
+
     if psdf is False and annovars is False:
         logger.error('Protein ' +
                      prot_id + 'could not be parsed.')
@@ -197,151 +636,24 @@ def mapper(prot_id,  gene_id, transcript_id, psdb, vardb, out_dir, pident, evalu
                      prot_id + 'has no mapping positions.')
         raise IOError
 
-    elif psdf is False and annovars is not False:
-
-        if loc:
-            # remove non protein coding positions
-            annovars.drop_duplicates(inplace=True)
-            try:
-                noncoding_positions_index = annovars.Amino_acids.str.contains(
-                    '\.|\-', regex=True, na=False)
-                noncoding_positions = annovars.loc[noncoding_positions_index]
-            except:
-                noncoding_positions = False
-            # non-protein coding mutations
-            if noncoding_positions is not False:
-                noncoding_positions['APPRIS_isoform'] = ''
-                noncoding_positions['Mapping_position'] = 'Noncoding'
-                writefile(prot_id, out_dir, pident, isoform, consequence,
-                          noncoding_positions, 'NoncodingPositions', csv, hdf)
-                unmapped_positions = annovars.loc[~noncoding_positions_index]
-            else:
-                unmapped_positions = annovars
-
-            if unmapped_positions.empty is False:
-                unmapped_positions.drop_duplicates(inplace=True)
-                unmapped_positions['APPRIS_isoform'] = ''
-                unmapped_positions['Mapping_position'] = 'Unmapped'
-                writefile(prot_id, out_dir, pident, isoform, consequence,
-                          unmapped_positions, 'UnmappedPositions', csv, hdf)
-        
-    elif psdf is not False and annovars is not False:
-        # for sucessful merge, Protein_position column must be str type
-        psdf['Protein_position'] = psdf['Protein_position'].astype(str)
-        annovars['Protein_position'] = annovars['Protein_position'].astype(str)
-        annovars['APPRIS_isoform'] = APPRIS
-       # annovars['Uniprot_accession'] = Uniprot_id
-        # Merge them both files
-        mapped_positions = annovars.join(
-            psdf.set_index('Protein_position'), on='Protein_position', how='inner')
-
-        if isoform is None:
-            isoform = ['all']
-        if consequence is None:
-            consequence = ['all']
-        ###########################################################################
-        # Locate rest of positions (mapping to a structure or not)
-        ###########################################################################
-        if loc:
-            # remove already mapped positions
-            try:
-                left_positions = annovars.drop(list(set(mapped_positions.index)))
-            except:
-                left_positions = annovars
-            # remove non protein coding positions
-            if left_positions.empty is False:
-                left_positions.drop_duplicates(inplace=True)
-                noncoding_positions_index = left_positions.Amino_acids.str.contains(
-                    '\.|\-', regex=True, na=False)
-                noncoding_positions = left_positions.loc[noncoding_positions_index]
-                # non-protein coding mutations
-                if noncoding_positions.empty is False:
-                   # noncoding_positions = noncoding_positions.drop(
-                   #     columns=['Uniprot_accession'])  # not needed
-                    noncoding_positions['Mapping_position'] = 'Noncoding'
-                    writefile(prot_id, out_dir, pident, isoform, consequence,
-                              noncoding_positions, 'NoncodingPositions', csv, hdf)
-                    left_positions = left_positions.loc[~noncoding_positions_index]
-                left_positions['Protein_accession'] = prot_id
-
-                # remove protein position since we know there are no matching positions
-                # and will reduce the maximum number of combinations of rows
-                #pdb.id ensembl.prot.id temp.chain int.chain 
-                psdf = psdf.loc[:, ['PDB_code', 'Protein_accession',
-                                    'PDB_chain', 'Protein_alignment_start',
-                                     'Protein_alignment_end', 'PDB_alignment_start',
-                                      'PDB_alignment_end', 'Pident']]
-                #psdf = psdf.iloc[:, np.r_[0:3, 4:9]]
-                psdf.drop_duplicates(inplace=True)
-                # merge rest of positions with protein structures
-                unmapped_positions = left_positions.join(
-                    psdf.set_index('Protein_accession'), on='Protein_accession', how='inner')
-                # convert col to numeric to make comparison
-                unmapped_positions['Protein_position'] = pd.to_numeric(
-                    unmapped_positions['Protein_position'], errors='coerce')
-                unmapped_positions['Protein_position'] = unmapped_positions.Protein_position.values.astype(
-                    int)
-                unmapped_positions[(unmapped_positions.Protein_position.values >= unmapped_positions.Protein_alignment_start.values) & (
-                    (unmapped_positions.Protein_position <= unmapped_positions.Protein_alignment_end))]
-                # mapped position is on the rest of the structure
-                structure_positions = mapped_positions[mapped_positions['Interaction_type'].isna()]
-                structure_positions = structure_positions.drop(['Chimera_interacting_position', 'Chimera_3D_position',
-                                                              'PDB_interacting_3D_position','PDB_interacting_aa',
-                                                              'Interface_min_distance', 'PDB_interacting_B_factor'], axis=1)
-                # do proper arragenments if no resulst are retrieved
-                if structure_positions.empty is False:
-                    structure_positions.drop_duplicates(inplace=True)
-                    #structure_positions['PDB_seq_position'] = structure_positions['Protein_position'] - \
-                    # structure_positions['Protein_alignment_start'] + structure_positions['PDB_alignment_start']
-                    structure_positions['Mapping_position'] = 'Structure'
-                    writefile(prot_id, out_dir, pident, isoform, consequence,
-                              structure_positions, 'StructurePositions', csv, hdf)
-                    #unmapped_positions = left_positions#[~left_positions.index.isin(structure_positions.index)]
-
-                if unmapped_positions.empty is False:
-                    cs = annovars.columns.values.tolist()
-                    cs.append("Protein_accession")  
-                    unmapped_positions = unmapped_positions[[c for c in unmapped_positions.columns if c in cs]]
-                    unmapped_positions.drop_duplicates(inplace=True)
-                    unmapped_positions['Mapping_position'] = 'Unmapped'
-                    writefile(prot_id, out_dir, pident, isoform, consequence,
-                            unmapped_positions, 'UnmappedPositions', csv, hdf)
-                # else:
-                #     try:
-                #         unmapped_positions = left_positions
-                #         if unmapped_positions.empty is False:
-                #             unmapped_positions.drop_duplicates(inplace=True)
-                #             unmapped_positions['Mapping_position'] = 'Unmapped'
-                #             writefile(prot_id, out_dir, pident, isoform, consequence,
-                #                       unmapped_positions, 'Unmappedpositions', csv, hdf)
-                #     except:
-                #         pass
-                del (structure_positions, left_positions,
-                     noncoding_positions, noncoding_positions_index)  
-        ###########################################################################
-        # stop if there are no results
-        if mapped_positions.empty:
-            # report results
-            logger.warning('Warning: ' + prot_id +
-                           ' does not map with any annotated position.\n')
-        # if merging was successful, create setID file and
-        # save the merged dataframe as well
-        else:
-            
-            mapped_positions['Mapping_position'] = 'Interface'
-            mapped_positions = mapped_positions[mapped_positions['Interaction_type'].notna()]
-            setID_file = mapped_positions[['Structure_feature_id',
-                                          'Uploaded_variation']]
-            setID_file.drop_duplicates(inplace=True)
-            mapped_positions.drop_duplicates(inplace=True)
-            # Save the merged dataframe, appending results and not
-            #  reapeting headers
-            with open(os.path.join(out_dir, ('setID_pident' + str(pident) + '_isoform_' +
-                                             '_'.join(isoform) + '_consequence_' + '_'.join(consequence) + '.txt')), 'a') as f:
-                setID_file.to_csv(f, sep=',', index=False,
-                                  header=f.tell() == 0)
-            writefile(prot_id, out_dir, pident, isoform, consequence,
-                      mapped_positions, 'InterfacePositions', csv, hdf)
-
-            del(mapped_positions)
-        del(psdf, annovars)
+    elif psdf is False:
+        # variants of proteins without structures are only reported
+        # when locating all the positions
+        if not loc:
+            return NO_STRUCTURE
+        annovars['APPRIS_isoform'] = constant_category('', len(annovars))
+        psdf = None
+    else:
+        annovars['APPRIS_isoform'] = constant_category(APPRIS, len(annovars))
+    annovars['Protein_accession'] = prot_id
+
+    results, mapped = map_positions(annovars, psdf, loc, groups)
+    write_results(results, out_dir, pident, isoform,
+                  consequence, csv, hdf, parquet, sink)
+    # stop if there are no results
+    if psdf is not None and not mapped:
+        # report results
+        logger.warning('Warning: ' + prot_id +
+                       ' does not map with any annotated position.\n')
+    del(psdf, annovars, results)
+    return MAPPED if mapped else NO_STRUCTURE
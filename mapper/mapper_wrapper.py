@@ -7,10 +7,13 @@ import os
 import re
 from subprocess import call
 import itertools
+import tracemalloc
 from .logger import get_logger
 from .translate import translate
 from .db_parser import parser
-from .mapper import mapper
+from .mapper import mapper, select_variants, constant_category, mapping_types
+from .psdb_cache import psdb_cache
+from .id_stream import ERROR, NO_VARIANTS, NO_STRUCTURE, best_status
 from .decorator import tags
 from .run_subprocess import call_subprocess
 from .writefile import writefile
@@ -23,14 +26,37 @@ DNA = '\U0001F9EC'
 detect_column = "grep -v '##' {} | awk -F ' ' '{{for(i=1;i<=NF;i++) \
 {{if ($i ~ /{}/){{print i; exit}}}}}}' "
 
+def memory_start():
+    # allocated memory before mapping a protein, None if allocations are
+    # not traced (see --memory)
+    if not tracemalloc.is_tracing():
+        return None
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def log_peak_memory(prot_id, start, logger):
+    # peak of memory allocated while mapping a protein
+    if start is not None:
+        peak = tracemalloc.get_traced_memory()[1] - start
+        logger.info('Peak memory of ' + prot_id + ': ' +
+                    str(round(peak / 1e6, 1)) + ' MB.')
+
+
 # @tags(text_start="Running 3Dmapper...",
 #       text_succeed=" Running 3Dmapper...done.",
 #       text_fail=" Running 3Dmapper...failed!",
 #       emoji=DNA)
-def wrapper(id, psdb, vardb, out_dir, pident, evalue, isoform, consequence, loc, index_file, dict_geneprot, varid=None, csv = False, hdf = False):
+def wrapper(id, psdb, vardb, out_dir, pident, evalue, isoform, consequence, loc, index_file, dict_geneprot, varid=None, csv = False, hdf = False, parquet = False, psdb_cache_mb = None, sink = None):
     
     # logging
     logger = get_logger('wrapper', out_dir)
+    # memory ceiling of the cache of protein structures of this process
+    if psdb_cache_mb is not None:
+        psdb_cache.set_max_mb(float(psdb_cache_mb))
+    hits, misses = psdb_cache.stats()
+    status = ERROR
     # translate ensembl id
     try:
         if id == '-': 
@@ -47,8 +73,9 @@ def wrapper(id, psdb, vardb, out_dir, pident, evalue, isoform, consequence, loc,
 
         # run 3Dmapper
         for i in range(0, len(prot_id)):
+            memory = memory_start()
             try:
-                mapper(prot_id[i],
+                status = best_status(status, mapper(prot_id[i],
                           gene_id[i],
                           transcript_id[i],
                           psdb,
@@ -62,16 +89,21 @@ def wrapper(id, psdb, vardb, out_dir, pident, evalue, isoform, consequence, loc,
                           loc,
                           varid,
                           csv,
-                          hdf)
+                          hdf,
+                          parquet,
+                          sink))
         # error handling
             except IOError:
+                status = best_status(status, NO_VARIANTS)
                 if varid is None:
                     logger.error(
                         ('Warning: {} has no mapping positions.'.format(id)))
                 else:
                     logger.error(
-                        ('Warning: {} has no mapping positions.'.format(str(varid))))
-                continue
+                        ('Warning: {} has no mapping positions.'.format(
+                            varid if isinstance(varid, str) else ', '.join(varid))))
+            finally:
+                log_peak_memory(prot_id[i], memory, logger)
         
      # error handling
     except IOError:
@@ -101,22 +133,11 @@ def wrapper(id, psdb, vardb, out_dir, pident, evalue, isoform, consequence, loc,
                     #annovars_left = annovars[annovars['Feature']==id]
                             # filter by position type if one or more selected
                 if varid is not None:
-                    if 'Existing_variation' in annovars_left.columns:
-                        annovars_left =  annovars_left[
-                            (annovars_left.Uploaded_variation.astype(str) == str(varid)) |
-                            ( annovars_left.Existing_variation.astype(str) == str(varid)) ]
-                    else:
-                        annovars_left =  annovars_left[
-                            ( annovars_left.Uploaded_variation.astype(str) == str(varid))]
-                    logger.info('position \'' + str(varid) + '\' has been selected.')
-                    # if filter returns an empty df, raise error
-                    if annovars_left.empty:
-                        logger.error(
-                            'positions could not be filtered by position id \'' + str(varid) + '\'')
-                        raise IOError()
+                    annovars_left = select_variants(annovars_left, varid, logger)
                 try: 
                     noncoding_positions_index = annovars_left.Amino_acids.str.contains('\.|\-', regex=True, na = True)
-                    noncoding_positions = annovars_left.loc[noncoding_positions_index]
+                    noncoding_positions = annovars_left.take(
+                        np.flatnonzero(noncoding_positions_index.values))
                 except: 
                     noncoding_positions = False 
                 if isoform is None:
@@ -125,19 +146,27 @@ def wrapper(id, psdb, vardb, out_dir, pident, evalue, isoform, consequence, loc,
                     consequence = ['all']  
                 # non-protein coding mutations
                 if noncoding_positions is not False:
-                    noncoding_positions['APPRIS_isoform'] = ''
-                    noncoding_positions['Mapping_position'] = 'Noncoding'
-                    writefile(transcript_id, out_dir, pident, isoform, consequence, noncoding_positions, 'NoncodingPositions', csv, hdf)
-                    unmapped_positions = annovars_left.loc[~noncoding_positions_index]
+                    noncoding_positions['APPRIS_isoform'] = constant_category(
+                        '', len(noncoding_positions))
+                    noncoding_positions['Mapping_position'] = constant_category(
+                        'Noncoding', len(noncoding_positions), mapping_types)
+                    writefile(transcript_id, out_dir, pident, isoform, consequence, noncoding_positions, 'NoncodingPositions', csv, hdf, parquet, sink)
+                    unmapped_positions = annovars_left.take(
+                        np.flatnonzero(~noncoding_positions_index.values))
                 else: 
                     unmapped_positions = annovars_left
                         
                 if unmapped_positions.empty is False:
                     #unmapped_positions = unmapped_positions.iloc[:, 0:16]
-                    unmapped_positions.drop_duplicates(inplace=True)
-                    unmapped_positions['APPRIS_isoform'] = ''
-                    unmapped_positions['Mapping_position'] = 'Unmapped'
-                    writefile(transcript_id, out_dir, pident, isoform, consequence, unmapped_positions, 'UnmappedPositions', csv, hdf)
+                    unmapped_positions = unmapped_positions.drop_duplicates()
+                    unmapped_positions['APPRIS_isoform'] = constant_category(
+                        '', len(unmapped_positions))
+                    unmapped_positions['Mapping_position'] = constant_category(
+                        'Unmapped', len(unmapped_positions), mapping_types)
+                    writefile(transcript_id, out_dir, pident, isoform, consequence, unmapped_positions, 'UnmappedPositions', csv, hdf, parquet, sink)
+                    status = NO_STRUCTURE
             except:
                 pass
         logger.error('Warning: {} has no matching ensembl ids.'.format(id))
+    # status of the id, cache hits and misses of this call
+    return status, psdb_cache.stats()[0] - hits, psdb_cache.stats()[1] - misses
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+# import necessary modules
+import os
+import time
+import multiprocessing as mp
+
+from .writefile import writefile, close_parquet
+from .journal import checkpoint_time
+
+# number of buffered rows that triggers a flush to disk
+batch_rows = 200000
+
+
+class SinkTask:
+    '''
+    Handle given to one parallel job to send its results to the writer
+    process. Results are tagged with the number of the job so that they
+    are written in the order in which the jobs were submitted.
+    '''
+
+    def __init__(self, queue, seq):
+        self.queue = queue
+        self.seq = seq
+
+    def write(self, protid, maptype, df, csv=False, hdf=False, parquet=False):
+        self.queue.put((self.seq, protid, maptype, df, csv, hdf, parquet))
+
+    def done(self, ids=()):
+        # the job has sent all its results, the (id, status) of its ids
+        # are sent in place of the protein id
+        self.queue.put((self.seq, list(ids), None, None, None, None, None))
+
+    def run(self, func, *args):
+        '''
+        Run wrapper sending its results to the writer process.
+        '''
+        ids = []
+        try:
+            result = func(*args, sink=self)
+            ids.append((args[0], result[0]))
+            return result
+        finally:
+            self.done(ids)
+
+
+def flush(buffer, out_dir, pident, isoform, consequence):
+    '''
+    Write the buffered results, opening every output file once.
+
+    Parameters
+    ----------
+    buffer : dict
+        Results to write by type of output, as lists of
+        (protid, df, csv, hdf, parquet).
+    '''
+    for maptype, items in buffer.items():
+        if maptype == 'setID':
+            fn = os.path.join(out_dir, ('setID_pident' + str(pident) + '_isoform_' +
+                                        '_'.join(isoform) + '_consequence_' + '_'.join(consequence) + '.txt'))
+            with open(fn, 'a') as f:
+                for protid, df, csv, hdf, parquet in items:
+                    df.to_csv(f, sep=',', index=False, header=f.tell() == 0)
+            continue
+        csv_items = [df for protid, df, csv, hdf, parquet in items if csv is True]
+        if csv_items:
+            fn = os.path.join(out_dir, 'csv', (maptype + '_pident' + str(pident) + '_isoform_' +
+                                               '_'.join(isoform) + '_consequence_' + '_'.join(consequence) + '.csv'))
+            with open(fn, 'a') as f:
+                # frames are appended one by one instead of concatenated,
+                # so that the dtypes (and text) of each frame are kept
+                for df in csv_items:
+                    df.to_csv(f, sep=',', index=False, header=f.tell() == 0)
+        for protid, df, csv, hdf, parquet in items:
+            if hdf is True or parquet is True:
+                writefile(protid, out_dir, pident, isoform, consequence,
+                          df, maptype, False, hdf, parquet)
+    buffer.clear()
+
+
+def writer(queue, out_dir, pident, isoform, consequence, journal=None):
+    '''
+    Single writer process. Receives the results of the parallel jobs,
+    holds them until all the previous jobs have finished and writes them
+    in batches. The ids of the jobs written are added to the journal.
+    '''
+    pending = {}
+    finished = {}
+    next_seq = 0
+    buffer = {}
+    n_rows = 0
+    # (id, status) of the jobs in the buffer
+    buffer_ids = []
+    while True:
+        msg = queue.get()
+        if msg is None:
+            break
+        seq, protid, maptype, df, csv, hdf, parquet = msg
+        if maptype is None:
+            finished[seq] = protid
+        else:
+            pending.setdefault(seq, []).append(
+                (protid, maptype, df, csv, hdf, parquet))
+        # move the results of the finished jobs, in order, to the buffer
+        while next_seq in finished:
+            for protid, maptype, df, csv, hdf, parquet in pending.pop(next_seq, []):
+                buffer.setdefault(maptype, []).append(
+                    (protid, df, csv, hdf, parquet))
+                n_rows += len(df)
+            buffer_ids.extend(finished.pop(next_seq))
+            next_seq += 1
+        if n_rows >= batch_rows or (journal is not None and buffer_ids and
+                                    time.time() - journal.last >= checkpoint_time):
+            flush(buffer, out_dir, pident, isoform, consequence)
+            n_rows = 0
+            if journal is not None:
+                for id, status in buffer_ids:
+                    journal.add(id, status)
+                journal.checkpoint()
+            buffer_ids = []
+    flush(buffer, out_dir, pident, isoform, consequence)
+    if journal is not None:
+        for id, status in buffer_ids:
+            journal.add(id, status)
+        journal.checkpoint()
+    # results of jobs that did not finish are written last, in order, and
+    # not journaled
+    for seq in sorted(pending):
+        for protid, maptype, df, csv, hdf, parquet in pending[seq]:
+            buffer.setdefault(maptype, []).append(
+                (protid, df, csv, hdf, parquet))
+    flush(buffer, out_dir, pident, isoform, consequence)
+    close_parquet()
+
+
+class OutputSink:
+    '''
+    Output files shared by parallel jobs. Jobs send their results through
+    a queue to a single writer process, so rows of different jobs are
+    never interleaved, headers are written once and results are written
+    in the order in which the jobs were submitted.
+
+    Parameters
+    ----------
+    out_dir : str
+        Output directory
+    pident : int
+        Thershold of sequence identity (percertage).
+    isoform : list
+        Isoform filter, None if none.
+    consequence : list
+        Consequence filter, None if none.
+    journal : Journal
+        Journal of the run, None if none.
+    '''
+
+    def __init__(self, out_dir, pident, isoform, consequence, journal=None):
+        if consequence is None:
+            consequence = ['all']
+        if isoform is None:
+            isoform = ['all']
+        # a manager queue can be sent to the joblib workers
+        self.manager = mp.Manager()
+        self.queue = self.manager.Queue()
+        self.seq = 0
+        self.process = mp.Process(target=writer,
+                                  args=(self.queue, out_dir, pident,
+                                        isoform, consequence, journal))
+        self.process.start()
+
+    def task(self):
+        '''
+        Handle for the next job.
+        '''
+        task = SinkTask(self.queue, self.seq)
+        self.seq += 1
+        return task
+
+    def close(self):
+        '''
+        Write the remaining results and stop the writer process.
+        '''
+        self.queue.put(None)
+        self.process.join()
+        self.manager.shutdown()
+        if self.process.exitcode != 0:
+            raise IOError()
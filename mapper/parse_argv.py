@@ -70,6 +70,11 @@ def parse_commandline():
                         help="filter by consequence type, e.g.:'missense_variant'. \
                             The set of consequences is defined by Sequence Ontology (http://www.sequenceontology.org/).", default=None)
 
+    # expand the consequence filter to the Sequence Ontology descendants
+    parser.add_argument('-so', "--so-descendants", dest="so_descendants", action='store_true',
+                        help="with --consequence, keep also the consequence types that descend from the given ones \
+                            in the Sequence Ontology, e.g. missense_variant for protein_altering_variant.", default=False)
+
     # filter by isoforms
     parser.add_argument('-i', "--isoform", nargs='+', dest="isoform", metavar="<String>",
                         help="filter by a single or a list of APPRIS isoforms. \
@@ -94,12 +99,20 @@ def parse_commandline():
     file_dest.add_argument('-a', "--append", dest="append", action='store_true',
                         help="Two or more calls to the program write are able to append results to the same output file.",
                         default=False)
+    file_dest.add_argument('-r', "--resume", dest="resume", action='store_true',
+                        help="Continue an interrupted run in the same output directory, skipping the ids already mapped.",
+                        default=False)
     
     # create default output directory
     parser.add_argument('-p', "--parallel", dest="parallel", action='store_true',
                         default=False,
                         help="Parallelize process")
 
+    # parallel workers initialized once, fed with chunks of ids
+    parser.add_argument('-pool', "--worker-pool", dest="pool", action='store_true',
+                        default=False,
+                        help="With --parallel, initialize every worker once and send it the ids in chunks sized from the measured time per id.")
+
     # interfaces database file
     parser.add_argument("-j", "--jobs", dest="njobs", metavar="<int>",
                         help="number of jobs to run in parallel")
@@ -109,6 +122,18 @@ def parse_commandline():
                         help="Print progress.", default=False)
     parser.set_defaults(njobs=None)
 
+    # memory ceiling of the cache of parsed protein structures files
+    parser.add_argument("-cache", "--psdb-cache", dest="psdb_cache", metavar="<float>",
+                        help="maximum memory (MB) used by each process to keep parsed protein structures files. Default is 512.", default=512)
+
+    # report memory
+    parser.add_argument('-mem', "--memory", dest="memory", action='store_true',
+                        help="Log the peak memory used to map every protein (slower).", default=False)
+
+    # map all the input ids at once
+    parser.add_argument('-b', "--batch", dest="batch", action='store_true',
+                        help="Map all the input protein ids in a single join instead of one by one.", default=False)
+
     # force overwrite
     parser.add_argument('-l', "--location", dest="loc", action='store_true',
                         help="Map all variants and detect their location.", default=False)
@@ -119,8 +144,12 @@ def parse_commandline():
     
     # save final results in HDF5 format
     parser.add_argument('-hdf', dest="hdf", action='store_true',
-                        help="Write the contained data to an HDF5 file using HDFStore.", default=False)
+                        help="Write the contained data of all proteins to one HDF5 dataset per type of mapping (needs vaex).", default=False)
+
 
+    # save final results in Parquet format
+    parser.add_argument('-parquet', dest="parquet", action='store_true',
+                        help="Write the contained data of all proteins to one compressed Parquet file per type of mapping.", default=False)
 
     # create chimera script to visualize the region of interest
     # parser.add_argument("-chimera", action="store_true", dest="chimera",
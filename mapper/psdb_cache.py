@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# import necessary modules
+import glob
+import os
+from collections import OrderedDict
+
+from .db_parser import read_file, categorize
+from .explode import explode_psdb
+
+
+class PsdbCache:
+    '''
+    Least recently used cache of parsed and exploded protein structures
+    files. Entries are keyed by file path and modification time, so an
+    updated file is parsed again, and the least recently used entries are
+    dropped when the cached frames exceed the memory ceiling.
+
+    Parameters
+    ----------
+    max_mb : float
+        Memory ceiling in megabytes. 0 disables the cache.
+    '''
+
+    def __init__(self, max_mb=512):
+        self.max_bytes = max_mb * 1e6
+        self.frames = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def set_max_mb(self, max_mb):
+        self.max_bytes = max_mb * 1e6
+        self.shrink()
+
+    def shrink(self):
+        # drop least recently used frames until below the ceiling
+        while self.frames and self.size > self.max_bytes:
+            key, (df, size) = self.frames.popitem(last=False)
+            self.size -= size
+
+    def load(self, prot_id, psdb):
+        '''
+        Parsed and exploded structures file of a protein.
+
+        Parameters
+        ----------
+        prot_id : str
+            Ensembl protein id
+        psdb : str
+            Directory where to find interface database
+
+        Returns
+        -------
+        df
+            copy of the cached frame. IOError is raised if the protein
+            has no structures file.
+        '''
+        f = glob.glob(os.path.join(psdb, (prot_id + '.*')))
+        if not f:
+            raise IOError()
+        key = (f[0], os.path.getmtime(f[0]))
+        if key in self.frames:
+            self.hits += 1
+            self.frames.move_to_end(key)
+            return self.frames[key][0].copy()
+        self.misses += 1
+        df = read_file(f[0])
+        # databases created with makepsdb --format parquet are already
+        # exploded, with one integer Protein_position per row
+        if df['Protein_position'].dtype.kind not in 'iu':
+            df = categorize(explode_psdb(df))
+        size = df.memory_usage(deep=True).sum()
+        if size <= self.max_bytes:
+            self.frames[key] = (df, size)
+            self.size += size
+            self.shrink()
+            # callers filter and modify the frame they get
+            return df.copy()
+        return df
+
+    def stats(self):
+        return self.hits, self.misses
+
+
+# cache of the mapper process
+psdb_cache = PsdbCache()
@@ -6,7 +6,7 @@ import os
 import re
 import pandas as pd
 import numpy as np
-from .run_subprocess import call_subprocess
+from .translate_index import translate_index
 from .logger import get_logger
 
 
@@ -32,41 +32,29 @@ def translate(id, log_dir,dict_geneprot=None, isoform_filter=None):
     #if dict_geneprot is None : 
     #dict_geneprot = os.path.join(dirname, "data/biomart_GRCh38p13_feb2021.dat")
 
-    with open(dict_geneprot) as f:
-        # get col names
-        cols = f.readline().rstrip().split(',')
-        # command line for grep (very fast)
-        cmd = 'grep \'' + id + '\' ' + dict_geneprot
-        # call shell process
-        out, err = call_subprocess(cmd)
-        line = out.decode('utf-8')
-        # avoid possible errors
-        if out != b'':
-            list_ids = line.split('\n')[:-1]
-            df = pd.DataFrame(np.array(list_ids), columns=list("l"))
-            #df[['isoform', 'geneID', 'transcriptID', 'protID', 'UniprotID']
-            #   ] = df['l'].str.split(',', expand=True)
-            df[cols
-               ] = df['l'].str.split(',', expand=True)
-            # filter by principal isoform if any filter
-            protID = df['protID'].tolist()
-            geneID = df['geneID'].tolist()
-            transcriptID = df['transcriptID'].tolist()
-            results = {'protID': protID, 'geneID': geneID, 'transcriptID': transcriptID}
-            if isoform_filter is not None:
-                df = df[df['isoform'].isin(isoform_filter)]
-                if df.empty:
-                    logger.error(
-                        'Input isoform filter ' + isoform_filter + ' does not exist. Please check if you misspelt it.')
-                    raise IOError()
-                else : 
-                    APPRIS = df['isoform'].tolist()
-                    results['APPRIS'] = APPRIS
-                  
-            return results
+    # exact match of the id in any of the id columns
+    index = translate_index(dict_geneprot)
+    rows = index['ids'].get(id)
+    # avoid possible errors
+    if rows:
+        df = pd.DataFrame(rows, columns=index['cols'])
+        # filter by principal isoform if any filter
+        if isoform_filter is not None:
+            df = df[df['isoform'].isin(isoform_filter)]
+            if df.empty:
+                logger.error(
+                    'Input isoform filter ' + str(isoform_filter) + ' does not exist. Please check if you misspelt it.')
+                raise IOError()
+        protID = df['protID'].tolist()
+        geneID = df['geneID'].tolist()
+        transcriptID = df['transcriptID'].tolist()
+        results = {'protID': protID, 'geneID': geneID, 'transcriptID': transcriptID}
+        if isoform_filter is not None:
+            APPRIS = df['isoform'].tolist()
+            results['APPRIS'] = APPRIS
+        return results
 
-        else:
-            logger.error(
-                'Input Ensembl ID is neither a protein nor a gene.')
-            raise IOError
-            
+    else:
+        logger.error(
+            'Input Ensembl ID is neither a protein nor a gene.')
+        raise IOError
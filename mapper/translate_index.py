@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+# import necessary modules
+import os
+import pickle
+import pandas as pd
+
+# indexes already loaded by this process, by file
+loaded = {}
+
+
+def build_index(dict_geneprot):
+    '''
+    Index every row of the ids file by each of its ids.
+
+    Parameters
+    ----------
+    dict_geneprot : str
+        File that contains protein, transcripts and gene IDs.
+
+    Returns
+    -------
+    dict
+        'cols', the column names of the file, and 'ids', the rows of the
+        file containing each id.
+    '''
+    df = pd.read_csv(dict_geneprot, sep=',', dtype=str,
+                     keep_default_na=False)
+    cols = list(df.columns)
+    # every column but the APPRIS isoform holds ids
+    id_cols = [i for i, c in enumerate(cols) if c != 'isoform']
+    ids = {}
+    for row in df.itertuples(index=False, name=None):
+        for i in id_cols:
+            if row[i] == '':
+                continue
+            rows = ids.setdefault(row[i], [])
+            # an id repeated in two columns of the same row
+            if not rows or rows[-1] is not row:
+                rows.append(row)
+    return {'cols': cols, 'ids': ids}
+
+
+def translate_index(dict_geneprot):
+    '''
+    Load the index of the ids file. The index is built once and pickled
+    next to the file, so that later runs and parallel workers only need
+    to unpickle it. The pickled index is rebuilt if the ids file has been
+    modified after it.
+
+    Parameters
+    ----------
+    dict_geneprot : str
+        File that contains protein, transcripts and gene IDs.
+
+    Returns
+    -------
+    dict
+        'cols', the column names of the file, and 'ids', the rows of the
+        file containing each id.
+    '''
+    mtime = os.path.getmtime(dict_geneprot)
+    # already loaded by this process
+    if dict_geneprot in loaded and loaded[dict_geneprot][0] == mtime:
+        return loaded[dict_geneprot][1]
+    cache = dict_geneprot + '.idx'
+    index = None
+    if os.path.isfile(cache):
+        try:
+            with open(cache, 'rb') as f:
+                cache_mtime, index = pickle.load(f)
+            if cache_mtime != mtime:
+                index = None
+        except Exception:
+            index = None
+    if index is None:
+        index = build_index(dict_geneprot)
+        # write to a temporary file first so that parallel workers never
+        # read a half written index
+        tmp = cache + '.' + str(os.getpid())
+        try:
+            with open(tmp, 'wb') as f:
+                pickle.dump((mtime, index), f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, cache)
+        except OSError:
+            # read-only directory, the index is kept in memory only
+            if os.path.isfile(tmp):
+                os.remove(tmp)
+    loaded[dict_geneprot] = (mtime, index)
+    return index
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+# import necessary modules
+import os
+import pandas as pd
+import pyarrow.parquet as pq
+
+from .consequence import term_separator
+
+# index created by makevariantsdb (see makevariantsdb/create_var_index.py)
+index_name = 'variants.index.parquet'
+
+
+def lookup_varids(ids, vardb):
+    '''
+    Find the transcripts of a list of variant ids in a single pass over the
+    variants index. Ids are matched exactly against 'Uploaded_variation'
+    and every id of 'Existing_variation'.
+
+    Parameters
+    ----------
+    ids : list
+        variant ids
+    vardb : str
+        directory of the variants database
+
+    Returns
+    -------
+    dict
+        transcript ids of every variant id found, in index order.
+    '''
+    ids = set(ids)
+    index_file = os.path.join(vardb, index_name)
+    if os.path.isfile(index_file):
+        # the index is sorted by id, so only the row groups that may
+        # contain the requested ids are read
+        df = pq.read_table(index_file, filters=[
+                           ('id', 'in', ids)]).to_pandas()
+    else:
+        # databases created before the sorted index existed: read the
+        # plain text index once
+        text_index = os.path.join(vardb, 'variants.index')
+        df = pd.read_csv(text_index, sep=' ', header=None, dtype=str,
+                         na_filter=False, usecols=[0, 2, 3],
+                         names=['Uploaded_variation', 'Gene', 'Feature',
+                                'Existing_variation'])
+        # ids joined with ',' in VEP files and with '&' in VCF files
+        existing = df.assign(
+            Existing_variation=df['Existing_variation'].str.split(
+                term_separator.pattern)).explode('Existing_variation')
+        df = pd.concat([df[['Uploaded_variation', 'Feature']].rename(
+                        columns={'Uploaded_variation': 'id'}),
+                        existing[['Existing_variation', 'Feature']].rename(
+                        columns={'Existing_variation': 'id'})])
+        df = df[df['id'].isin(ids)].drop_duplicates()
+    transcripts = {}
+    for id, feature in zip(df['id'], df['Feature']):
+        transcripts.setdefault(id, []).append(feature)
+    return transcripts
+
+
+def group_by_transcript(var_ids, transcripts):
+    '''
+    Group the requested variant ids by the transcript they belong to, so
+    that every transcript is mapped once for all its variants.
+
+    Parameters
+    ----------
+    var_ids : list
+        variant ids, in input order
+    transcripts : dict
+        transcript ids of every variant id, as returned by lookup_varids
+
+    Returns
+    -------
+    dict
+        variant ids of every transcript, in input order.
+    '''
+    # ids of every transcript as the keys of a dict, which keeps the input
+    # order and drops repeated ids in constant time
+    groups = {}
+    for id in var_ids:
+        if id not in transcripts:
+            continue
+        # variants outside of any transcript
+        for t in [t for t in transcripts[id] if t != '-'] or ['-']:
+            groups.setdefault(t, {})[id] = None
+    return {t: list(ids) for t, ids in groups.items()}
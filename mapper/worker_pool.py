@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+# import necessary modules
+import time
+import multiprocessing as mp
+from collections import deque
+from itertools import islice
+
+from .logger import get_logger
+from .mapper_wrapper import wrapper
+from .psdb_cache import psdb_cache
+from .translate_index import translate_index
+
+# duration aimed for every chunk of ids, in seconds. Long enough for the
+# dispatch overhead to be negligible and short enough to balance the load
+target_time = 1.0
+# largest chunk, so that the last chunks do not keep a single worker busy
+max_chunk = 256
+
+# arguments shared by all the tasks of a worker, set once by init_worker
+worker_args = {}
+
+
+def init_worker(common, outputs, psdb_cache_mb):
+    '''
+    Initialize a worker once: arguments shared by all the tasks, logger,
+    ids translation index and cache of protein structures.
+
+    Parameters
+    ----------
+    common : tuple
+        psdb, vardb, out_dir, pident, evalue, isoform, consequence, loc,
+        index_file and dict_geneprot arguments of wrapper.
+    outputs : tuple
+        csv, hdf and parquet arguments of wrapper.
+    psdb_cache_mb : float
+        Memory ceiling of the cache of protein structures.
+    '''
+    worker_args['common'] = common
+    worker_args['outputs'] = outputs
+    get_logger('wrapper', common[2])
+    translate_index(common[9])
+    psdb_cache.set_max_mb(float(psdb_cache_mb))
+
+
+def run_chunk(items, task):
+    '''
+    Map a chunk of ids in a worker.
+
+    Parameters
+    ----------
+    items : list
+        (id, varid) pairs to give to wrapper.
+    task : SinkTask
+        Handle to send the results to the writer process.
+
+    Returns
+    -------
+    tuple
+        time spent and (id, status, cache hits, cache misses) of every id.
+    '''
+    start = time.perf_counter()
+    results = []
+    try:
+        for id, varid in items:
+            results.append((id,) + wrapper(id, *worker_args['common'], varid,
+                                           *worker_args['outputs'], sink=task))
+    finally:
+        task.done((r[0], r[1]) for r in results)
+    return time.perf_counter() - start, results
+
+
+def run_pool(items, num_cores, common, outputs, psdb_cache_mb, sink):
+    '''
+    Map ids with a pool of workers initialized once. The ids are read
+    from items as chunks are sent, at most two per worker at a time, and
+    the size of the chunks is adapted to the time measured per id so that
+    every chunk takes about target_time seconds.
+
+    Parameters
+    ----------
+    items : iterable
+        (id, varid) pairs to give to wrapper.
+    num_cores : int
+        Number of workers.
+    sink : OutputSink
+        Writer process of the results.
+
+    Returns
+    -------
+    generator
+        (id, status, cache hits, cache misses) of every id, in input order.
+    '''
+    items = iter(items)
+    pending = deque()
+    size = 1
+    total_time = 0
+    total_items = 0
+    exhausted = False
+    pool = mp.Pool(num_cores, initializer=init_worker,
+                   initargs=(common, outputs, psdb_cache_mb))
+    try:
+        while not exhausted or pending:
+            # keep every worker busy with up to two chunks
+            while not exhausted and len(pending) < 2 * num_cores:
+                chunk = list(islice(items, size))
+                if not chunk:
+                    exhausted = True
+                    break
+                pending.append(pool.apply_async(run_chunk,
+                                                (chunk, sink.task())))
+            if not pending:
+                break
+            elapsed, results = pending.popleft().get()
+            # adapt the chunk size to the mean time per id
+            total_time += elapsed
+            total_items += len(results)
+            if total_time > 0:
+                size = max(1, min(max_chunk, int(
+                    target_time * total_items / total_time)))
+            for result in results:
+                yield result
+    finally:
+        pool.close()
+        pool.join()
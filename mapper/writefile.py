@@ -1,18 +1,139 @@
 import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 
-def writefile(protid, out_dir, pident, isoform, consequence, df, maptype, csv= False, hdf = False):
-    if csv is True: 
+# vaex is only needed to write HDF5 files. Import it once instead of in
+# every call to writefile
+try:
+    import vaex
+except ImportError:
+    vaex = None
+
+# parquet files opened by this process, by output directory. Every map
+# type is appended to a single file per process, or to a new one when
+# the columns of the results change
+parquet_writers = {}
+# tables waiting to be written, by output directory. Small tables are
+# grouped so that the file has a few large row groups
+parquet_buffers = {}
+# number of buffered rows that triggers a new row group
+row_group_rows = 100000
+# tables waiting to be written to HDF5, by output directory. vaex writes
+# whole files, so every map type gets one HDF5 part file per process and
+# checkpoint, or whenever this number of rows is buffered
+hdf_buffers = {}
+hdf_part_rows = 1000000
+
+
+def to_table(df, schema=None):
+    # columns are stored as text, as in the csv files, so that every
+    # protein can be appended with the same schema
+    if schema is None:
+        schema = pa.schema([(str(c), pa.string()) for c in df.columns])
+    arrays = []
+    for name in schema.names:
+        if name in df.columns and isinstance(df[name].dtype, pd.CategoricalDtype):
+            # only the categories are converted to text
+            col = df[name]
+            codes = pa.array(col.cat.codes.values, mask=col.isna().values)
+            categories = pa.array(col.cat.categories.astype(str).values, type=pa.string())
+            arrays.append(pa.DictionaryArray.from_arrays(
+                codes, categories).dictionary_decode())
+            continue
+        if name in df.columns:
+            col = df[name]
+            values = np.where(col.isna(), None, col.astype(str))
+        else:
+            values = [None] * len(df)
+        arrays.append(pa.array(values, type=pa.string()))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def flush_parquet(out_parquet):
+    # write the buffered tables as one row group
+    tables = parquet_buffers.pop(out_parquet, [])
+    if tables:
+        parquet_writers[out_parquet].write_table(pa.concat_tables(tables))
+
+
+def close_writer(out_parquet):
+    # write the buffered tables and close the current part file
+    flush_parquet(out_parquet)
+    parquet_writers.pop(out_parquet).close()
+
+
+def next_part(out_dir, extension):
+    os.makedirs(out_dir, exist_ok=True)
+    return os.path.join(out_dir, 'part-{:05d}.{}'.format(
+        len(os.listdir(out_dir)), extension))
+
+
+def flush_hdf(out_hdf):
+    # write the buffered tables as a new HDF5 part file
+    tables = hdf_buffers.pop(out_hdf, [])
+    if tables:
+        vaex.from_arrow_table(pa.concat_tables(tables)).export_hdf5(
+            next_part(out_hdf, 'hdf5'))
+
+
+def close_parquet():
+    # write the buffered tables and close the parquet and HDF5 files
+    # opened by this process
+    for out_parquet in list(parquet_writers):
+        close_writer(out_parquet)
+    for out_hdf in list(hdf_buffers):
+        flush_hdf(out_hdf)
+
+
+def writefile(protid, out_dir, pident, isoform, consequence, df, maptype, csv= False, hdf = False, parquet = False, sink = None):
+    # parallel jobs send their results to the single writer process
+    if sink is not None:
+        sink.write(protid, maptype, df, csv, hdf, parquet)
+        return
+    if csv is True:
         out_csv = os.path.join(out_dir, 'csv')
         with open(os.path.join(out_csv,(maptype + '_pident' + str(pident) + '_isoform_' +
                 '_'.join(isoform) + '_consequence_' + '_'.join(consequence) + '.csv')), 'a') as f:
            df.to_csv(f, sep=',', index=False,
                                           header=f.tell() == 0)
-    if hdf is True: 
-        out_hdf = os.path.join(out_dir, 'hdf5', maptype)
-        if not os.path.exists(out_hdf):
-            os.mkdir(out_hdf)
-        import vaex
-        fn = os.path.join(out_hdf,( maptype + '_pident' + str(pident) + '_isoform_' +
-                '_'.join(isoform) + '_consequence_' + '_'.join(consequence) + '_' + protid + '.hdf5'))
-        vaex_df = vaex.from_pandas(df, copy_index=False)
-        vaex_df.export(fn)
\ No newline at end of file
+    if hdf is True:
+        # one dataset per map type, with the protein as a column, as the
+        # parquet output. vaex.open reads all its part files at once
+        if vaex is None:
+            raise IOError('vaex is needed to write HDF5 files.')
+        out_hdf = os.path.join(out_dir, 'hdf5', (maptype + '_pident' + str(pident) + '_isoform_' +
+                '_'.join(isoform) + '_consequence_' + '_'.join(consequence)))
+        if 'Protein_accession' not in df.columns:
+            df = df.assign(Protein_accession=protid)
+        tables = hdf_buffers.get(out_hdf)
+        if tables and set(tables[0].schema.names) != set(map(str, df.columns)):
+            # the tables of a part file have the same columns
+            flush_hdf(out_hdf)
+            tables = None
+        table = to_table(df, tables[0].schema if tables else None)
+        hdf_buffers.setdefault(out_hdf, []).append(table)
+        if sum(t.num_rows for t in hdf_buffers[out_hdf]) >= hdf_part_rows:
+            flush_hdf(out_hdf)
+    if parquet is True:
+        # one dataset per map type, with the protein as a column. Every
+        # run (or writer process) adds one compressed part file to it
+        out_parquet = os.path.join(out_dir, 'parquet', (maptype + '_pident' + str(pident) + '_isoform_' +
+                '_'.join(isoform) + '_consequence_' + '_'.join(consequence)))
+        if 'Protein_accession' not in df.columns:
+            df = df.assign(Protein_accession=protid)
+        if out_parquet in parquet_writers and set(
+                parquet_writers[out_parquet].schema.names) != set(map(str, df.columns)):
+            # columns that the current part file does not have (e.g.
+            # optional psdb columns) or lacks go to a new part file
+            close_writer(out_parquet)
+        if out_parquet not in parquet_writers:
+            table = to_table(df)
+            parquet_writers[out_parquet] = pq.ParquetWriter(
+                next_part(out_parquet, 'parquet'), table.schema, compression='zstd')
+        else:
+            table = to_table(df, parquet_writers[out_parquet].schema)
+        parquet_buffers.setdefault(out_parquet, []).append(table)
+        if sum(t.num_rows for t in parquet_buffers[out_parquet]) >= row_group_rows:
+            flush_parquet(out_parquet)
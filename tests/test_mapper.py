@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+
+from mapper.mapper import map_positions, variant_groups, variant_mask
+
+
+def test_variant_mask_splits_joined_ids():
+    annovars = pd.DataFrame({
+        'Uploaded_variation': ['1_10_A/G', '1_20_C/T', '1_30_G/A', '1_40_T/C'],
+        'Existing_variation': ['rs1&COSV9', 'rs2,rs1', '-', None]})
+    assert variant_mask(annovars, ['rs1']).tolist() == [True, True, False, False]
+    assert variant_mask(annovars, ['COSV9', '1_30_G/A']).tolist() == \
+        [True, False, True, False]
+
+
+def structure_rows(results):
+    if 'StructurePositions' not in results:
+        return []
+    return sorted(results['StructurePositions']['Uploaded_variation'])
+
+
+def test_structure_positions_do_not_depend_on_grouping():
+    # rs1 falls on the rest of a structure and has no other positions,
+    # rs2 falls outside of the structures and rs4 has positions on and
+    # outside of the structures
+    annovars = pd.DataFrame({
+        'Uploaded_variation': ['1_10_A/G', '1_50_C/T', '1_60_G/A',
+                               '1_10_A/C', '1_80_T/A'],
+        'Protein_position': ['10', '50', '60', '10', '80'],
+        'Amino_acids': ['A/V', 'R/W', 'G/S', 'A/L', 'F/Y'],
+        'Existing_variation': ['rs1', 'rs2', 'rs3&COSV3', 'rs4', 'rs4'],
+        'APPRIS_isoform': '',
+        'Protein_accession': 'ENSP00000000001'})
+    psdf = pd.DataFrame({
+        'Protein_accession': 'ENSP00000000001',
+        'Protein_position': [10, 60, 60],
+        'PDB_code': '2cad',
+        'Interaction_type': [None, None, 'protein'],
+        'Structure_feature_id': [None, None, '2cad_ENSP00000000001_A_B_protein'],
+        'Protein_alignment_start': 1,
+        'Protein_alignment_end': 40})
+    var_ids = ['rs1', 'rs2', 'COSV3', 'rs4']
+    grouped, _ = map_positions(annovars, psdf, True,
+                               variant_groups(annovars, var_ids))
+    single = []
+    for var_id in var_ids:
+        selected = annovars[variant_mask(annovars, [var_id])]
+        results, _ = map_positions(selected, psdf, True)
+        single += structure_rows(results)
+    assert structure_rows(grouped) == sorted(single) == ['1_10_A/C']
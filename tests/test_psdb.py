@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+
+from mapper.db_parser import read_file
+from makepsdb.txt2parquet import request
+
+# a split protein structures file whose PDB_code looks like a number
+psdb = '\n'.join([
+    '\t'.join(['Protein_accession', 'Protein_position', 'Protein_aa',
+               'PDB_code', 'PDB_chain', 'PDB_3D_position',
+               'PDB_seq_position', 'PDB_aa', 'Evalue',
+               'Structure_feature_id']),
+    '\t'.join(['ENSP00000000001', '49-52', 'W-E', '1e10', 'A', '52-55',
+               '1-4', 'T-I', '4.16e-01', '1e10_ENSP00000000001_A']),
+    '\t'.join(['ENSP00000000001', '61', 'M', '1e10', 'A', '64', '13', 'R',
+               '4.13e-01', '1e10_ENSP00000000001_A'])]) + '\n'
+
+
+def test_read_file_keeps_text_pdb_code(tmp_path):
+    f = tmp_path / 'ENSP00000000001.txt'
+    f.write_text(psdb)
+    df = read_file(str(f))
+    assert df['PDB_code'].tolist() == ['1e10', '1e10']
+
+
+def test_parquet_psdb_round_trip(tmp_path):
+    f = tmp_path / 'ENSP00000000001.txt'
+    f.write_text(psdb)
+    request(str(tmp_path), 'txt', str(tmp_path))
+    df = read_file(str(tmp_path / 'ENSP00000000001.parquet'))
+    assert df['PDB_code'].tolist() == ['1e10'] * 3
+    assert df['Protein_position'].tolist() == [49, 52, 61]
+    assert df['PDB_3D_position'].tolist() == [52, 55, 64]
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import os
+
+from makevariantsdb.create_var_index import index
+from mapper.varid_index import lookup_varids, index_name
+
+# variants.index of a database converted from a VCF file, where existing
+# ids are joined with '&' and missing ids are '.'
+variants_index = '\n'.join([
+    '#Uploaded_variation Gene Feature Existing_variation',
+    '1_10_A/G ENSG00000000001 ENST00000000001 rs1&COSV9',
+    '1_20_C/T ENSG00000000001 ENST00000000001 .',
+    '1_30_G/A ENSG00000000002 ENST00000000002 rs3,COSV8',
+    '1_40_T/C ENSG00000000002 ENST00000000002 .']) + '\n'
+
+
+def write_index(tmp_path):
+    (tmp_path / 'variants.index').write_text(variants_index)
+    return str(tmp_path)
+
+
+def test_text_index_splits_joined_ids(tmp_path):
+    vardb = write_index(tmp_path)
+    transcripts = lookup_varids(['rs1', 'COSV9', 'rs3'], vardb)
+    assert transcripts == {'rs1': ['ENST00000000001'],
+                           'COSV9': ['ENST00000000001'],
+                           'rs3': ['ENST00000000002']}
+
+
+def test_sorted_index_splits_joined_ids(tmp_path):
+    vardb = write_index(tmp_path)
+    index(os.path.join(vardb, 'variants.index'), vardb, vardb)
+    assert os.path.isfile(os.path.join(vardb, index_name))
+    transcripts = lookup_varids(['rs1', 'COSV9', 'COSV8'], vardb)
+    assert transcripts == {'rs1': ['ENST00000000001'],
+                           'COSV9': ['ENST00000000001'],
+                           'COSV8': ['ENST00000000002']}
+    # the VCF missing value is not indexed as an id
+    assert lookup_varids(['.'], vardb) == {}